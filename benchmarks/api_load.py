@@ -0,0 +1,89 @@
+"""
+Measure API endpoint latency percentiles under concurrent load.
+
+Runs against a live API (docker-compose up api, or uvicorn main:app in
+src/api) with a fixed number of concurrent clients per endpoint, and reports
+throughput plus p50/p90/p99/max latency and error counts.
+
+    python benchmarks/api_load.py --base-url http://localhost:8000 --concurrency 32 --requests 2000 \\
+        --output results/api.json
+"""
+import time
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from results import percentile, write_results
+
+DEFAULT_ENDPOINTS = [
+    '/api/vehicles?limit=1000',
+    '/api/alerts',
+    '/api/system/status',
+    '/api/elevators/outages',
+    '/api/stats/summary',
+]
+
+def timed_request(url, timeout):
+    """GET url and return (latency_seconds, ok)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+def load_endpoint(base_url, endpoint, total_requests, concurrency, timeout, warmup):
+    """Issue total_requests GETs with concurrency workers and summarize latencies"""
+    url = base_url.rstrip('/') + endpoint
+    for _ in range(warmup):
+        timed_request(url, timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda _: timed_request(url, timeout), range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = [latency * 1000 for latency, ok in outcomes if ok]
+    return {
+        'name': endpoint,
+        'requests': total_requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'requests_per_second': round(total_requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+        'p90_ms': round(percentile(latencies_ms, 90), 2) if latencies_ms else None,
+        'p99_ms': round(percentile(latencies_ms, 99), 2) if latencies_ms else None,
+        'max_ms': round(max(latencies_ms), 2) if latencies_ms else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000', help='API base URL')
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS), help='comma-separated paths to load')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per endpoint')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for endpoint in args.endpoints.split(','):
+        result = load_endpoint(args.base_url, endpoint, args.requests, args.concurrency, args.timeout, args.warmup)
+        results.append(result)
+        if result['p50_ms'] is None:
+            print(f"{endpoint:>32}: all {result['requests']} requests failed")
+            continue
+        print(
+            f"{endpoint:>32}: {result['requests_per_second']:>8.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+            f"p90 {result['p90_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, {result['errors']} errors"
+        )
+
+    if args.output:
+        write_results(args.output, 'api_load', vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files, e.g. from the base and head commits.
+
+Results are matched by name. Metrics ending in _per_second are better when
+higher; _seconds, _ms and _mb metrics are better when lower. Exits with
+status 1 if any metric regressed by more than --threshold.
+
+    python benchmarks/compare.py results/base.json results/head.json --threshold 0.1
+"""
+import sys
+import json
+import argparse
+
+HIGHER_IS_BETTER = ('_per_second',)
+LOWER_IS_BETTER = ('_seconds', '_ms', '_mb')
+
+def metric_direction(metric):
+    """1 if higher is better, -1 if lower is better, None if not compared"""
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return None
+
+def load_results(path):
+    """Load a result file as (document, {name: result})"""
+    with open(path) as source:
+        document = json.load(source)
+    return document, {result['name']: result for result in document['results']}
+
+def compare(base_results, head_results, threshold):
+    """Yield (name, metric, base, head, relative change, regressed) for shared metrics"""
+    for name, head in head_results.items():
+        base = base_results.get(name)
+        if base is None:
+            continue
+        for metric, head_value in head.items():
+            direction = metric_direction(metric)
+            base_value = base.get(metric)
+            if direction is None or not isinstance(head_value, (int, float)) or not isinstance(base_value, (int, float)):
+                continue
+            if base_value == 0:
+                continue
+            change = (head_value - base_value) / base_value
+            yield name, metric, base_value, head_value, change, change * direction < -threshold
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base', help='result file of the baseline run')
+    parser.add_argument('head', help='result file of the run to check')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    base_document, base_results = load_results(args.base)
+    head_document, head_results = load_results(args.head)
+    if base_document['benchmark'] != head_document['benchmark']:
+        parser.error(f"cannot compare {base_document['benchmark']} with {head_document['benchmark']}")
+
+    print(f"{base_document['benchmark']}: {base_document.get('git_revision')} -> {head_document.get('git_revision')}")
+    regressions = 0
+    for name, metric, base_value, head_value, change, regressed in compare(base_results, head_results, args.threshold):
+        regressions += regressed
+        marker = 'REGRESSION' if regressed else ''
+        print(f"{name:>42} {metric:<22} {base_value:>14,.3f} -> {head_value:>14,.3f} {change:>+8.1%} {marker}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Compare the Spark and lightweight processor engines.
+
+Each engine runs in its own subprocess over the same synthetic Kafka payloads
+and reports startup time (interpreter start until the engine can process a
+batch), transform throughput and peak resident memory, including the Spark JVM.
+Both engines do the same work per batch with their own batch functions: parse
+and coerce every topic, fill the key fallbacks, route rows to the sinks, add
+the GeoJSON locations, drop rows without a sink key and plan and shape the
+write. Only the Kafka and MongoDB I/O is left out, so rows_out is the number
+of documents each engine would write and should match between engines.
+
+    python benchmarks/processor_engines.py --messages 20000 --output results/engines.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+from datetime import datetime, timezone
+
+from results import write_results
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+PROCESSOR_DIR = os.path.join(SRC_DIR, 'processor')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, PROCESSOR_DIR)
+
+ROUTES = list("1234567ACEBDFMGJZLNQRW")
+
+def synthetic_value(name, field_type, rng, index):
+    """Generate a plausible value for one schema field"""
+    if field_type == 'string':
+        if name == 'route_id':
+            return rng.choice(ROUTES)
+        return f"{name}-{index % 5000}"
+    if field_type == 'int':
+        return rng.randint(0, 60)
+    if field_type == 'float':
+        if name == 'latitude':
+            return rng.uniform(40.5, 40.9)
+        if name == 'longitude':
+            return rng.uniform(-74.1, -73.7)
+        return rng.uniform(0, 359)
+    if field_type == 'bool':
+        return rng.random() < 0.8
+    if field_type == 'timestamp':
+        return int(time.time()) - rng.randint(0, 3600)
+    if field_type == 'string_array':
+        return rng.sample(ROUTES, rng.randint(1, 3))
+    return None
+
+def synthetic_messages(total_messages, seed=42):
+    """Build raw JSON payloads grouped by topic, weighted toward vehicle positions"""
+    from pipeline import TOPIC_SINKS, KAFKA_TOPIC_VEHICLES
+
+    rng = random.Random(seed)
+    topics = list(TOPIC_SINKS.keys())
+    weights = [8 if topic == KAFKA_TOPIC_VEHICLES else 1 for topic in topics]
+    messages_by_topic = {topic: [] for topic in topics}
+    for index in range(total_messages):
+        topic = rng.choices(topics, weights)[0]
+        fields, _ = TOPIC_SINKS[topic]
+        payload = {name: synthetic_value(name, field_type, rng, index) for name, field_type in fields}
+        messages_by_topic[topic].append(json.dumps(payload))
+    return messages_by_topic
+
+def peak_rss_mb(extra_pids=()):
+    """Peak resident memory of this process plus any helper processes, in MB"""
+    total_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for pid in extra_pids:
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return round(total_kb / 1024, 1)
+
+def run_lite(messages_by_topic, interpreter_started):
+    """Benchmark the lite engine's batch path up to the bulk writes"""
+    import lite
+    startup_seconds = time.time() - interpreter_started
+
+    started = time.perf_counter()
+    row_count = 0
+    for collection_name, docs in lite.transform(messages_by_topic).items():
+        # The same operations and batches write_collection() sends to MongoDB
+        operations = lite.build_operations(collection_name, docs)
+        _, batch_size = lite.plan_write(len(operations))
+        batches = [operations[offset:offset + batch_size] for offset in range(0, len(operations), batch_size)]
+        row_count += sum(len(batch) for batch in batches)
+    transform_seconds = time.perf_counter() - started
+
+    return startup_seconds, transform_seconds, row_count, peak_rss_mb()
+
+def run_spark(messages_by_topic, interpreter_started):
+    """Benchmark the Spark engine's batch path up to the connector writes on a local session"""
+    from pyspark.sql import SparkSession
+    from pyspark.sql.functions import col
+
+    # A local session without the connectors; importing main.py creates none,
+    # and get_spark() is never called here
+    spark = SparkSession.builder \
+        .master("local[*]") \
+        .appName("MTA Processor Benchmark") \
+        .config("spark.ui.enabled", "false") \
+        .getOrCreate()
+    spark.sparkContext.setLogLevel("ERROR")
+    import main
+    startup_seconds = time.time() - interpreter_started
+
+    processed_at = datetime.now(timezone.utc)
+    rows = [
+        (topic, raw_value, processed_at)
+        for topic, raw_values in messages_by_topic.items()
+        for raw_value in raw_values
+    ]
+
+    started = time.perf_counter()
+    batch_df = spark.createDataFrame(rows, ["topic", "json_data", "processed_at"]).persist()
+    row_count = 0
+    for topic, (fields, sinks) in main.TOPIC_SINKS.items():
+        # The same steps as process_batch() and write_to_mongodb(), without writer.save()
+        parsed_df = main.with_key_fallbacks(main.parse_topic(batch_df, topic), fields).persist()
+        for collection_name, row_filter in sinks:
+            sink_df = parsed_df if row_filter is None else parsed_df.filter(col(row_filter) == True)
+            if collection_name in main.GEO_SINKS:
+                sink_df = main.with_geojson_point(sink_df, main.GEO_SINKS[collection_name])
+            key_fields = main.SINK_KEYS.get(collection_name)
+            if key_fields:
+                sink_df = sink_df.dropna(subset=key_fields)
+            sink_df.persist()
+            sink_rows = sink_df.count()
+            if sink_rows:
+                partitions, _ = main.plan_write(sink_rows)
+                current_partitions = sink_df.rdd.getNumPartitions()
+                if partitions < current_partitions:
+                    write_df = sink_df.coalesce(partitions)
+                elif partitions > current_partitions:
+                    write_df = sink_df.repartition(partitions)
+                else:
+                    write_df = sink_df
+                # Materialise the documents the connector would serialise
+                write_df.toJSON().foreach(lambda _: None)
+            sink_df.unpersist()
+            row_count += sink_rows
+        parsed_df.unpersist()
+    batch_df.unpersist()
+    transform_seconds = time.perf_counter() - started
+
+    jvm_pid = spark.sparkContext._gateway.proc.pid
+    memory_mb = peak_rss_mb([jvm_pid])
+    spark.stop()
+    return startup_seconds, transform_seconds, row_count, memory_mb
+
+def run_child(engine, total_messages, interpreter_started):
+    """Run one engine and print its results as JSON"""
+    generation_started = time.time()
+    messages_by_topic = synthetic_messages(total_messages)
+    # Payload generation is not part of the engine's startup cost
+    interpreter_started += time.time() - generation_started
+
+    runner = run_lite if engine == 'lite' else run_spark
+    startup_seconds, transform_seconds, rows_out, memory_mb = runner(messages_by_topic, interpreter_started)
+    print(json.dumps({
+        'name': engine,
+        'engine': engine,
+        'messages': total_messages,
+        'rows_out': rows_out,
+        'startup_seconds': round(startup_seconds, 3),
+        'transform_seconds': round(transform_seconds, 3),
+        'messages_per_second': round(total_messages / transform_seconds, 1) if transform_seconds else None,
+        'peak_rss_mb': memory_mb
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000, help='synthetic Kafka messages per run')
+    parser.add_argument('--engines', default='lite,spark', help='comma-separated engines to compare')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--started', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.messages, args.started)
+        return
+
+    results = []
+    for engine in args.engines.split(','):
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            '--child', engine, '--messages', str(args.messages), '--started', str(time.time())
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{engine}: failed\n{completed.stderr.strip()}", file=sys.stderr)
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"{engine:>6}: startup {result['startup_seconds']:.2f}s, "
+            f"{result['messages_per_second']:.0f} msg/s, peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+
+    if args.output:
+        write_results(args.output, 'processor_engines', {'messages': args.messages, 'engines': args.engines}, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark the producer's hot paths on synthetic city-scale feeds.
+
+- gtfs_fetch_parse: fetch_gtfs_feed against a local HTTP server serving a
+  synthetic GTFS-RT feed (HTTP, protobuf decode and the per-entity loop)
+- process_alerts / process_elevator_outages: JSON feed processing
+- alert_processor_unchanged: incremental alert processing of a feed in which
+  no alert changed
+- compute_headways: headway and bunching statistics over the predicted
+  arrivals of the parsed feed, repeated across --feeds feeds
+- write_to_mongodb: bulk upserts of the parsed vehicles into a local mongod,
+  only with --mongo-uri (uses a throwaway database that is dropped afterwards)
+
+    python benchmarks/producer_pipeline.py --trips 2000 --stop-updates 30 --output results/producer.json
+    python benchmarks/producer_pipeline.py --mongo-uri mongodb://localhost:27017/ --output results/producer.json
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import synthetic
+from results import write_results
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+PRODUCER_DIR = os.path.join(SRC_DIR, 'producer')
+BENCHMARK_DATABASE = 'mta_benchmark'
+
+def timed_runs(function, repeat, warmup=1):
+    """Run function warmup + repeat times and return the measured durations in seconds"""
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def summarize(name, durations, items, **extra):
+    """Result entry with the median duration and items processed per second"""
+    median_seconds = statistics.median(durations)
+    return {
+        'name': name,
+        'items': items,
+        'runs': len(durations),
+        'median_seconds': round(median_seconds, 6),
+        'min_seconds': round(min(durations), 6),
+        'items_per_second': round(items / median_seconds, 1) if median_seconds else None,
+        **extra
+    }
+
+def serve_bytes(payload):
+    """Serve payload on an ephemeral local port; returns (server, url)"""
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/gtfs"
+
+def bench_gtfs(producer, args):
+    """fetch_gtfs_feed throughput over local HTTP"""
+    payload = synthetic.gtfs_feed(
+        trips=args.trips, vehicles=args.vehicles, stop_updates=args.stop_updates,
+        position_ratio=args.position_ratio
+    )
+    server, url = serve_bytes(payload)
+    try:
+        entity_list, vehicle_positions = producer.fetch_gtfs_feed(url, 'benchmark')
+        if not entity_list:
+            raise RuntimeError("fetch_gtfs_feed returned no entities for the synthetic feed")
+        durations = timed_runs(lambda: producer.fetch_gtfs_feed(url, 'benchmark'), args.repeat)
+    finally:
+        server.shutdown()
+
+    result = summarize(
+        'gtfs_fetch_parse', durations, len(entity_list) + len(vehicle_positions),
+        feed_bytes=len(payload),
+        stop_time_updates=len(entity_list) * args.stop_updates
+    )
+    result['megabytes_per_second'] = round(len(payload) / result['median_seconds'] / 1e6, 2)
+    return result, entity_list, vehicle_positions
+
+def bench_alerts(producer, args):
+    """process_alerts throughput"""
+    feed = synthetic.alerts_feed(alerts=args.alerts)
+    processed = producer.process_alerts(feed)
+    durations = timed_runs(lambda: producer.process_alerts(feed), args.repeat)
+    return summarize('process_alerts', durations, len(processed))
+
+def bench_alert_processor(producer, args):
+    """AlertProcessor throughput on an unchanged feed, the steady state between alert changes"""
+    feed = synthetic.alerts_feed(alerts=args.alerts)
+    processor = producer.AlertProcessor()
+    processor.process(feed)
+    durations = timed_runs(lambda: processor.process(feed), args.repeat)
+    return summarize('alert_processor_unchanged', durations, len(processor.alerts))
+
+def bench_outages(producer, args):
+    """process_elevator_outages throughput"""
+    feed = synthetic.elevator_outages_feed(outages=args.outages)
+    processed = producer.process_elevator_outages(feed)
+    durations = timed_runs(lambda: producer.process_elevator_outages(feed), args.repeat)
+    return summarize('process_elevator_outages', durations, len(processed))
+
+def bench_headways(producer, entity_list, args):
+    """headway_documents throughput over every arrival of --feeds copies of the feed"""
+    arrivals_index = producer.ArrivalsIndex()
+    for feed in range(args.feeds):
+        arrivals_index.update_feed(f"benchmark-{feed}", entity_list)
+    now = entity_list[0]['timestamp']
+    arrivals = sum(len(stop_times) for trips in arrivals_index.feed_trips.values() for _, stop_times in trips.values())
+    durations = timed_runs(lambda: producer.headway_documents(arrivals_index.feed_trips, now), args.repeat)
+    return summarize('compute_headways', durations, arrivals, feeds=args.feeds)
+
+def bench_mongo(producer, vehicle_positions, args):
+    """write_to_mongodb bulk throughput for a history and a latest-state collection"""
+    mongo_db = producer.get_mongo_db()
+    mongo_db.command('ping')
+    producer.ensure_indexes()
+    results = []
+    try:
+        for collection_name in ('vehicle_positions', 'latest_vehicle_positions'):
+            # Each run writes a new cycle: fresh timestamps insert into the
+            # history collection and update the latest-state collection
+            cycle = [0]
+            def write_cycle():
+                cycle[0] += 1
+                docs = [dict(doc, timestamp=doc['timestamp'] + cycle[0]) for doc in vehicle_positions]
+                producer.write_to_mongodb(collection_name, docs)
+
+            durations = timed_runs(write_cycle, args.repeat)
+            if mongo_db[collection_name].estimated_document_count() == 0:
+                raise RuntimeError(f"No documents reached {collection_name}; check the producer log")
+            results.append(summarize(f"write_to_mongodb:{collection_name}", durations, len(vehicle_positions)))
+    finally:
+        if not args.keep_data:
+            mongo_db.client.drop_database(BENCHMARK_DATABASE)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trips', type=int, default=1000, help='trip_update entities in the GTFS-RT feed')
+    parser.add_argument('--vehicles', type=int, help='vehicle entities (default: one per trip)')
+    parser.add_argument('--stop-updates', type=int, default=20, help='stop_time_updates per trip')
+    parser.add_argument('--position-ratio', type=float, default=0.0, help='share of vehicles reporting a position')
+    parser.add_argument('--feeds', type=int, default=8, help='feeds of the parsed trips in the headway benchmark')
+    parser.add_argument('--alerts', type=int, default=300, help='alerts in the alerts feed')
+    parser.add_argument('--outages', type=int, default=200, help='outages in the elevator feed')
+    parser.add_argument('--repeat', type=int, default=10, help='measured runs per benchmark')
+    parser.add_argument('--mongo-uri', help='benchmark write_to_mongodb against this mongod')
+    parser.add_argument('--keep-data', action='store_true', help=f"keep the {BENCHMARK_DATABASE} database")
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    # The producer reads its configuration at import time
+    os.environ['MONGODB_URI'] = args.mongo_uri or 'mongodb://127.0.0.1:27017/'
+    os.environ['MONGODB_DATABASE'] = BENCHMARK_DATABASE
+    os.environ.setdefault('KAFKA_BOOTSTRAP_SERVERS', '127.0.0.1:9092')
+    sys.path.insert(0, SRC_DIR)
+    sys.path.insert(0, PRODUCER_DIR)
+    import main as producer
+    logging.getLogger('main').setLevel(logging.WARNING)
+
+    results = []
+    gtfs_result, entity_list, vehicle_positions = bench_gtfs(producer, args)
+    results.append(gtfs_result)
+    results.append(bench_headways(producer, entity_list, args))
+    results.append(bench_alerts(producer, args))
+    results.append(bench_alert_processor(producer, args))
+    results.append(bench_outages(producer, args))
+    if args.mongo_uri:
+        results.extend(bench_mongo(producer, vehicle_positions, args))
+
+    for result in results:
+        print(
+            f"{result['name']:>42}: {result['items_per_second']:>12,.0f} items/s "
+            f"(median {result['median_seconds'] * 1000:.1f} ms for {result['items']} items)"
+        )
+
+    if args.output:
+        write_results(args.output, 'producer_pipeline', vars(args), results)
+
+if __name__ == "__main__":
+    main()
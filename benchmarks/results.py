@@ -0,0 +1,50 @@
+"""
+Machine-readable benchmark results.
+
+Every benchmark writes one JSON document with the commit it ran on, so runs on
+different commits can be diffed with compare.py.
+"""
+import os
+import json
+import socket
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def git_revision():
+    """Current commit sha, with a -dirty suffix for uncommitted changes, or None"""
+    try:
+        sha = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{sha}-dirty" if dirty else sha
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def write_results(path, benchmark, parameters, results):
+    """Write results, keyed by each entry's 'name', with run metadata"""
+    document = {
+        'benchmark': benchmark,
+        'git_revision': git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'host': socket.gethostname(),
+        'python': platform.python_version(),
+        'parameters': parameters,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
@@ -0,0 +1,140 @@
+"""
+Synthetic MTA feeds for benchmarks.
+
+Builds GTFS Realtime protobuf feeds shaped like the NYCT subway feeds
+(trip updates with stop time updates, plus vehicle entities) and the JSON
+alert and elevator/escalator feeds, at any scale and deterministically for a
+given seed.
+"""
+import time
+import random
+
+ROUTES = list("1234567ACEBDFMGJZLNQRW")
+BOROUGHS = ['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island']
+ALERT_EFFECTS = ['SIGNIFICANT_DELAYS', 'REDUCED_SERVICE', 'DETOUR', 'MODIFIED_SERVICE', 'NO_SERVICE']
+ALERT_CAUSES = ['TECHNICAL_PROBLEM', 'MAINTENANCE', 'CONSTRUCTION', 'POLICE_ACTIVITY', 'MEDICAL_EMERGENCY']
+
+def gtfs_feed(trips=500, vehicles=None, stop_updates=20, position_ratio=0.0, seed=42, timestamp=None):
+    """
+    Build a serialized GTFS-RT FeedMessage.
+
+    trips: trip_update entities; vehicles: vehicle entities (default one per
+    trip); stop_updates: stop_time_updates per trip; position_ratio: share of
+    vehicles reporting a position (the NYCT feeds report none).
+    """
+    from google.transit import gtfs_realtime_pb2
+
+    rng = random.Random(seed)
+    timestamp = timestamp or int(time.time())
+    vehicles = trips if vehicles is None else vehicles
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '1.0'
+    feed.header.timestamp = timestamp
+
+    for index in range(max(trips, vehicles)):
+        route_id = rng.choice(ROUTES)
+        direction = rng.choice('NS')
+        start_minutes = rng.randint(0, 24 * 60 - 1)
+        trip_id = f"{start_minutes * 100:06d}_{route_id}..{direction}{rng.randint(1, 99):02d}R"
+        first_stop = rng.randint(100, 900)
+
+        if index < trips:
+            entity = feed.entity.add()
+            entity.id = f"{index:06d}"
+            trip_update = entity.trip_update
+            trip_update.trip.trip_id = trip_id
+            trip_update.trip.route_id = route_id
+            trip_update.trip.start_date = time.strftime('%Y%m%d', time.gmtime(timestamp))
+            trip_update.trip.start_time = f"{start_minutes // 60:02d}:{start_minutes % 60:02d}:00"
+            trip_update.vehicle.id = f"{route_id}-{index:06d}"
+            for stop_index in range(stop_updates):
+                stop_time_update = trip_update.stop_time_update.add()
+                stop_time_update.stop_id = f"{first_stop + stop_index}{direction}"
+                stop_time_update.arrival.time = timestamp + 90 * stop_index
+                stop_time_update.departure.time = timestamp + 90 * stop_index + 30
+
+        if index < vehicles:
+            entity = feed.entity.add()
+            entity.id = f"{index:06d}v"
+            vehicle = entity.vehicle
+            vehicle.trip.trip_id = trip_id
+            vehicle.trip.route_id = route_id
+            vehicle.trip.start_date = time.strftime('%Y%m%d', time.gmtime(timestamp))
+            vehicle.vehicle.id = f"{route_id}-{index:06d}"
+            vehicle.current_stop_sequence = rng.randint(0, stop_updates)
+            vehicle.stop_id = f"{first_stop}{direction}"
+            vehicle.current_status = rng.randint(0, 2)
+            vehicle.timestamp = timestamp - rng.randint(0, 60)
+            if rng.random() < position_ratio:
+                vehicle.position.latitude = rng.uniform(40.5, 40.9)
+                vehicle.position.longitude = rng.uniform(-74.1, -73.7)
+                vehicle.position.bearing = rng.uniform(0, 359)
+
+    return feed.SerializeToString()
+
+def translated(text):
+    """GTFS-RT JSON translated string with plain and HTML variants"""
+    return {'translation': [
+        {'text': text, 'language': 'en'},
+        {'text': f"<p>{text}</p>", 'language': 'en-html'},
+    ]}
+
+def alerts_feed(alerts=300, routes_per_alert=3, seed=42, timestamp=None):
+    """Build a service alerts JSON feed in the camsys all-alerts format"""
+    rng = random.Random(seed)
+    timestamp = timestamp or int(time.time())
+    entities = []
+    for index in range(alerts):
+        routes = rng.sample(ROUTES, rng.randint(1, routes_per_alert))
+        effect = rng.choice(ALERT_EFFECTS)
+        entities.append({
+            'id': f"lmm:planned_work:{index}",
+            'alert': {
+                'active_period': [{'start': timestamp - 3600, 'end': timestamp + rng.randint(3600, 86400)}],
+                'informed_entity': [{'agency_id': 'MTASBWY', 'route_id': route} for route in routes],
+                'cause': rng.choice(ALERT_CAUSES),
+                'effect': effect,
+                'header_text': translated(f"{effect.replace('_', ' ').title()} on {', '.join(routes)} trains"),
+                'description_text': translated(
+                    f"Trains run with delays while crews address an issue near station {rng.randint(100, 900)}. "
+                    "Allow additional travel time."
+                ),
+            }
+        })
+    return {'header': {'gtfs_realtime_version': '1.0', 'timestamp': timestamp}, 'entity': entities}
+
+def elevator_station(rng, index):
+    """Station block shared by the outage and equipment feeds"""
+    return {'name': f"Station {index % 470}", 'borough': rng.choice(BOROUGHS)}
+
+def elevator_outages_feed(outages=200, seed=42):
+    """Build a current elevator/escalator outages JSON feed"""
+    rng = random.Random(seed)
+    return {'nyct_ene': {'outages': [
+        {
+            'equipment_id': f"{rng.choice('EL')}{index:04d}",
+            'station': elevator_station(rng, index),
+            'equipment_type': rng.choice(['EL', 'ES']),
+            'serving': f"Street to mezzanine for service in both directions ({index})",
+            'outage_start_date_time': '2025-05-10T08:00:00',
+            'estimated_return_date_time': '2025-05-12T17:00:00',
+            'reason': {'reason_name': rng.choice(['Repair', 'Capital Replacement', 'Preventive Maintenance'])},
+            'latest_status': {'status_name': 'Under repair'},
+        }
+        for index in range(outages)
+    ]}}
+
+def elevator_equipment_feed(equipment=2000, seed=42):
+    """Build an elevator/escalator equipment JSON feed"""
+    rng = random.Random(seed)
+    return {'nyct_ene_equipments': {'equipments': [
+        {
+            'equipment_id': f"{rng.choice('EL')}{index:04d}",
+            'station': elevator_station(rng, index),
+            'equipment_type': rng.choice(['EL', 'ES']),
+            'serving': f"Street to mezzanine ({index})",
+            'ada': rng.random() < 0.6,
+        }
+        for index in range(equipment)
+    ]}}
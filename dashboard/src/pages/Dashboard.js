@@ -31,7 +31,7 @@ import {
   Legend,
 } from 'chart.js';
 
-import { fetchSummaryStats, fetchRouteStats, fetchAlerts, fetchElevatorOutages, formatDate } from '../utils/api';
+import { fetchDashboardBundle, subscribeToChanges, formatDate } from '../utils/api';
 import AppleCard from '../components/AppleCard';
 
 // Register Chart.js components
@@ -94,7 +94,6 @@ const Dashboard = () => {
   const [stats, setStats] = useState(null);
   const [routeStats, setRouteStats] = useState([]);
   const [alerts, setAlerts] = useState([]);
-  const [elevatorOutages, setElevatorOutages] = useState([]);
 
   useEffect(() => {
     const fetchData = async () => {
@@ -103,33 +102,17 @@ const Dashboard = () => {
         setLoading(true);
         setError(null);
         
-        // Fetch all required data in parallel
-        const [summaryStats, routeStatsData, alertsData, elevatorData] = await Promise.all([
-          fetchSummaryStats(),
-          fetchRouteStats().catch(err => {
-            console.error('Error fetching route stats:', err);
-            return [];
-          }),
-          fetchAlerts().catch(err => {
-            console.error('Error fetching alerts:', err);
-            return [];
-          }),
-          fetchElevatorOutages().catch(err => {
-            console.error('Error fetching elevator outages:', err);
-            return [];
-          })
-        ]);
+        // Fetch every widget's data from one snapshot in a single request
+        const bundle = await fetchDashboardBundle(['summary', 'alerts', 'route_stats']);
         
-        console.log('Dashboard: All data fetched successfully');
-        console.log('Summary Stats:', summaryStats);
-        console.log('Route Stats:', routeStatsData);
-        console.log('Alerts:', alertsData);
-        console.log('Elevator Outages:', elevatorData);
+        console.log('Dashboard: All data fetched successfully, generation', bundle.generation);
+        console.log('Summary Stats:', bundle.summary);
+        console.log('Route Stats:', bundle.routeStats);
+        console.log('Alerts:', bundle.alerts);
         
-        setStats(summaryStats);
-        setRouteStats(Array.isArray(routeStatsData) ? routeStatsData : []);
-        setAlerts(Array.isArray(alertsData) ? alertsData : []);
-        setElevatorOutages(Array.isArray(elevatorData) ? elevatorData : []);
+        setStats(bundle.summary);
+        setRouteStats(bundle.routeStats);
+        setAlerts(bundle.alerts);
       } catch (error) {
         console.error('Dashboard: Error fetching dashboard data:', error);
         setError('Failed to load dashboard data. Please try again later.');
@@ -151,13 +134,28 @@ const Dashboard = () => {
 
     fetchData();
 
-    // Set up refresh interval
-    const intervalId = setInterval(() => {
-      console.log('Dashboard: Refreshing data...');
-      fetchData();
-    }, 60000); // Refresh every minute
+    // Refresh whenever the API reports new vehicle positions or alerts, and
+    // poll every minute only while the change stream is unavailable
+    let intervalId = null;
+    const closeStream = subscribeToChanges(
+      ['latest_vehicle_positions', 'current_alerts', 'elevator_outages'],
+      () => {
+        console.log('Dashboard: Data changed, refreshing...');
+        fetchData();
+      },
+      connected => {
+        clearInterval(intervalId);
+        intervalId = connected ? null : setInterval(() => {
+          console.log('Dashboard: Refreshing data...');
+          fetchData();
+        }, 60000);
+      }
+    );
 
-    return () => clearInterval(intervalId);
+    return () => {
+      closeStream();
+      clearInterval(intervalId);
+    };
   }, []);
 
   const getChartData = () => {
@@ -13,12 +13,12 @@ import {
   ToggleButton,
   ToggleButtonGroup
 } from '@mui/material';
-import { MapContainer, TileLayer, Marker, Popup, useMap } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Popup, useMap, useMapEvents } from 'react-leaflet';
 import L from 'leaflet';
 import 'leaflet/dist/leaflet.css';
 import moment from 'moment';
 
-import { fetchVehicles, formatDate } from '../utils/api';
+import { fetchVehicles, fetchVehicleTile, subscribeToChanges, formatDate } from '../utils/api';
 
 // Route color mapping
 const routeColors = {
@@ -112,28 +112,101 @@ const getVehicleIcon = (route) => {
   }
 };
 
-// Map centering component
-const MapUpdater = ({ vehicles }) => {
+// Below this zoom level the map shows server-side clusters instead of individual vehicles
+const CLUSTER_MAX_ZOOM = 14;
+
+// Format map bounds as the API's bbox parameter (min_lon,min_lat,max_lon,max_lat)
+const boundsToBbox = (bounds) => {
+  const clamp = (value, limit) => Math.max(-limit, Math.min(limit, value));
+  return [
+    clamp(bounds.getWest(), 180),
+    clamp(bounds.getSouth(), 90),
+    clamp(bounds.getEast(), 180),
+    clamp(bounds.getNorth(), 90)
+  ].map(value => value.toFixed(5)).join(',');
+};
+
+// List the slippy-map tiles ({z, x, y}) covering the bounds at a zoom level
+const boundsToTiles = (bounds, zoom) => {
+  const count = 2 ** zoom;
+  const clampTile = (value) => Math.max(0, Math.min(count - 1, Math.floor(value)));
+  const tileX = (lng) => clampTile((lng + 180) / 360 * count);
+  const tileY = (lat) => {
+    const radians = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+    return clampTile((1 - Math.log(Math.tan(radians) + 1 / Math.cos(radians)) / Math.PI) / 2 * count);
+  };
+  
+  const tiles = [];
+  for (let x = tileX(bounds.getWest()); x <= tileX(bounds.getEast()); x++) {
+    for (let y = tileY(bounds.getNorth()); y <= tileY(bounds.getSouth()); y++) {
+      tiles.push({ z: zoom, x, y });
+    }
+  }
+  return tiles;
+};
+
+// Report the visible map area so only on-screen vehicles are fetched
+const ViewportWatcher = ({ onViewportChange }) => {
   const map = useMap();
   
+  const reportViewport = () => {
+    const bounds = map.getBounds();
+    const zoom = map.getZoom();
+    const bbox = boundsToBbox(bounds);
+    onViewportChange(previous => (
+      previous && previous.bbox === bbox && previous.zoom === zoom
+        ? previous
+        : { bbox, zoom, tiles: boundsToTiles(bounds, zoom) }
+    ));
+  };
+  
+  useMapEvents({
+    moveend: reportViewport
+  });
+  
   useEffect(() => {
-    if (vehicles && vehicles.length > 0) {
-      // Create bounds based on all vehicle positions
-      const bounds = L.latLngBounds(
-        vehicles
-          .filter(v => v.position && v.position.latitude && v.position.longitude)
-          .map(v => [v.position.latitude, v.position.longitude])
-      );
-      
-      if (bounds.isValid()) {
-        map.fitBounds(bounds, { padding: [50, 50] });
-      }
-    }
-  }, [vehicles, map]);
+    reportViewport();
+  }, [map]);
   
   return null;
 };
 
+// Create a marker icon for a cluster of vehicles, sized by its vehicle count
+const getClusterIcon = (count) => {
+  const size = Math.round(28 + 8 * Math.log10(count));
+  
+  return L.divIcon({
+    className: 'custom-cluster-icon',
+    html: `<div style="background-color: rgba(0, 57, 166, 0.85); color: white; width: ${size}px; height: ${size}px; border-radius: 50%; border: 2px solid white; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 12px;">${count}</div>`,
+    iconSize: [size, size],
+    iconAnchor: [size / 2, size / 2]
+  });
+};
+
+// Cluster marker that zooms in on its vehicles when clicked
+const ClusterMarker = ({ cluster }) => {
+  const map = useMap();
+  
+  return (
+    <Marker
+      position={[cluster.latitude, cluster.longitude]}
+      icon={getClusterIcon(cluster.count)}
+      eventHandlers={{
+        click: () => map.setView([cluster.latitude, cluster.longitude], Math.min(map.getZoom() + 2, CLUSTER_MAX_ZOOM))
+      }}
+    >
+      <Popup>
+        <Typography variant="body2">
+          <strong>{cluster.count} vehicles</strong>
+        </Typography>
+        <Typography variant="body2">
+          <strong>Routes:</strong> {cluster.routes.join(', ')}
+        </Typography>
+      </Popup>
+    </Marker>
+  );
+};
+
 const Vehicles = () => {
   const [loading, setLoading] = useState(true);
   const [vehicles, setVehicles] = useState([]);
@@ -142,8 +215,13 @@ const Vehicles = () => {
   const [lineFilter, setLineFilter] = useState('');
   const [routeFilter, setRouteFilter] = useState('');
   const [availableRoutes, setAvailableRoutes] = useState([]);
+  const [viewport, setViewport] = useState(null);
+  const [clusters, setClusters] = useState([]);
   const mapRef = useRef(null);
   const intervalRef = useRef(null);
+  const fetchRef = useRef(null);
+  // Whether the API's change stream is connected; polling stops while it is
+  const [live, setLive] = useState(false);
   
   // Define subway lines with their respective routes
   const subwayLines = [
@@ -193,6 +271,28 @@ const Vehicles = () => {
         requestParams.route_id = routeParams;
       }
       
+      // On the map, only request vehicles inside the visible area
+      if (view === 'map') {
+        if (!viewport) return;
+        
+        // Zoomed out, request pre-clustered tiles instead of every vehicle
+        if (viewport.zoom < CLUSTER_MAX_ZOOM) {
+          const tiles = await Promise.all(
+            viewport.tiles.map(tile => fetchVehicleTile(tile.z, tile.x, tile.y, requestParams))
+          );
+          setClusters(tiles.flatMap(tile => tile.clusters));
+          setVehicles([]);
+          setFilteredVehicles([]);
+          return;
+        }
+        
+        setClusters([]);
+        requestParams.bbox = viewport.bbox;
+        requestParams.limit = 1000;
+      } else {
+        setClusters([]);
+      }
+      
       // Fetch data from API with the appropriate parameters
       const data = await fetchVehicles(requestParams);
       console.log('Received vehicle data:', data.length, 'vehicles');
@@ -231,19 +331,30 @@ const Vehicles = () => {
     }
   };
   
+  // Refetch with the current filters whenever the API reports new vehicle positions
+  fetchRef.current = fetchVehicleData;
+  useEffect(() => subscribeToChanges(
+    ['latest_vehicle_positions'],
+    () => fetchRef.current(),
+    setLive
+  ), []);
+  
   // Initial data fetch
   useEffect(() => {
     fetchVehicleData();
     
-    // Set up polling for real-time updates
-    intervalRef.current = setInterval(fetchVehicleData, 15000); // Refresh every 15 seconds
+    // Poll for real-time updates while the change stream is unavailable
+    if (!live) {
+      intervalRef.current = setInterval(fetchVehicleData, 15000); // Refresh every 15 seconds
+    }
     
     return () => {
       if (intervalRef.current) {
         clearInterval(intervalRef.current);
+        intervalRef.current = null;
       }
     };
-  }, [lineFilter, routeFilter]);
+  }, [lineFilter, routeFilter, view, viewport, live]);
   
   // Handle line filter change
   const handleLineChange = (event) => {
@@ -326,7 +437,7 @@ const Vehicles = () => {
         </Grid>
       </Paper>
       
-      {loading && vehicles.length === 0 ? (
+      {loading && vehicles.length === 0 && !(view === 'map' && viewport) ? (
         <Box display="flex" justifyContent="center" alignItems="center" height="60vh">
           <CircularProgress />
         </Box>
@@ -334,7 +445,7 @@ const Vehicles = () => {
         <>
           <Box mb={2}>
             <Typography variant="body1">
-              Showing {filteredVehicles.length} vehicles
+              Showing {filteredVehicles.length + clusters.reduce((total, cluster) => total + cluster.count, 0)} vehicles
               {lineFilter && ` for line ${lineFilter}`}
               {routeFilter && ` and route ${routeFilter}`}
             </Typography>
@@ -386,7 +497,7 @@ const Vehicles = () => {
                               vehicle.current_status === 0 ? 'Incoming at' :
                               vehicle.current_status === 1 ? 'Stopped at' :
                               vehicle.current_status === 2 ? 'In transit to' : 'Unknown'
-                            } {vehicle.stop_id}
+                            } {vehicle.stop_name || vehicle.stop_id}
                           </Typography>
                           <Typography variant="body2">
                             <strong>Updated:</strong> {formatDate(vehicle.timestamp)}
@@ -396,7 +507,19 @@ const Vehicles = () => {
                     </Marker>
                   ))}
                 
-                <MapUpdater vehicles={filteredVehicles} />
+                {clusters.map((cluster) => (
+                  cluster.count > 1 ? (
+                    <ClusterMarker key={`${cluster.latitude},${cluster.longitude}`} cluster={cluster} />
+                  ) : (
+                    <Marker
+                      key={cluster.id}
+                      position={[cluster.latitude, cluster.longitude]}
+                      icon={getVehicleIcon(cluster.route_id)}
+                    />
+                  )
+                ))}
+                
+                <ViewportWatcher onViewportChange={setViewport} />
               </MapContainer>
             </Paper>
           ) : (
@@ -434,7 +557,7 @@ const Vehicles = () => {
                           vehicle.current_status === 0 ? 'Incoming at' :
                           vehicle.current_status === 1 ? 'Stopped at' :
                           vehicle.current_status === 2 ? 'In transit to' : 'Unknown'
-                        } {vehicle.stop_id}
+                        } {vehicle.stop_name || vehicle.stop_id}
                       </Typography>
                     </Paper>
                   </Grid>
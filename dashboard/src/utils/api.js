@@ -144,6 +144,103 @@ const getRouteColor = (route) => {
   return '#000000';
 };
 
+// Summary stats with defaults for missing properties
+const mapSummaryStats = (data) => ({
+  total_vehicles: data.total_vehicles || data.active_vehicles || 0,
+  vehicles_by_line: data.vehicles_by_line || {},
+  vehicles_by_route: data.vehicles_by_route || {},
+  current_elevator_outages: data.current_elevator_outages || data.elevator_escalator_stats?.active_outages || 0,
+  upcoming_elevator_outages: data.upcoming_elevator_outages || data.elevator_escalator_stats?.upcoming_outages || 0,
+  active_alerts: data.active_alerts || 0
+});
+
+// Map an API alert to the structure the Alerts components expect
+const mapAlert = alert => {
+  // Determine severity if not present or unknown
+  let alertSeverity = alert.severity || 'MODERATE';
+  
+  // If severity is not one of the expected values, classify based on content
+  if (!['SEVERE', 'MODERATE', 'LOW'].includes(alertSeverity)) {
+    const headerText = (alert.header_text || alert.header || '').toLowerCase();
+    const descriptionText = (alert.description_text || alert.description || '').toLowerCase();
+    
+    if (headerText.includes('suspend') || 
+        headerText.includes('emergency') || 
+        descriptionText.includes('suspend') || 
+        descriptionText.includes('emergency') ||
+        headerText.includes('closed')) {
+      alertSeverity = 'SEVERE';
+    } else if (headerText.includes('delay') || 
+              descriptionText.includes('delay') ||
+              headerText.includes('slow') ||
+              descriptionText.includes('slow')) {
+      alertSeverity = 'MODERATE';
+    } else {
+      alertSeverity = 'LOW';
+    }
+  }
+  
+  // Ensure severity is consistently uppercase
+  alertSeverity = alertSeverity.toUpperCase();
+  
+  // Determine better alert_type if missing
+  let alertType = alert.alert_type;
+  if (!alertType || alertType === 'N/A') {
+    const headerText = (alert.header_text || alert.header || '').toLowerCase();
+    if (headerText.includes('delay')) {
+      alertType = 'Delay';
+    } else if (headerText.includes('detour')) {
+      alertType = 'Detour';
+    } else if (headerText.includes('suspend')) {
+      alertType = 'Suspension';
+    } else if (headerText.includes('work') || headerText.includes('maintenance')) {
+      alertType = 'Planned Work';
+    } else {
+      alertType = 'Service Change';
+    }
+  }
+  
+  // Determine better effect if missing
+  let alertEffect = alert.effect;
+  if (!alertEffect || alertEffect === 'N/A') {
+    const headerText = (alert.header_text || alert.header || '').toLowerCase();
+    if (headerText.includes('delay')) {
+      alertEffect = 'Delays';
+    } else if (headerText.includes('skip')) {
+      alertEffect = 'Skip-Stop';
+    } else if (headerText.includes('local') && headerText.includes('express')) {
+      alertEffect = 'Local to Express';
+    } else if (headerText.includes('suspend')) {
+      alertEffect = 'Suspended';
+    } else if (headerText.includes('reduce')) {
+      alertEffect = 'Reduced Service';
+    } else {
+      alertEffect = 'Modified Service';
+    }
+  }
+  
+  // Get routes and add colors
+  const routes = alert.affected_routes || alert.routes || [];
+  const routeColors = {};
+  
+  // Generate route colors
+  routes.forEach(route => {
+    routeColors[route] = getRouteColor(route);
+  });
+  
+  return {
+    id: alert.id,
+    header: alert.header_text || alert.header,
+    description: alert.description_text || alert.description,
+    severity: alertSeverity,
+    alert_type: alertType,
+    effect: alertEffect,
+    updated: alert.updated_at || alert.updated,
+    routes: routes,
+    route_colors: routeColors
+  };
+};
+
 // API endpoints
 export const fetchSummaryStats = async () => {
   try {
@@ -157,26 +254,11 @@ export const fetchSummaryStats = async () => {
       throw new Error('No data received from API');
     }
     
-    // Return with defaults for missing properties
-    return {
-      total_vehicles: response.data.active_vehicles || 0,
-      vehicles_by_line: response.data.vehicles_by_line || {},
-      vehicles_by_route: response.data.vehicles_by_route || {},
-      current_elevator_outages: response.data.elevator_escalator_stats?.active_outages || 0,
-      upcoming_elevator_outages: response.data.elevator_escalator_stats?.upcoming_outages || 0,
-      active_alerts: response.data.active_alerts || 0
-    };
+    return mapSummaryStats(response.data);
   } catch (error) {
     console.error('Error fetching summary stats:', error);
     // Return default values on error
-    return {
-      total_vehicles: 0,
-      vehicles_by_line: {},
-      vehicles_by_route: {},
-      current_elevator_outages: 0,
-      upcoming_elevator_outages: 0,
-      active_alerts: 0
-    };
+    return mapSummaryStats({});
   }
 };
 
@@ -188,6 +270,14 @@ export const fetchVehicles = async (params = {}) => {
   );
 };
 
+export const fetchVehicleTile = async (z, x, y, params = {}) => {
+  return safeApiCall(
+    api.get(`/vehicles/tiles/${z}/${x}/${y}`, { params }),
+    'Error fetching vehicle tile:',
+    { clusters: [] }
+  );
+};
+
 export const fetchRouteStats = async () => {
   return safeApiCall(
     api.get('/routes/stats'),
@@ -211,91 +301,7 @@ export const fetchAlerts = async (routeId, severity) => {
     
     // Map the response data to match the expected structure in the Alerts component
     if (Array.isArray(response.data)) {
-      const mappedAlerts = response.data.map(alert => {
-        // Determine severity if not present or unknown
-        let alertSeverity = alert.severity || 'MODERATE';
-        
-        // If severity is not one of the expected values, classify based on content
-        if (!['SEVERE', 'MODERATE', 'LOW'].includes(alertSeverity)) {
-          const headerText = (alert.header_text || alert.header || '').toLowerCase();
-          const descriptionText = (alert.description_text || alert.description || '').toLowerCase();
-          
-          if (headerText.includes('suspend') || 
-              headerText.includes('emergency') || 
-              descriptionText.includes('suspend') || 
-              descriptionText.includes('emergency') ||
-              headerText.includes('closed')) {
-            alertSeverity = 'SEVERE';
-          } else if (headerText.includes('delay') || 
-                    descriptionText.includes('delay') ||
-                    headerText.includes('slow') ||
-                    descriptionText.includes('slow')) {
-            alertSeverity = 'MODERATE';
-          } else {
-            alertSeverity = 'LOW';
-          }
-        }
-        
-        // Ensure severity is consistently uppercase
-        alertSeverity = alertSeverity.toUpperCase();
-        
-        // Determine better alert_type if missing
-        let alertType = alert.alert_type;
-        if (!alertType || alertType === 'N/A') {
-          const headerText = (alert.header_text || alert.header || '').toLowerCase();
-          if (headerText.includes('delay')) {
-            alertType = 'Delay';
-          } else if (headerText.includes('detour')) {
-            alertType = 'Detour';
-          } else if (headerText.includes('suspend')) {
-            alertType = 'Suspension';
-          } else if (headerText.includes('work') || headerText.includes('maintenance')) {
-            alertType = 'Planned Work';
-          } else {
-            alertType = 'Service Change';
-          }
-        }
-        
-        // Determine better effect if missing
-        let alertEffect = alert.effect;
-        if (!alertEffect || alertEffect === 'N/A') {
-          const headerText = (alert.header_text || alert.header || '').toLowerCase();
-          if (headerText.includes('delay')) {
-            alertEffect = 'Delays';
-          } else if (headerText.includes('skip')) {
-            alertEffect = 'Skip-Stop';
-          } else if (headerText.includes('local') && headerText.includes('express')) {
-            alertEffect = 'Local to Express';
-          } else if (headerText.includes('suspend')) {
-            alertEffect = 'Suspended';
-          } else if (headerText.includes('reduce')) {
-            alertEffect = 'Reduced Service';
-          } else {
-            alertEffect = 'Modified Service';
-          }
-        }
-        
-        // Get routes and add colors
-        const routes = alert.affected_routes || alert.routes || [];
-        const routeColors = {};
-        
-        // Generate route colors
-        routes.forEach(route => {
-          routeColors[route] = getRouteColor(route);
-        });
-        
-        return {
-          id: alert.id,
-          header: alert.header_text || alert.header,
-          description: alert.description_text || alert.description,
-          severity: alertSeverity,
-          alert_type: alertType,
-          effect: alertEffect,
-          updated: alert.updated_at || alert.updated,
-          routes: routes,
-          route_colors: routeColors
-        };
-      });
+      const mappedAlerts = response.data.map(mapAlert);
       
       // Apply severity filter if provided (for extra assurance)
       let filteredAlerts = mappedAlerts;
@@ -322,6 +328,65 @@ export const fetchAlerts = async (routeId, severity) => {
   }
 };
 
+// Summary, system status, top alerts and vehicles per route from one snapshot
+export const fetchDashboardBundle = async (fields, alertsLimit = 5) => {
+  const params = { alerts_limit: alertsLimit };
+  if (fields) params.fields = fields.join(',');
+  
+  const response = await api.get('/dashboard/bundle', { params });
+  const data = response.data || {};
+  
+  return {
+    generation: data.generation,
+    summary: mapSummaryStats(data.summary || {}),
+    status: data.status,
+    alerts: (data.alerts || []).map(mapAlert),
+    // Keyed by _id like the route aggregations the charts were written against
+    routeStats: (data.route_stats || []).map(route => ({ ...route, _id: route.route_id }))
+  };
+};
+
+// Server-sent change events for the given collections; onChange receives the
+// changed collection names and onStatus whether the stream is connected, so
+// callers can fall back to polling. Returns a function closing the stream.
+export const subscribeToChanges = (collections, onChange, onStatus = () => {}) => {
+  const url = `${API_BASE_URL}/stream?collections=${collections.join(',')}`;
+  let source = null;
+  let retryId = null;
+  let closed = false;
+  
+  const connect = () => {
+    source = new EventSource(url);
+    source.onopen = () => onStatus(true);
+    source.addEventListener('change', event => {
+      try {
+        onChange(JSON.parse(event.data).collections);
+      } catch (error) {
+        console.error('Error reading change event:', error);
+      }
+    });
+    source.onerror = () => {
+      onStatus(false);
+      // The browser retries dropped streams itself, but gives up on error responses (503 without change streams)
+      if (source.readyState === EventSource.CLOSED && !closed) {
+        retryId = setTimeout(connect, 30000);
+      }
+    };
+  };
+  
+  if (typeof EventSource === 'undefined') {
+    onStatus(false);
+    return () => {};
+  }
+  connect();
+  
+  return () => {
+    closed = true;
+    clearTimeout(retryId);
+    if (source) source.close();
+  };
+};
+
 export const fetchElevatorOutages = async (type = 'current', station) => {
   try {
     const params = { type };
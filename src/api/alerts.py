@@ -0,0 +1,56 @@
+"""
+In-memory index of current service alerts, mirrored from current_alerts.
+
+Alongside the alerts by id it keeps an inverted index route_id -> alert ids,
+so route filters and the per-route system status are answered from memory
+instead of with one MongoDB count per route.
+"""
+import os
+from collections import defaultdict
+
+from mirror import CollectionMirror
+
+# How often changed alerts are pulled from MongoDB
+ALERTS_SYNC_SECONDS = float(os.getenv('ALERTS_SYNC_SECONDS', 5))
+
+class AlertIndex(CollectionMirror):
+    """Unresolved alerts by id, plus the ids of the alerts affecting each route"""
+
+    projection = {'_id': 0}
+
+    def __init__(self, sync_seconds=ALERTS_SYNC_SECONDS):
+        super().__init__(sync_seconds)
+        self.alerts = {}
+        self.by_route = defaultdict(set)
+
+    def apply(self, doc):
+        alert_id = doc['id']
+        previous = self.alerts.pop(alert_id, None)
+        for route in (previous or {}).get('routes') or []:
+            self.by_route[route].discard(alert_id)
+            if not self.by_route[route]:
+                del self.by_route[route]
+        if not doc.get('resolved'):
+            self.alerts[alert_id] = doc
+            for route in doc.get('routes') or []:
+                self.by_route[route].add(alert_id)
+
+    @staticmethod
+    def is_active(alert, now):
+        """True if epoch second now lies in the alert's active period"""
+        start, end = alert.get('start'), alert.get('end')
+        return (not start or start <= now) and (not end or now < end)
+
+    def current(self, now, route_id=None):
+        """Alerts active at now, optionally only those affecting route_id"""
+        alert_ids = list(self.by_route.get(route_id, ())) if route_id else list(self.alerts)
+        alerts = (self.alerts.get(alert_id) for alert_id in alert_ids)
+        return [alert for alert in alerts if alert is not None and self.is_active(alert, now)]
+
+    def route_counts(self, routes, now):
+        """{route: (active alerts, active SEVERE alerts)} for each route"""
+        counts = {}
+        for route in routes:
+            alerts = self.current(now, route)
+            counts[route] = (len(alerts), sum(1 for alert in alerts if alert.get('severity') == 'SEVERE'))
+        return counts
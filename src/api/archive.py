@@ -0,0 +1,135 @@
+"""
+Long-range queries over the producer's Parquet archive, run with DuckDB.
+
+The archive is laid out as <ARCHIVE_DIR>/<dataset>/date=YYYY-MM-DD/ with a
+route_id=<route> level below the day for vehicle positions and trip updates.
+A query lists only the files of the days (and route) it covers, without
+scanning the rest of the tree, and DuckDB reads just the selected columns of
+those files, skipping row groups by their ts statistics. A multi-week query
+over one route therefore opens one compacted file per day and never touches
+MongoDB.
+"""
+import os
+import glob
+from datetime import timedelta
+
+import duckdb
+
+# Root of the Parquet archive written by the producer (archive queries are disabled when empty)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+
+# Longest range one archive query may cover
+ARCHIVE_MAX_DAYS = int(os.getenv('ARCHIVE_MAX_DAYS', 92))
+
+# Most rows one archive query returns
+ARCHIVE_MAX_ROWS = int(os.getenv('ARCHIVE_MAX_ROWS', 10000))
+
+# DuckDB resources per query
+ARCHIVE_QUERY_THREADS = int(os.getenv('ARCHIVE_QUERY_THREADS', 2))
+ARCHIVE_QUERY_MEMORY_LIMIT = os.getenv('ARCHIVE_QUERY_MEMORY_LIMIT', '128MB')
+
+# Columns of each archived dataset, as written by the producer
+ARCHIVE_COLUMNS = {
+    'vehicle_positions': (
+        'ts', 'route_id', 'vehicle_id', 'trip_id', 'line_id', 'current_status',
+        'current_stop_sequence', 'stop_id', 'latitude', 'longitude', 'bearing', 'cycle_id'
+    ),
+    'trip_updates': (
+        'ts', 'route_id', 'trip_id', 'vehicle_id', 'line_id', 'start_date',
+        'stop_index', 'stop_id', 'arrival', 'departure', 'cycle_id'
+    ),
+    'service_alerts': (
+        'ts', 'id', 'alert_type', 'effect', 'severity', 'header', 'description',
+        'start', 'end', 'routes', 'resolved', 'cycle_id'
+    ),
+    'elevator_outages': (
+        'ts', 'equipment_id', 'station', 'borough', 'equipment_type', 'serving',
+        'outage_start', 'outage_end', 'reason', 'latest_status', 'is_current', 'cycle_id'
+    ),
+}
+
+# Periods route activity can be grouped by
+ARCHIVE_INTERVALS = ('day', 'hour')
+
+# Datasets partitioned by route below their date partitions
+ROUTE_PARTITIONED = {'vehicle_positions', 'trip_updates'}
+
+# Datasets whose rows list their routes, filtered by membership
+ROUTE_LISTS = {'service_alerts': 'routes'}
+
+def route_partition(route_id):
+    """Directory-safe route partition value, as the producer names it"""
+    value = ''.join(char if char.isalnum() or char in '-.' else '_' for char in (route_id or ''))
+    return value if value and value[0] not in '._' else f"unknown{value}"
+
+def partition_files(dataset, start, end, route_id=None):
+    """Parquet files of the day (and route) partitions between start and end"""
+    files = []
+    day = start.date()
+    while day <= end.date():
+        directory = os.path.join(ARCHIVE_DIR, dataset, f"date={day:%Y-%m-%d}")
+        if dataset in ROUTE_PARTITIONED:
+            directory = os.path.join(directory, f"route_id={route_partition(route_id)}" if route_id else 'route_id=*')
+        files.extend(glob.glob(os.path.join(directory, '*.parquet')))
+        day += timedelta(days=1)
+    return sorted(files)
+
+def parquet_source(files):
+    """read_parquet over a literal list of files"""
+    paths = ', '.join("'" + path.replace("'", "''") + "'" for path in files)
+    return f"read_parquet([{paths}])"
+
+def route_condition(dataset, route_id):
+    """SQL condition matching rows of route_id, or None for datasets without routes"""
+    if dataset in ROUTE_PARTITIONED:
+        return 'route_id = ?'
+    if dataset in ROUTE_LISTS:
+        return f"list_contains({ROUTE_LISTS[dataset]}, ?)"
+    return None
+
+def run_query(sql, params):
+    """Rows of a DuckDB query as dicts"""
+    connection = duckdb.connect(config={'threads': ARCHIVE_QUERY_THREADS, 'memory_limit': ARCHIVE_QUERY_MEMORY_LIMIT})
+    try:
+        cursor = connection.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+def query_rows(dataset, start, end, columns, route_id=None, limit=ARCHIVE_MAX_ROWS):
+    """The given columns of a dataset's rows with ts between start and end, oldest first"""
+    if route_id and route_condition(dataset, route_id) is None:
+        raise ValueError(f"{dataset} has no routes to filter on")
+    files = partition_files(dataset, start, end, route_id)
+    if not files:
+        return []
+    conditions, params = ['ts >= ?', 'ts <= ?'], [start, end]
+    if route_id:
+        conditions.append(route_condition(dataset, route_id))
+        params.append(route_id)
+    selected = ', '.join(f'"{column}"' for column in columns)
+    return run_query(
+        f"SELECT {selected} FROM {parquet_source(files)} WHERE {' AND '.join(conditions)} "
+        f"ORDER BY ts LIMIT {int(limit)}",
+        params
+    )
+
+def route_activity(start, end, route_id=None, interval='day'):
+    """Vehicle observations, distinct vehicles and distinct trips per route and day or hour"""
+    if interval not in ARCHIVE_INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(ARCHIVE_INTERVALS)}")
+    files = partition_files('vehicle_positions', start, end, route_id)
+    if not files:
+        return []
+    conditions, params = ['ts >= ?', 'ts <= ?'], [start, end]
+    if route_id:
+        conditions.append('route_id = ?')
+        params.append(route_id)
+    return run_query(
+        f"SELECT date_trunc('{interval}', ts) AS period, route_id, count(*) AS positions, "
+        f"count(DISTINCT vehicle_id) AS vehicles, count(DISTINCT trip_id) AS trips "
+        f"FROM {parquet_source(files)} WHERE {' AND '.join(conditions)} "
+        f"GROUP BY period, route_id ORDER BY period, route_id",
+        params
+    )
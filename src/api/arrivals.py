@@ -0,0 +1,46 @@
+"""
+In-memory next-arrival boards, mirrored from station_arrivals.
+
+The producer rewrites only the station_arrivals documents of stops whose
+boards changed in a cycle, and the mirror pulls just those, so serving a board
+is a dictionary lookup plus a binary search past arrivals that are already due.
+"""
+import os
+from bisect import bisect_left
+
+from mirror import CollectionMirror
+
+# How often changed boards are pulled from MongoDB
+ARRIVALS_SYNC_SECONDS = float(os.getenv('ARRIVALS_SYNC_SECONDS', 5))
+# Arrivals the producer stores per stop; a board cannot serve more than this
+ARRIVALS_BOARD_SIZE = int(os.getenv('ARRIVALS_BOARD_SIZE', 20))
+
+class ArrivalBoards(CollectionMirror):
+    """Sorted (arrival, route_id, trip_id) lists per stop_id"""
+
+    projection = {'_id': 0, 'stop_id': 1, 'arrivals': 1, 'processed_at': 1}
+
+    def __init__(self, sync_seconds=ARRIVALS_SYNC_SECONDS):
+        super().__init__(sync_seconds)
+        self.boards = {}
+
+    def apply(self, doc):
+        self.boards[doc['stop_id']] = [
+            (arrival['arrival'], arrival['route_id'], arrival['trip_id'])
+            for arrival in doc.get('arrivals') or []
+        ]
+
+    def upcoming(self, stop_id, now, limit):
+        """
+        The next limit arrivals at a stop from epoch second now, as
+        (arrival, route_id, trip_id, stop_id). A parent station id without a
+        board of its own returns its directional platforms (N and S) merged.
+        """
+        stop_ids = [stop_id] if stop_id in self.boards else [f"{stop_id}N", f"{stop_id}S"]
+        arrivals = []
+        for board_stop_id in stop_ids:
+            board = self.boards.get(board_stop_id, [])
+            start = bisect_left(board, (now,))
+            arrivals.extend(entry + (board_stop_id,) for entry in board[start:start + limit])
+        arrivals.sort()
+        return arrivals[:limit]
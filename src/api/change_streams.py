@@ -0,0 +1,153 @@
+"""
+MongoDB change streams driving cache invalidation and live updates.
+
+A background thread watches the collections the API serves from memory or
+caches per generation. Each change bumps the collection's version and
+records its cluster time, so:
+
+- the in-memory mirrors and the equipment search sync only when their
+  collection actually changed, instead of on a timer,
+- tile and dashboard caches take their generation from the last change
+  instead of querying for the newest processed_at,
+- clients subscribed to /api/stream are told which collections changed.
+
+Change streams need a replica set (a single-node one is enough). Without one,
+or while the stream is down, version() returns None and everything falls back
+to the timed MongoDB lookups.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Watch MongoDB change streams (requires a replica set)
+CHANGE_STREAMS_ENABLED = os.getenv('CHANGE_STREAMS_ENABLED', 'true').lower() == 'true'
+
+# Delay before reopening a failed change stream
+CHANGE_STREAM_RETRY_SECONDS = float(os.getenv('CHANGE_STREAM_RETRY_SECONDS', 5))
+
+# Changes within this window are sent to /stream clients as one event
+CHANGE_STREAM_COALESCE_SECONDS = float(os.getenv('CHANGE_STREAM_COALESCE_SECONDS', 0.5))
+
+# Comment line sent to idle /stream clients so proxies keep the connection open
+STREAM_KEEPALIVE_SECONDS = float(os.getenv('STREAM_KEEPALIVE_SECONDS', 15))
+
+# Error code of $changeStream on a standalone server
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+# Collections the API caches or mirrors
+WATCHED_COLLECTIONS = (
+    'latest_vehicle_positions',
+    'current_alerts',
+    'service_alerts',
+    'station_arrivals',
+    'elevator_equipment',
+    'elevator_outages',
+    'current_elevator_outages',
+    'upcoming_elevator_outages',
+    'elevator_reliability',
+)
+
+class Subscriber:
+    """The changed collections a live client has not been told about yet"""
+
+    def __init__(self, collections):
+        self.collections = collections
+        self.pending = set()
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self, collection):
+        """Record a change from the feed thread, waking the client's event loop on the first one"""
+        if collection not in self.collections or collection in self.pending:
+            return
+        if not self.pending:
+            self.loop.call_soon_threadsafe(self.event.set)
+        self.pending.add(collection)
+
+class ChangeFeed:
+    """Per-collection change versions and live subscribers, fed by one change stream"""
+
+    def __init__(self, collections=WATCHED_COLLECTIONS):
+        self.collections = list(collections)
+        # True while the change stream is open
+        self.active = False
+        self.versions = {}
+        self.changed_at = {}
+        self.subscribers = set()
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def version(self, collection):
+        """Number of changes seen to a collection, or None if changes are not being watched"""
+        return self.versions.get(collection, 0) if self.active else None
+
+    def last_change(self, collection):
+        """Cluster time of the newest change seen to a collection, or None"""
+        return self.changed_at.get(collection) if self.active else None
+
+    def start(self, uri, database):
+        """Start watching on a daemon thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, args=(uri, database), name='change-feed', daemon=True)
+            self.thread.start()
+
+    def run(self, uri, database):
+        """Follow the change stream forever, resuming after errors"""
+        client = MongoClient(uri)
+        pipeline = [
+            {'$match': {'ns.coll': {'$in': self.collections}}},
+            {'$project': {'ns': 1, 'clusterTime': 1}}
+        ]
+        resume_token = None
+        while True:
+            try:
+                with client[database].watch(pipeline, resume_after=resume_token) as stream:
+                    self.active = True
+                    logger.info(f"Watching changes to {', '.join(self.collections)}")
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self.record(change['ns']['coll'], change['clusterTime'].as_datetime())
+            except OperationFailure as e:
+                self.active = False
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning("MongoDB is not a replica set; caches fall back to timed lookups")
+                    return
+                logger.error(f"Change stream failed: {e}")
+                # The resume point may have left the oplog; start from now
+                resume_token = None
+            except Exception as e:
+                self.active = False
+                logger.error(f"Change stream failed: {e}")
+            time.sleep(CHANGE_STREAM_RETRY_SECONDS)
+
+    def record(self, collection, changed_at):
+        with self._lock:
+            self.versions[collection] = self.versions.get(collection, 0) + 1
+            self.changed_at[collection] = changed_at
+            for subscriber in self.subscribers:
+                subscriber.notify(collection)
+
+    def subscribe(self, collections):
+        """Register a live client, on the calling event loop, for changes to collections"""
+        subscriber = Subscriber(set(collections))
+        with self._lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def take(self, subscriber):
+        """The collections changed since the subscriber's last take"""
+        with self._lock:
+            changed, subscriber.pending = subscriber.pending, set()
+            subscriber.event.clear()
+        return changed
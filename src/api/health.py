@@ -0,0 +1,50 @@
+"""
+Readiness of the API's dependencies, for the /healthz and /readyz probes.
+
+The API accepts requests as soon as it starts; MongoDB and the static GTFS
+index warm up on a background thread and mark themselves ready here. /readyz
+answers 200 once every required dependency is ready, and reports each
+dependency's state (including the optional live components) either way.
+"""
+import time
+import threading
+
+class Health:
+    """Dependency states of the API process"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        # Dependency -> {'state': starting|ready|failed|..., 'required': bool, 'detail': str}
+        self.dependencies = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, required=True):
+        with self._lock:
+            self.dependencies[name] = {'state': 'starting', 'required': required, 'detail': None}
+
+    def set_state(self, name, state, detail=None):
+        with self._lock:
+            dependency = self.dependencies.setdefault(name, {'required': False})
+            dependency['state'] = state
+            dependency['detail'] = detail
+
+    def ready(self, name, detail=None):
+        self.set_state(name, 'ready', detail)
+
+    def failed(self, name, error):
+        self.set_state(name, 'failed', str(error))
+
+    def is_ready(self):
+        with self._lock:
+            return all(dependency['state'] == 'ready' for dependency in self.dependencies.values() if dependency['required'])
+
+    def report(self):
+        with self._lock:
+            dependencies = {name: dict(dependency) for name, dependency in self.dependencies.items()}
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started_at, 1),
+            'dependencies': dependencies,
+        }
+
+# The process-wide health state
+health = Health()
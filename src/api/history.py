@@ -0,0 +1,64 @@
+"""
+Point-in-time fleet positions from vehicle_history.
+
+Every subway cycle the producer stores one document per route holding that
+route's vehicles, keyed and indexed by (ts, route_id). The fleet at an instant
+is the newest snapshot at or before it: one index seek finds the snapshot
+time and a second reads that snapshot's route documents, so a lookup costs the
+same however much history is kept. A replay repeats the lookup per frame and
+reuses the previous frame's vehicles when no newer snapshot was taken.
+
+A snapshot older than HISTORY_MAX_GAP_SECONDS before the requested instant
+means no cycle ran then (the producer was down), and no fleet is returned.
+"""
+import os
+from datetime import timedelta, timezone
+
+# How far back from the requested instant a snapshot still counts as the fleet then
+HISTORY_MAX_GAP_SECONDS = int(os.getenv('HISTORY_MAX_GAP_SECONDS', 120))
+
+# Upper bound on the frames of one replay
+REPLAY_MAX_FRAMES = int(os.getenv('REPLAY_MAX_FRAMES', 720))
+
+def to_utc(value):
+    """A datetime as naive UTC, the form timestamps are stored in"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def snapshot_time(collection, ts, route_query):
+    """Time of the newest snapshot at or before ts within the gap, or None"""
+    query = dict(route_query, ts={'$lte': ts, '$gte': ts - timedelta(seconds=HISTORY_MAX_GAP_SECONDS)})
+    doc = collection.find_one(query, {'_id': 0, 'ts': 1}, sort=[('ts', -1)])
+    return doc['ts'] if doc else None
+
+def snapshot_vehicles(collection, snapshot_ts, route_query):
+    """The vehicles of every route document of one snapshot"""
+    vehicles = []
+    for doc in collection.find(dict(route_query, ts=snapshot_ts), {'_id': 0, 'vehicles': 1}):
+        vehicles.extend(doc.get('vehicles') or [])
+    return vehicles
+
+def fleet_at(collection, ts, route_query):
+    """(snapshot time, vehicles) of the fleet at ts, or (None, []) if there is no snapshot"""
+    ts = to_utc(ts)
+    found = snapshot_time(collection, ts, route_query)
+    if found is None:
+        return None, []
+    return found, snapshot_vehicles(collection, found, route_query)
+
+def replay(collection, start, end, step_seconds, route_query):
+    """Yield (frame time, snapshot time, vehicles) every step_seconds from start to end"""
+    start, end = to_utc(start), to_utc(end)
+    step = timedelta(seconds=step_seconds)
+    previous, vehicles = None, []
+    frame = start
+    while frame <= end:
+        found = snapshot_time(collection, frame, route_query)
+        if found is None:
+            vehicles = []
+        elif found != previous:
+            vehicles = snapshot_vehicles(collection, found, route_query)
+        previous = found
+        yield frame, found, vehicles
+        frame += step
@@ -3,10 +3,25 @@
 # @Date:   2025-05-10 23:44:37
 # @Last Modified by:   Mukhil Sundararaj
 # @Last Modified time: 2025-05-12 16:11:22
+import os
+import time
+import shutil
 import logging
-from fastapi import FastAPI
+from dotenv import load_dotenv
+
+# Load environment variables before the modules below read their configuration
+load_dotenv()
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from routes import router, warm_up, refresh_component_health, start_state_store, start_change_feed
+from health import health
+from shared_cache import API_WORKERS
+from metrics import REQUEST_SECONDS, metrics_registry, mark_worker_dead
+from tracing import tracer, setup_tracing, current_trace_id
+from profiling import profile_requested, start_request_profile, finish_request_profile
+from opentelemetry.trace import SpanKind
 
 # Configure logging
 logging.basicConfig(
@@ -15,6 +30,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Trace every request
+setup_tracing('mta-api')
+
 # Create FastAPI app
 app = FastAPI(
     title="MTA Real-Time Data API",
@@ -29,11 +47,88 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Profile-File"],
 )
 
 # Include the router with a prefix
 app.include_router(router, prefix="/api")
 
+# Connect to MongoDB and map the static GTFS index in the background once the server starts
+app.add_event_handler("startup", warm_up)
+
+# Retire this worker's live gauges from the shared metrics when it stops
+app.add_event_handler("shutdown", mark_worker_dead)
+
+# Follow the Kafka state topics when the live state store is enabled
+app.add_event_handler("startup", start_state_store)
+
+# Watch MongoDB change streams to invalidate caches and push changes to /api/stream
+app.add_event_handler("startup", start_change_feed)
+
+# Record request latency per route template, so /api/vehicles?route_id=A and
+# /api/vehicles?route_id=F share one series, and run each request in a span
+# whose trace id is returned in the X-Trace-Id header
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with tracer.start_as_current_span(f"{request.method} {request.url.path}", kind=SpanKind.SERVER) as span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Trace-Id"] = current_trace_id() or ""
+            return response
+        finally:
+            route = request.scope.get("route")
+            route_path = route.path if route else "unmatched"
+            span.update_name(f"{request.method} {route_path}")
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.status_code", status)
+            REQUEST_SECONDS.labels(
+                method=request.method,
+                route=route_path,
+                status=str(status)
+            ).observe(time.perf_counter() - started)
+
+# Profile requests that carry the profiling token header
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    sampler = start_request_profile() if profile_requested(request.headers) else None
+    if sampler is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    finally:
+        file_name = finish_request_profile(sampler, request.method, request.url.path)
+    if file_name:
+        response.headers["X-Profile-File"] = file_name
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus metrics endpoint.
+    """
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """
+    Liveness probe: the server is up and its event loop is answering.
+    """
+    return {"status": "live", "uptime_seconds": health.report()["uptime_seconds"]}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz(response: Response):
+    """
+    Readiness probe: 200 once MongoDB is reachable, 503 while warming up, with each dependency's state.
+    """
+    refresh_component_health()
+    ready = health.is_ready()
+    if not ready:
+        response.status_code = 503
+    return dict(status="ready" if ready else "not ready", **health.report())
+
 # Root endpoint redirects to API docs
 @app.get("/")
 def read_root():
@@ -49,4 +144,12 @@ def read_root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    if API_WORKERS > 1:
+        # Production serving mode: worker processes sharing one response cache,
+        # with their metrics aggregated from a fresh multiprocess directory
+        metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/mta-api-metrics')
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""
+Prometheus metrics for the MTA API.
+
+With several uvicorn workers (API_WORKERS > 1) each worker only sees its own
+requests, so the workers run in prometheus_client's multiprocess mode: every
+worker writes its values to files under PROMETHEUS_MULTIPROC_DIR and a scrape
+of any worker aggregates all of them. The directory has to be set (and emptied)
+before the workers start, which the Dockerfile and main.py do.
+"""
+import os
+
+from prometheus_client import CollectorRegistry, REGISTRY, Counter, Gauge, Histogram, multiprocess
+
+# Metric files of the worker processes (multiprocess mode when set)
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+REQUEST_SECONDS = Histogram(
+    'mta_api_request_seconds',
+    'API request latency by route template',
+    ['method', 'route', 'status']
+)
+DATA_FRESHNESS_SECONDS = Gauge(
+    'mta_api_data_freshness_seconds',
+    'Seconds between now and the newest MTA feed timestamp in a response',
+    ['endpoint'],
+    # Across workers, report the stalest data any live worker served
+    multiprocess_mode='livemax'
+)
+TILE_CACHE_REQUESTS = Counter(
+    'mta_api_tile_cache_requests_total',
+    'Vehicle tile requests served from the per-generation cache (hit) or clustered in MongoDB (miss)',
+    ['result']
+)
+
+def metrics_registry():
+    """The registry to expose: every worker's metrics in multiprocess mode, else this process's"""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def mark_worker_dead():
+    """Drop this worker's live gauges from the multiprocess metrics when it exits"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,62 @@
+"""
+In-memory mirrors of MongoDB collections, synced incrementally.
+
+The producer stamps every document it writes with processed_at. A mirror
+loads the whole collection once, then at most every sync_seconds reads only
+the documents written since its last sync (by an indexed processed_at), so
+endpoints serve from memory while staying a few seconds behind the database.
+When the API watches change streams, a mirror syncs only after the change
+stream has reported a write to its collection, and then without delay.
+"""
+import os
+import time
+import threading
+from datetime import timedelta
+
+# Re-read documents this far before the last sync, covering bulk writes that
+# were still being applied when it ran
+MIRROR_SYNC_OVERLAP = timedelta(seconds=float(os.getenv('MIRROR_SYNC_OVERLAP_SECONDS', 10)))
+
+class CollectionMirror:
+    """Base class applying changed documents of a collection to in-memory state"""
+
+    # Fields read from each document
+    projection = None
+
+    def __init__(self, sync_seconds):
+        self.sync_seconds = sync_seconds
+        self.synced_until = None
+        self.synced_at = 0.0
+        # Change-stream version of the collection at the last sync
+        self.synced_version = None
+        self._lock = threading.Lock()
+
+    def apply(self, doc):
+        """Apply one new or changed document"""
+        raise NotImplementedError
+
+    def is_current(self, version):
+        if version is not None:
+            return version == self.synced_version
+        return time.monotonic() - self.synced_at < self.sync_seconds
+
+    def sync(self, collection, version=None):
+        """
+        Apply the documents written since the last sync: whenever the collection's
+        change-stream version moved if one is given, otherwise at most every sync_seconds
+        """
+        if self.is_current(version):
+            return
+        with self._lock:
+            if self.is_current(version):
+                return
+            # Changes arriving during the query move the version again and sync next time
+            self.synced_version = version
+            query = {}
+            if self.synced_until is not None:
+                query['processed_at'] = {'$gte': self.synced_until - MIRROR_SYNC_OVERLAP}
+            for doc in collection.find(query, self.projection):
+                self.apply(doc)
+                if doc.get('processed_at') and (self.synced_until is None or doc['processed_at'] > self.synced_until):
+                    self.synced_until = doc['processed_at']
+            self.synced_at = time.monotonic()
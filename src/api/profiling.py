@@ -0,0 +1,131 @@
+"""
+Opt-in per-request profiling for the API.
+
+A request carrying the header named by API_PROFILE_HEADER with the value of
+API_PROFILE_TOKEN is profiled by sampling the Python stacks of every thread
+(the event loop and the worker threads running sync endpoints) while it runs.
+The collapsed stacks are written to API_PROFILE_DIR for flamegraph.pl,
+speedscope or inferno, and the file name is returned in X-Profile-File.
+
+Profiling is disabled without a token. At most one request is profiled at a
+time, at most once per API_PROFILE_MIN_INTERVAL_SECONDS, sampling stops after
+API_PROFILE_MAX_SECONDS and only the newest PROFILE_MAX_FILES profiles are
+kept, so it is safe to use in production.
+"""
+import os
+import re
+import sys
+import hmac
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Profiling configuration
+API_PROFILE_TOKEN = os.getenv('API_PROFILE_TOKEN', '')
+API_PROFILE_HEADER = os.getenv('API_PROFILE_HEADER', 'X-Profile')
+API_PROFILE_DIR = os.getenv('API_PROFILE_DIR', 'profiles')
+API_PROFILE_MIN_INTERVAL_SECONDS = float(os.getenv('API_PROFILE_MIN_INTERVAL_SECONDS', 10))
+API_PROFILE_MAX_SECONDS = float(os.getenv('API_PROFILE_MAX_SECONDS', 30))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))
+
+profile_lock = threading.Lock()
+last_profile_started = 0.0
+
+class StackSampler:
+    """Sample every other thread's Python stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, interval_seconds, max_seconds):
+        self.interval_seconds = interval_seconds
+        self.deadline = time.time() + max_seconds
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        thread_names = {}
+        while not self._stopped.wait(self.interval_seconds) and time.time() < self.deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self._thread.ident:
+                    continue
+                if thread_id not in thread_names:
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                thread_name = thread_names.get(thread_id, str(thread_id))
+                self.stacks[f"{thread_name};{collapse_stack(frame)}"] += 1
+
+def collapse_stack(frame):
+    """Render a frame's stack root-first as 'module:function;...', with the line of the innermost frame"""
+    names = []
+    leaf = frame
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        name = f"{module}:{code.co_name}"
+        names.append(f"{name}:{frame.f_lineno}" if frame is leaf else name)
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def write_collapsed(path, stacks):
+    """Write collapsed stacks, one 'stack count' line each"""
+    with open(path, 'w') as output:
+        for stack, count in stacks.most_common():
+            output.write(f"{stack} {count}\n")
+
+def prune_profiles(directory, keep):
+    """Delete all but the newest keep profile files"""
+    profiles = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for path in profiles[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def profile_requested(headers):
+    """True if the request carries the profiling token"""
+    if not API_PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get(API_PROFILE_HEADER, ''), API_PROFILE_TOKEN)
+
+def start_request_profile():
+    """Start sampling for one request, or return None if another profile is running or too recent"""
+    global last_profile_started
+    if not profile_lock.acquire(blocking=False):
+        return None
+    if time.time() - last_profile_started < API_PROFILE_MIN_INTERVAL_SECONDS:
+        profile_lock.release()
+        return None
+    last_profile_started = time.time()
+    sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000, API_PROFILE_MAX_SECONDS)
+    sampler.start()
+    return sampler
+
+def finish_request_profile(sampler, method, path):
+    """Stop sampling and write the profile; returns the file name, or None on failure"""
+    try:
+        sampler.stop()
+        os.makedirs(API_PROFILE_DIR, exist_ok=True)
+        route = re.sub(r'[^A-Za-z0-9.-]+', '_', path.strip('/')) or 'root'
+        file_name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{method}-{route}.collapsed"
+        write_collapsed(os.path.join(API_PROFILE_DIR, file_name), sampler.stacks)
+        prune_profiles(API_PROFILE_DIR, PROFILE_MAX_FILES)
+        logger.info(f"Profiled {method} {path} to {file_name}")
+        return file_name
+    except OSError as e:
+        logger.error(f"Error writing request profile for {method} {path}: {e}")
+        return None
+    finally:
+        profile_lock.release()
@@ -0,0 +1,57 @@
+"""
+Elevator and escalator reliability from the producer's running outage totals.
+
+The producer keeps one elevator_reliability document per equipment and one
+station_reliability document per station, each holding the same sums: how
+much equipment is tracked and since when (summed as epoch seconds), how many
+outages opened, were planned and closed, the downtime of the closed ones, and
+how many are open and since when. Availability, MTBF and MTTR at any instant
+follow from those sums, so a lookup reads one document however long the
+equipment has been tracked.
+"""
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+def epoch_seconds(value):
+    """Naive UTC datetime as epoch seconds"""
+    return (value - EPOCH).total_seconds()
+
+def reliability(totals, now):
+    """Availability, MTBF, MTTR and downtime at now (naive UTC) from a document's running totals"""
+    now_seconds = epoch_seconds(now)
+    observed = max(totals.get('equipment', 0) * now_seconds - totals.get('tracked_since_sum', 0), 0)
+    open_seconds = max(totals.get('open_outages', 0) * now_seconds - totals.get('open_since_sum', 0), 0)
+    repair_seconds = totals.get('repair_seconds', 0)
+    downtime = min(repair_seconds + open_seconds, observed)
+    outages = totals.get('outages', 0)
+    closed_outages = totals.get('closed_outages', 0)
+    return {
+        'observed_seconds': observed,
+        'downtime_seconds': downtime,
+        'availability': 1 - downtime / observed if observed else None,
+        'mtbf_seconds': (observed - downtime) / outages if outages else None,
+        'mttr_seconds': repair_seconds / closed_outages if closed_outages else None,
+        'outages': outages,
+        'planned_outages': totals.get('planned_outages', 0),
+        'open_outages': totals.get('open_outages', 0),
+    }
+
+def outage_intervals(events, now):
+    """Outage intervals of events (newest first), with open ones running until now"""
+    intervals = []
+    closing = None
+    for event in events:
+        if event['event'] == 'closed':
+            closing = event
+        elif event['event'] == 'opened':
+            end = closing['at'] if closing else None
+            intervals.append({
+                'start': event['at'],
+                'end': end,
+                'duration_seconds': ((end or now) - event['at']) / timedelta(seconds=1),
+                'planned': event.get('planned', False),
+                'reason': event.get('reason'),
+            })
+            closing = None
+    return intervals
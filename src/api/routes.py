@@ -1,22 +1,34 @@
 import os
+import time
+import asyncio
 import logging
+import threading
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Query, Depends
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Query, Path, Depends, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pymongo import MongoClient
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 import json
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from metrics import DATA_FRESHNESS_SECONDS, TILE_CACHE_REQUESTS
+from common.gtfs_static import load_static_gtfs
+from alerts import AlertIndex
+from arrivals import ARRIVALS_BOARD_SIZE, ArrivalBoards
+from history import REPLAY_MAX_FRAMES, to_utc, fleet_at, replay
+from reliability import reliability, outage_intervals
+from archive import ARCHIVE_DIR, ARCHIVE_MAX_DAYS, ARCHIVE_MAX_ROWS, ARCHIVE_COLUMNS, query_rows, route_activity
+from tiles import TILE_MAX_ZOOM, tile_bounds, tile_filter, cluster_pipeline, cluster_from_doc
+from search import EquipmentSearch
+from shared_cache import response_cache
+from state_store import STATE_STORE_ENABLED, StateStore
+from change_streams import (
+    CHANGE_STREAMS_ENABLED, CHANGE_STREAM_COALESCE_SECONDS, STREAM_KEEPALIVE_SECONDS, WATCHED_COLLECTIONS, ChangeFeed
 )
-logger = logging.getLogger(__name__)
+from health import health
+from opentelemetry import trace
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # MongoDB Configuration
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/')
@@ -52,18 +64,150 @@ LINE_COLORS = {
     # Bus routes - omitting long lists for brevity
 }
 
+# Subway route ids, for route type filters and the per-route status
+SUBWAY_ROUTES = list("123456789ACEGJLMNQRSWZ")
+
 # Create the router
 router = APIRouter()
 
-# Database connection
+# Serialized clustered vehicle tiles, valid for one ingest generation and
+# shared by the worker processes when there are several
+tile_cache = response_cache('tiles')
+
+# Next-arrival boards per stop, mirrored from station_arrivals
+arrival_boards = ArrivalBoards()
+
+# Active alerts and the route -> alerts index, mirrored from current_alerts
+alert_index = AlertIndex()
+
+# Serialized dashboard bundles, valid for one ingest generation
+bundle_cache = response_cache('bundles', max_entries=64)
+
+# Live vehicles and alerts from the Kafka state topics, started by start_state_store
+state_store = StateStore()
+
+# Station/borough/type search over elevator_equipment, rebuilt on each equipment refresh
+equipment_search = EquipmentSearch()
+
+# Change versions of the cached collections and live /stream subscribers, started by start_change_feed
+change_feed = ChangeFeed()
+
+# Static GTFS stop index, mapped in the background by warm_up
+static_gtfs = None
+
+def warm_up():
+    """
+    Connect to MongoDB and map the static GTFS index on a background thread,
+    so the server accepts requests (and answers /healthz) right away.
+    """
+    health.register("mongodb")
+    health.register("gtfs_static", required=False)
+    threading.Thread(target=warm_up_dependencies, name="warm-up", daemon=True).start()
+
+def warm_up_dependencies():
+    global static_gtfs
+    while True:
+        try:
+            get_db().command("ping")
+            health.ready("mongodb")
+            break
+        except Exception as e:
+            health.failed("mongodb", e)
+            logger.error(f"MongoDB not available yet, retrying: {e}")
+            time.sleep(5)
+    
+    # Map the static GTFS index used to name stops in responses
+    static_gtfs = load_static_gtfs()
+    if static_gtfs is not None:
+        health.ready("gtfs_static")
+    else:
+        health.failed("gtfs_static", "Static GTFS unavailable; responses omit stop names")
+
+def refresh_component_health():
+    """
+    Report the optional live components; endpoints serve from MongoDB until they are ready.
+    """
+    if STATE_STORE_ENABLED:
+        health.set_state("state_store", "ready" if state_store.ready else "loading")
+    if CHANGE_STREAMS_ENABLED:
+        health.set_state("change_streams", "ready" if change_feed.active else "unavailable")
+
+def start_state_store():
+    """
+    Start following the Kafka state topics when STATE_STORE_ENABLED is set.
+    """
+    if STATE_STORE_ENABLED:
+        state_store.start()
+
+def start_change_feed():
+    """
+    Start watching MongoDB change streams when CHANGE_STREAMS_ENABLED is set.
+    """
+    if CHANGE_STREAMS_ENABLED:
+        change_feed.start(MONGODB_URI, MONGODB_DATABASE)
+
+def live_alert_index(db):
+    """
+    The alert index to serve from: the Kafka state store's once it has
+    caught up, otherwise the MongoDB mirror, synced first.
+    """
+    if state_store.ready:
+        return state_store.alerts
+    alert_index.sync(db.current_alerts, change_feed.version("current_alerts"))
+    return alert_index
+
+def json_bytes(value):
+    """
+    Serialize a response body once, for the response caches.
+    """
+    return json.dumps(jsonable_encoder(value)).encode('utf-8')
+
+def epoch_seconds(value):
+    """Epoch seconds of an int timestamp or a (naive UTC) datetime, or None"""
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+def record_data_lineage(endpoint, items, feed_time_field):
+    """
+    Track where the data in a response came from: the age of the newest feed
+    timestamp, the slowest feed-to-MongoDB delay and the producer cycles involved.
+    """
+    feed_times = [epoch_seconds(getattr(item, feed_time_field)) for item in items]
+    feed_times = [feed_time for feed_time in feed_times if feed_time is not None]
+    if not feed_times:
+        return
+    
+    feed_age = time.time() - max(feed_times)
+    DATA_FRESHNESS_SECONDS.labels(endpoint=endpoint).set(feed_age)
+    
+    span = trace.get_current_span()
+    span.set_attribute('mta.feed_age_seconds', feed_age)
+    ingest_delays = [
+        epoch_seconds(item.processed_at) - epoch_seconds(getattr(item, feed_time_field))
+        for item in items
+        if item.processed_at is not None and getattr(item, feed_time_field) is not None
+    ]
+    if ingest_delays:
+        span.set_attribute('mta.max_ingest_delay_seconds', max(ingest_delays))
+    cycle_ids = sorted({item.cycle_id for item in items if item.cycle_id})
+    if cycle_ids:
+        span.set_attribute('mta.cycle_ids', cycle_ids)
+
+# Database connection, one client (and connection pool) shared by all requests
+mongo_client = None
+
 def get_db():
     """
-    Create and return a MongoDB client connection.
+    Return the database on the shared MongoDB client, connecting on first use.
     """
+    global mongo_client
     try:
-        client = MongoClient(MONGODB_URI)
-        db = client[MONGODB_DATABASE]
-        return db
+        if mongo_client is None:
+            mongo_client = MongoClient(MONGODB_URI)
+        return mongo_client[MONGODB_DATABASE]
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
         raise HTTPException(status_code=500, detail="Database connection error")
@@ -91,10 +235,13 @@ class SubwayVehicle(BaseModel):
     current_status: Optional[int] = None
     current_stop_sequence: Optional[int] = None
     stop_id: Optional[str] = None
+    stop_name: Optional[str] = None
     position: Optional[Position] = None
     timestamp: int
     event_time: Optional[datetime] = None
     fetch_time: Optional[datetime] = None
+    processed_at: Optional[datetime] = None
+    cycle_id: Optional[str] = None
 
 class RouteStats(BaseModel):
     """
@@ -120,6 +267,8 @@ class ServiceAlert(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     affected_routes: List[str] = []
+    processed_at: Optional[datetime] = None
+    cycle_id: Optional[str] = None
 
 class ElevatorOutage(BaseModel):
     """
@@ -135,6 +284,24 @@ class ElevatorOutage(BaseModel):
     status: str
     type: str  # current or upcoming
 
+class Arrival(BaseModel):
+    """
+    Model for one predicted arrival at a stop.
+    """
+    route_id: str
+    trip_id: str
+    stop_id: str
+    arrival: int
+    minutes_away: int
+
+class StationArrivals(BaseModel):
+    """
+    Model for the next-arrival board of a station or platform.
+    """
+    stop_id: str
+    stop_name: Optional[str] = None
+    arrivals: List[Arrival]
+
 class StatsSummary(BaseModel):
     """
     Model for system-wide summary statistics.
@@ -157,101 +324,397 @@ def read_root():
         "docs": "/docs"
     }
 
+def vehicle_counts(db):
+    """
+    Current vehicles per line and route, busiest first, from one aggregation over latest_vehicle_positions.
+    """
+    pipeline = [
+        {"$group": {"_id": {"line_id": "$line_id", "route_id": "$route_id"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id.route_id": 1}}
+    ]
+    return [
+        {
+            "line_id": doc["_id"].get("line_id") or "Unknown",
+            "route_id": doc["_id"].get("route_id") or "Unknown",
+            "count": doc["count"]
+        }
+        for doc in db.latest_vehicle_positions.aggregate(pipeline)
+    ]
+
+# elevator_reliability filters for equipment with an open or a scheduled outage.
+# The outage snapshot collections keep an equipment's last outage after it
+# ends, so these decide which of their documents are still listed.
+OUTAGE_STATE = {
+    "current": {"open_outages": {"$gt": 0}},
+    "upcoming": {"scheduled": True},
+}
+
+def summary_stats(db, counts):
+    """
+    Build the system summary from vehicle_counts, the elevator outage counts and the alert index.
+    """
+    line_counts = {}
+    route_counts = {}
+    for count in counts:
+        line_counts[count["line_id"]] = line_counts.get(count["line_id"], 0) + count["count"]
+        route_counts[count["route_id"]] = route_counts.get(count["route_id"], 0) + count["count"]
+    
+    # Count equipment out of service and with scheduled outages, from the producer's outage tracking
+    current_outages = db.elevator_reliability.count_documents(OUTAGE_STATE["current"])
+    upcoming_outages = db.elevator_reliability.count_documents(OUTAGE_STATE["upcoming"])
+    
+    # Count active alerts from the in-memory alert index
+    active_alerts = len(live_alert_index(db).current(time.time()))
+    
+    return StatsSummary(
+        total_vehicles=sum(line_counts.values()),
+        vehicles_by_line=dict(sorted(line_counts.items())),
+        vehicles_by_route=dict(sorted(route_counts.items())),
+        current_elevator_outages=current_outages,
+        upcoming_elevator_outages=upcoming_outages,
+        active_alerts=active_alerts
+    )
+
 @router.get("/stats/summary")
 def get_summary_stats(db = Depends(get_db)):
     """
     Get summary statistics for the entire system.
     """
     try:
-        # Count vehicles by line and route
-        vehicle_collection = db.vehicles
-        total_vehicles = vehicle_collection.count_documents({})
-        
-        # Get counts by line
-        pipeline = [
-            {"$group": {"_id": "$line_id", "count": {"$sum": 1}}},
-            {"$sort": {"_id": 1}}
-        ]
-        line_counts = {doc["_id"]: doc["count"] for doc in vehicle_collection.aggregate(pipeline)}
-        
-        # Get counts by route
-        pipeline = [
-            {"$group": {"_id": "$route_id", "count": {"$sum": 1}}},
-            {"$sort": {"_id": 1}}
-        ]
-        route_counts = {doc["_id"]: doc["count"] for doc in vehicle_collection.aggregate(pipeline)}
-        
-        # Count current and upcoming elevator outages
-        elevator_collection = db.elevator_outages
-        current_outages = elevator_collection.count_documents({"type": "current"})
-        upcoming_outages = elevator_collection.count_documents({"type": "upcoming"})
-        
-        # Count active alerts
-        alert_collection = db.alerts
-        active_alerts = alert_collection.count_documents({})
-        
-        return StatsSummary(
-            total_vehicles=total_vehicles,
-            vehicles_by_line=line_counts,
-            vehicles_by_route=route_counts,
-            current_elevator_outages=current_outages,
-            upcoming_elevator_outages=upcoming_outages,
-            active_alerts=active_alerts
-        )
+        return summary_stats(db, vehicle_counts(db))
     except Exception as e:
         logger.error(f"Error fetching summary stats: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def parse_bbox(bbox):
+    """
+    Parse a 'min_lon,min_lat,max_lon,max_lat' bounding box, raising a 400 on bad input.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(value) for value in bbox.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise HTTPException(status_code=400, detail="bbox must be a non-empty box within -180..180, -90..90")
+    return min_lon, min_lat, max_lon, max_lat
+
+def bbox_filter(min_lon, min_lat, max_lon, max_lat):
+    """
+    $geoWithin filter for a bounding box on the 2dsphere-indexed location field,
+    or None for boxes spanning a hemisphere or more (they cover the whole city).
+    """
+    if max_lon - min_lon >= 180 or max_lat - min_lat >= 90:
+        return None
+    return {"$geoWithin": {"$geometry": {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]
+        ]]
+    }}}
+
+def route_filter(route_id=None, route_type=None):
+    """
+    Vehicle query conditions for a route id or a route type (subway or bus).
+    """
+    query = {}
+    if route_id:
+        query["route_id"] = route_id
+        
+    if route_type:
+        # Filter by subway or bus
+        if route_type.lower() == "subway":
+            query["route_id"] = {"$in": SUBWAY_ROUTES}
+        elif route_type.lower() == "bus":
+            query["route_id"] = {"$regex": "^[BMQSBx]"}
+    return query
+
+def route_ids(route_id=None, route_type=None, known_routes=()):
+    """
+    The route ids route_filter matches among known_routes, or None if it has no route condition.
+    """
+    if route_type and route_type.lower() == "subway":
+        return SUBWAY_ROUTES
+    if route_type and route_type.lower() == "bus":
+        return [route for route in known_routes if route[:1] in "BMQSx"]
+    if route_id:
+        return [route_id]
+    return None
+
+def vehicle_from_doc(doc):
+    """
+    Convert a vehicle position document to the SubwayVehicle model.
+    """
+    # Handle datetime conversion
+    if 'event_time' in doc and doc['event_time']:
+        doc['event_time'] = datetime.fromisoformat(doc['event_time']) if isinstance(doc['event_time'], str) else doc['event_time']
+    if 'fetch_time' in doc and doc['fetch_time']:
+        doc['fetch_time'] = datetime.fromisoformat(doc['fetch_time']) if isinstance(doc['fetch_time'], str) else doc['fetch_time']
+    # Feed timestamps are stored as datetimes; the model carries epoch seconds
+    if isinstance(doc.get('timestamp'), datetime):
+        doc['timestamp'] = int(epoch_seconds(doc['timestamp']))
+    
+    # Handle nested position object, falling back to the flat coordinates
+    if doc.get('position'):
+        doc['position'] = Position(**doc['position'])
+    elif doc.get('latitude') is not None and doc.get('longitude') is not None:
+        doc['position'] = Position(latitude=doc['latitude'], longitude=doc['longitude'], bearing=doc.get('bearing'))
+    
+    # Name the current stop from the static GTFS index
+    if static_gtfs is not None and doc.get('stop_id'):
+        doc['stop_name'] = static_gtfs.stop_name(doc['stop_id'])
+    
+    # Remove MongoDB _id field
+    doc.pop('_id', None)
+    
+    return SubwayVehicle(**doc)
+
 @router.get("/vehicles")
 def get_vehicles(
     route_id: Optional[str] = None,
     route_type: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="Viewport as min_lon,min_lat,max_lon,max_lat"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of the point for radius queries"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the point for radius queries"),
+    radius: float = Query(1000, gt=0, le=50000, description="Radius in meters around lat/lon"),
     limit: int = Query(100, ge=1, le=1000),
     db = Depends(get_db)
 ):
     """
     Get current vehicle positions with optional filtering.
+    
+    With bbox, only vehicles inside the viewport are returned. With lat/lon,
+    vehicles within radius meters are returned nearest first.
     """
+    query = {}
+    box = None
+    if bbox and (lat is not None or lon is not None):
+        raise HTTPException(status_code=400, detail="Use either bbox or lat/lon, not both")
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="lat and lon must be given together")
+    if bbox:
+        box = parse_bbox(bbox)
+        location_filter = bbox_filter(*box)
+        if location_filter:
+            query["location"] = location_filter
+        else:
+            box = None
+    elif lat is not None:
+        query["location"] = {"$nearSphere": {
+            "$geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "$maxDistance": radius
+        }}
+    
     try:
-        collection = db.vehicles
-        query = {}
-        
-        if route_id:
-            query["route_id"] = route_id
+        if state_store.ready:
+            # Answer from the in-memory state store, with the same filters
+            docs = state_store.vehicles.query(
+                route_ids=route_ids(route_id, route_type, state_store.vehicles.routes()),
+                bbox=box,
+                near=(lat, lon, radius) if lat is not None else None,
+                limit=limit
+            )
+            vehicles = [vehicle_from_doc(dict(doc)) for doc in docs]
+        else:
+            collection = db.latest_vehicle_positions
             
-        if route_type:
-            # Filter by subway or bus
-            if route_type.lower() == "subway":
-                query["route_id"] = {"$in": list("123456789ACEGJLMNQRSWZ")}
-            elif route_type.lower() == "bus":
-                query["route_id"] = {"$regex": "^[BMQSBx]"}
-        
-        cursor = collection.find(query).limit(limit)
-        vehicles = []
-        
-        for doc in cursor:
-            # Convert MongoDB document to SubwayVehicle model
-            # Handle datetime conversion
-            if 'event_time' in doc and doc['event_time']:
-                doc['event_time'] = datetime.fromisoformat(doc['event_time']) if isinstance(doc['event_time'], str) else doc['event_time']
-            if 'fetch_time' in doc and doc['fetch_time']:
-                doc['fetch_time'] = datetime.fromisoformat(doc['fetch_time']) if isinstance(doc['fetch_time'], str) else doc['fetch_time']
+            query.update(route_filter(route_id, route_type))
             
-            # Handle nested position object
-            if 'position' in doc and doc['position']:
-                doc['position'] = Position(**doc['position'])
-            
-            # Remove MongoDB _id field
-            doc.pop('_id', None)
-            
-            vehicle = SubwayVehicle(**doc)
-            vehicles.append(vehicle)
+            cursor = collection.find(query).limit(limit)
+            vehicles = [vehicle_from_doc(doc) for doc in cursor]
+        
+        # Track end-to-end freshness: age of the newest feed header timestamp served
+        record_data_lineage('vehicles', vehicles, 'timestamp')
         
         return vehicles
     except Exception as e:
         logger.error(f"Error fetching vehicles: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def current_generation(db):
+    """
+    The current ingest generation: when latest_vehicle_positions was last written,
+    as reported by the change stream or else looked up.
+    """
+    changed_at = change_feed.last_change("latest_vehicle_positions")
+    if changed_at is not None:
+        return changed_at
+    doc = db.latest_vehicle_positions.find_one({}, {"processed_at": 1}, sort=[("processed_at", -1)])
+    return doc.get("processed_at") if doc else None
+
+def history_frame(ts, snapshot_ts, vehicles):
+    """
+    One point-in-time fleet view: the requested instant, the snapshot it was answered from, and its vehicles.
+    """
+    return {"ts": ts, "snapshot_ts": snapshot_ts, "count": len(vehicles), "vehicles": vehicles}
+
+@router.get("/vehicles/at")
+def get_vehicles_at(
+    ts: datetime,
+    route_id: Optional[str] = None,
+    route_type: Optional[str] = None,
+    db = Depends(get_db)
+):
+    """
+    Get every vehicle's position at an instant (ISO time or epoch seconds).
+    
+    Answered from the newest vehicle_history snapshot at or before ts, found
+    by an index seek, so any instant costs the same to look up.
+    """
+    ts = to_utc(ts)
+    try:
+        snapshot_ts, vehicles = fleet_at(db.vehicle_history, ts, route_filter(route_id, route_type))
+    except Exception as e:
+        logger.error(f"Error fetching vehicles at {ts}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    if snapshot_ts is None:
+        raise HTTPException(status_code=404, detail=f"No vehicle history recorded shortly before {ts.isoformat()}")
+    return history_frame(ts, snapshot_ts, vehicles)
+
+@router.get("/vehicles/replay")
+def replay_vehicles(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    step: int = Query(30, ge=1, le=3600),
+    route_id: Optional[str] = None,
+    route_type: Optional[str] = None,
+    db = Depends(get_db)
+):
+    """
+    Stream fleet positions every step seconds from one instant to another, as
+    newline-delimited JSON frames shaped like /vehicles/at.
+    
+    Frames are looked up one by one, so a replay starts streaming at once and
+    each frame costs the same however much history is kept.
+    """
+    start, end = to_utc(start), to_utc(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    frames = int((end - start).total_seconds() // step) + 1
+    if frames > REPLAY_MAX_FRAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Replay of {frames} frames exceeds {REPLAY_MAX_FRAMES}; raise step or shorten the range"
+        )
+    
+    def frame_lines():
+        try:
+            for frame in replay(db.vehicle_history, start, end, step, route_filter(route_id, route_type)):
+                yield json_bytes(history_frame(*frame)) + b"\n"
+        except Exception as e:
+            logger.error(f"Error replaying vehicles from {start} to {end}: {e}")
+    
+    return StreamingResponse(frame_lines(), media_type="application/x-ndjson")
+
+@router.get("/vehicles/tiles/{z}/{x}/{y}")
+def get_vehicle_tile(
+    z: int = Path(..., ge=0, le=TILE_MAX_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    route_id: Optional[str] = None,
+    route_type: Optional[str] = None,
+    db = Depends(get_db)
+):
+    """
+    Get vehicles in map tile z/x/y, clustered per grid cell.
+    
+    Each cluster has a centroid and a vehicle count; single vehicles also carry
+    their id and route. Tiles are cached until the next ingest write.
+    """
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=400, detail=f"Tile {x}/{y} does not exist at zoom {z}")
+    
+    def build_tile():
+        bounds = tile_bounds(z, x, y)
+        match = dict(route_filter(route_id, route_type), **tile_filter(bounds, z))
+        clusters = [
+            cluster_from_doc(doc)
+            for doc in db.latest_vehicle_positions.aggregate(cluster_pipeline(match, bounds))
+        ]
+        return json_bytes({
+            "z": z,
+            "x": x,
+            "y": y,
+            "generation": generation.isoformat() if isinstance(generation, datetime) else None,
+            "vehicles": sum(cluster["count"] for cluster in clusters),
+            "clusters": clusters,
+        })
+    
+    try:
+        generation = tile_cache.refresh(lambda: current_generation(db))
+        tile, hit = tile_cache.get_or_build((z, x, y, route_id, route_type), generation, build_tile)
+        TILE_CACHE_REQUESTS.labels(result='hit' if hit else 'miss').inc()
+        return Response(content=tile, media_type="application/json")
+    except Exception as e:
+        logger.error(f"Error clustering vehicle tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/stations/{stop_id}/arrivals")
+def get_station_arrivals(
+    stop_id: str,
+    limit: int = Query(min(10, ARRIVALS_BOARD_SIZE), ge=1, le=ARRIVALS_BOARD_SIZE),
+    db = Depends(get_db)
+):
+    """
+    Get the next arrivals at a stop, soonest first.
+    
+    A parent station id (e.g. 127) returns both directions (127N and 127S).
+    Boards are served from memory and synced from station_arrivals; limit is
+    capped at ARRIVALS_BOARD_SIZE, the number of arrivals stored per stop.
+    """
+    try:
+        arrival_boards.sync(db.station_arrivals, change_feed.version("station_arrivals"))
+        now = int(time.time())
+        arrivals = [
+            Arrival(
+                route_id=route_id,
+                trip_id=trip_id,
+                stop_id=board_stop_id,
+                arrival=arrival,
+                minutes_away=(arrival - now) // 60
+            )
+            for arrival, route_id, trip_id, board_stop_id in arrival_boards.upcoming(stop_id, now, limit)
+        ]
+        
+        return StationArrivals(
+            stop_id=stop_id,
+            stop_name=static_gtfs.stop_name(stop_id) if static_gtfs is not None else None,
+            arrivals=arrivals
+        )
+    except Exception as e:
+        logger.error(f"Error fetching arrivals for stop {stop_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def alert_from_doc(alert):
+    """
+    Convert a current_alerts document to the ServiceAlert model.
+    """
+    start = alert.get('start')
+    return ServiceAlert(
+        id=alert['id'],
+        alert_type=alert.get('alert_type') or '',
+        effect=alert.get('effect'),
+        header_text=alert.get('header'),
+        description_text=alert.get('description'),
+        severity=alert.get('severity'),
+        created_at=datetime.fromtimestamp(start, timezone.utc) if start else None,
+        updated_at=alert.get('updated'),
+        affected_routes=alert.get('routes') or [],
+        processed_at=alert.get('processed_at'),
+        cycle_id=alert.get('cycle_id')
+    )
+
+def active_alerts(index, route_id=None, severity=None, limit=100):
+    """
+    Active alerts from an alert index as ServiceAlert models, newest first.
+    """
+    current = index.current(time.time(), route_id)
+    
+    if severity:
+        current = [alert for alert in current if (alert.get('severity') or '').upper() == severity.upper()]
+    
+    current.sort(key=lambda alert: epoch_seconds(alert.get('updated')) or 0, reverse=True)
+    return [alert_from_doc(alert) for alert in current[:limit]]
+
 @router.get("/alerts")
 def get_alerts(
     route_id: Optional[str] = None,
@@ -260,83 +723,81 @@ def get_alerts(
     db = Depends(get_db)
 ):
     """
-    Get service alerts with optional filtering.
+    Get active service alerts with optional filtering, newest first.
+    
+    Served from the in-memory alert index; a route filter reads the
+    route's alert ids from the inverted index.
     """
     try:
-        collection = db.alerts
-        query = {}
+        alerts = active_alerts(live_alert_index(db), route_id, severity, limit)
         
-        if route_id:
-            query["affected_routes"] = route_id
-            
-        if severity:
-            query["severity"] = severity
-        
-        cursor = collection.find(query).limit(limit)
-        alerts = []
-        
-        for doc in cursor:
-            # Convert MongoDB document to ServiceAlert model
-            # Handle datetime conversion
-            if 'created_at' in doc and doc['created_at']:
-                doc['created_at'] = datetime.fromisoformat(doc['created_at']) if isinstance(doc['created_at'], str) else doc['created_at']
-            if 'updated_at' in doc and doc['updated_at']:
-                doc['updated_at'] = datetime.fromisoformat(doc['updated_at']) if isinstance(doc['updated_at'], str) else doc['updated_at']
-            
-            # Remove MongoDB _id field
-            doc.pop('_id', None)
-            
-            alert = ServiceAlert(**doc)
-            alerts.append(alert)
+        record_data_lineage('alerts', alerts, 'updated_at')
         
         return alerts
     except Exception as e:
         logger.error(f"Error fetching alerts: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Formats of outage times in the MTA elevator feeds, besides ISO 8601
+OUTAGE_TIME_FORMATS = ('%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M:%S')
+
+def outage_time(value):
+    """
+    An outage start or end time as a datetime, or None if it is missing or unreadable.
+    """
+    if not isinstance(value, str):
+        return value if isinstance(value, datetime) else None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for time_format in OUTAGE_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+    return None
+
+def elevator_outage(doc):
+    """
+    ElevatorOutage from an outage document, as the producer (station, latest_status) or processor stores it.
+    """
+    return ElevatorOutage(
+        station_name=doc.get('station_name') or doc.get('station') or '',
+        equipment_id=doc.get('equipment_id') or '',
+        equipment_type=doc.get('equipment_type') or '',
+        serving=doc.get('serving') or '',
+        outage_start=outage_time(doc.get('outage_start')),
+        outage_end=outage_time(doc.get('outage_end')),
+        reason=doc.get('reason'),
+        status=doc.get('status') or doc.get('latest_status') or '',
+        type=doc.get('type') or ('current' if doc.get('is_current', True) else 'upcoming')
+    )
+
 @router.get("/elevators/outages")
 def get_elevator_outages(
     station: Optional[str] = None,
     borough: Optional[str] = None,
     equipment_type: Optional[str] = None,
-    type: str = 'current',
+    type: str = Query('current', regex="^(current|upcoming)$"),
     limit: int = Query(100, ge=1, le=1000),
     db = Depends(get_db)
 ):
     """
-    Get elevator and escalator outage information.
+    Get the elevator and escalator outages in effect now ("current") or scheduled ("upcoming").
     """
     try:
-        collection = db.elevator_outages
-        query = {"type": type}
+        collection = db.current_elevator_outages if type == "current" else db.upcoming_elevator_outages
+        equipment_ids = set(db.elevator_reliability.distinct("equipment_id", OUTAGE_STATE[type]))
         
-        if station:
-            query["station_name"] = {"$regex": f".*{station}.*", "$options": "i"}
-            
-        if borough:
-            query["borough"] = {"$regex": f".*{borough}.*", "$options": "i"}
-            
-        if equipment_type:
-            query["equipment_type"] = {"$regex": f".*{equipment_type}.*", "$options": "i"}
+        # Resolve the text filters to equipment ids in memory, then match outages by id
+        if station or borough or equipment_type:
+            index = equipment_search.refresh(db.elevator_equipment, change_feed.version("elevator_equipment"))
+            matched = index.match(station or None, borough or None, equipment_type or None)
+            equipment_ids &= {index.equipment[position].get('equipment_id') for position in matched}
         
-        cursor = collection.find(query).limit(limit)
-        outages = []
-        
-        for doc in cursor:
-            # Convert MongoDB document to ElevatorOutage model
-            # Handle datetime conversion
-            if 'outage_start' in doc and doc['outage_start']:
-                doc['outage_start'] = datetime.fromisoformat(doc['outage_start']) if isinstance(doc['outage_start'], str) else doc['outage_start']
-            if 'outage_end' in doc and doc['outage_end']:
-                doc['outage_end'] = datetime.fromisoformat(doc['outage_end']) if isinstance(doc['outage_end'], str) else doc['outage_end']
-            
-            # Remove MongoDB _id field
-            doc.pop('_id', None)
-            
-            outage = ElevatorOutage(**doc)
-            outages.append(outage)
-        
-        return outages
+        cursor = collection.find({"equipment_id": {"$in": sorted(equipment_ids)}}).limit(limit)
+        return [elevator_outage(doc) for doc in cursor]
     except Exception as e:
         logger.error(f"Error fetching elevator outages: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -346,7 +807,7 @@ def get_elevator_outages_alias(
     station: Optional[str] = None,
     borough: Optional[str] = None,
     equipment_type: Optional[str] = None,
-    type: str = 'current',
+    type: str = Query('current', regex="^(current|upcoming)$"),
     limit: int = Query(100, ge=1, le=1000),
     db = Depends(get_db)
 ):
@@ -368,74 +829,118 @@ def get_elevator_equipment(
     Get information about elevator and escalator equipment.
     """
     try:
-        collection = db.elevator_equipment
-        query = {}
-        
-        if station:
-            query["station_name"] = {"$regex": f".*{station}.*", "$options": "i"}
-            
-        if borough:
-            query["borough"] = {"$regex": f".*{borough}.*", "$options": "i"}
-            
-        if equipment_type:
-            query["equipment_type"] = {"$regex": f".*{equipment_type}.*", "$options": "i"}
-            
-        if ada is not None:
-            query["ada"] = ada
-        
-        cursor = collection.find(query).limit(limit)
+        index = equipment_search.refresh(db.elevator_equipment, change_feed.version("elevator_equipment"))
         equipment_list = []
         
-        for doc in cursor:
-            # Remove MongoDB _id field
-            doc.pop('_id', None)
+        for position in index.match(station or None, borough or None, equipment_type or None):
+            doc = index.equipment[position]
+            if ada is not None and doc.get('ada') != ada:
+                continue
             equipment_list.append(doc)
+            if len(equipment_list) >= limit:
+                break
         
         return equipment_list
     except Exception as e:
         logger.error(f"Error fetching elevator equipment: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get("/system/status")
-def get_system_status(db = Depends(get_db)):
+def reliability_document(doc, now):
     """
-    Get overall system status including alert counts by route.
+    A stored reliability document without its storage fields, with availability, MTBF and MTTR at now.
+    """
+    derived = reliability(doc, now)
+    for field in ("_id", "processed_at", "cycle_id", "tracked_since_sum", "open_since_sum"):
+        doc.pop(field, None)
+    doc.update(derived)
+    return doc
+
+@router.get("/elevators/reliability")
+def get_station_reliability(
+    station: str,
+    db = Depends(get_db)
+):
+    """
+    Get the combined availability, MTBF and MTTR of a station's elevators and escalators.
     """
     try:
-        alert_collection = db.alerts
-        
-        # Get all subway routes
-        subway_routes = list("123456789ACEGJLMNQRSWZ")
-        
-        status_data = {}
+        doc = db.station_reliability.find_one({"station": station})
+    except Exception as e:
+        logger.error(f"Error fetching reliability of station {station}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"No elevators or escalators tracked at {station}")
+    return reliability_document(doc, datetime.utcnow())
+
+@router.get("/elevators/{equipment_id}/reliability")
+def get_equipment_reliability(
+    equipment_id: str,
+    outages: int = Query(10, ge=0, le=100),
+    db = Depends(get_db)
+):
+    """
+    Get an elevator's or escalator's availability, MTBF and MTTR since it was
+    first tracked, with its most recent outage intervals, newest first.
+    """
+    now = datetime.utcnow()
+    try:
+        doc = db.elevator_reliability.find_one({"equipment_id": equipment_id})
+        events = []
+        if doc is not None and outages:
+            events = list(
+                db.elevator_outage_events.find(
+                    {"equipment_id": equipment_id, "event": {"$in": ["opened", "closed"]}}, {"_id": 0}
+                ).sort("at", -1).limit(2 * outages)
+            )
+    except Exception as e:
+        logger.error(f"Error fetching reliability of equipment {equipment_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Equipment {equipment_id} not tracked")
+    doc = reliability_document(doc, now)
+    doc["recent_outages"] = outage_intervals(events, now)[:outages]
+    return doc
+
+def system_status(index):
+    """
+    Status and alert count of each subway route, from an alert index.
+    """
+    status_data = {}
+    
+    # Get status for each route based on alerts, from the route -> alerts index
+    route_counts = index.route_counts(SUBWAY_ROUTES, time.time())
+    for route in SUBWAY_ROUTES:
+        route_alerts_count, route_alerts_severe = route_counts[route]
         
-        # Get status for each route based on alerts
-        for route in subway_routes:
-            # Check for alerts affecting this route
-            route_alerts_count = alert_collection.count_documents({"affected_routes": route})
-            route_alerts_severe = alert_collection.count_documents({"affected_routes": route, "severity": "severe"})
+        # Determine status based on alerts
+        if route_alerts_severe > 0:
+            status = "delay"
+        elif route_alerts_count > 0:
+            status = "caution"
+        else:
+            status = "good"
             
-            # Determine status based on alerts
-            if route_alerts_severe > 0:
-                status = "delay"
-            elif route_alerts_count > 0:
-                status = "caution"
-            else:
-                status = "good"
-                
-            # Add color for visualization
-            color = LINE_COLORS.get(route, "#000000")
-            
-            status_data[route] = {
-                "status": status,
-                "color": color,
-                "alerts_count": route_alerts_count
-            }
+        # Add color for visualization
+        color = LINE_COLORS.get(route, "#000000")
         
-        return {
-            "timestamp": datetime.now(),
-            "routes": status_data
+        status_data[route] = {
+            "status": status,
+            "color": color,
+            "alerts_count": route_alerts_count
         }
+    
+    return {
+        "timestamp": datetime.now(),
+        "routes": status_data
+    }
+
+@router.get("/system/status")
+def get_system_status(db = Depends(get_db)):
+    """
+    Get overall system status including alert counts by route.
+    """
+    try:
+        return system_status(live_alert_index(db))
     except Exception as e:
         logger.error(f"Error fetching system status: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -481,4 +986,197 @@ def get_route_stats(
         return stats
     except Exception as e:
         logger.error(f"Error fetching route stats: {e}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/routes/{route_id}/headways")
+def get_route_headways(
+    route_id: str,
+    direction: Optional[str] = Query(None, regex="^[NS]?$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(720, ge=1, le=5000),
+    db = Depends(get_db)
+):
+    """
+    Get a route's headway and bunching time series (default: the last hour).
+
+    One point per ingest cycle and direction, with the predicted arrivals,
+    mean/median/max headway in seconds, and the number of bunched and gapped
+    headways, oldest first.
+    """
+    until = to_utc(until) if until else datetime.utcnow()
+    since = to_utc(since) if since else until - timedelta(hours=1)
+    query = {"route_id": route_id, "ts": {"$gte": since, "$lte": until}}
+    if direction is not None:
+        query["direction"] = direction
+    try:
+        cursor = db.route_headways.find(query, {"_id": 0, "processed_at": 0, "cycle_id": 0})
+        points = list(cursor.sort("ts", -1).limit(limit))
+    except Exception as e:
+        logger.error(f"Error fetching headways for route {route_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    points.reverse()
+    return points
+
+def archive_range(start, end):
+    """A checked (start, end) range of an archive query, as naive UTC"""
+    if not ARCHIVE_DIR:
+        raise HTTPException(status_code=503, detail="The Parquet archive is not configured (ARCHIVE_DIR)")
+    start, end = to_utc(start), to_utc(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    if end - start > timedelta(days=ARCHIVE_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Archive queries cover at most {ARCHIVE_MAX_DAYS} days")
+    return start, end
+
+@router.get("/archive/routes/activity")
+def get_archived_route_activity(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    route_id: Optional[str] = None,
+    interval: str = Query("day", regex="^(day|hour)$")
+):
+    """
+    Get vehicle observations, distinct vehicles and distinct trips per route
+    and day (or hour) from the Parquet archive, over up to ARCHIVE_MAX_DAYS.
+    """
+    start, end = archive_range(start, end)
+    try:
+        return route_activity(start, end, route_id, interval)
+    except Exception as e:
+        logger.error(f"Error querying archived route activity: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/archive/{dataset}")
+def get_archived_rows(
+    dataset: str,
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    columns: Optional[str] = None,
+    route_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=ARCHIVE_MAX_ROWS)
+):
+    """
+    Get archived rows of vehicle_positions, trip_updates, service_alerts or
+    elevator_outages between two instants, oldest first.
+    
+    Only the day (and route) partitions in range are opened, and only the
+    requested columns (comma-separated; default all) are read.
+    """
+    if dataset not in ARCHIVE_COLUMNS:
+        raise HTTPException(status_code=404, detail=f"Unknown archive dataset {dataset}")
+    start, end = archive_range(start, end)
+    selected = [column.strip() for column in columns.split(",") if column.strip()] if columns else list(ARCHIVE_COLUMNS[dataset])
+    unknown = [column for column in selected if column not in ARCHIVE_COLUMNS[dataset]]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown columns {unknown}; {dataset} has {', '.join(ARCHIVE_COLUMNS[dataset])}")
+    try:
+        return query_rows(dataset, start, end, selected, route_id, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error querying archived {dataset}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Sections of the dashboard bundle, in response order
+DASHBOARD_SECTIONS = ("summary", "status", "alerts", "route_stats")
+
+def dashboard_generation(db):
+    """
+    The generation of a dashboard snapshot: the vehicle ingest generation, the
+    newest alert change and, with change streams, the elevator outage tracking version.
+    """
+    return (current_generation(db), live_alert_index(db).synced_until, change_feed.version("elevator_reliability"))
+
+def dashboard_bundle(db, generation, sections, alerts_limit):
+    """
+    The requested dashboard sections, built together so the widgets show one consistent view.
+    """
+    counts = vehicle_counts(db) if "summary" in sections or "route_stats" in sections else None
+    index = live_alert_index(db)
+    builders = {
+        "summary": lambda: summary_stats(db, counts),
+        "status": lambda: system_status(index),
+        "alerts": lambda: active_alerts(index, limit=alerts_limit),
+        "route_stats": lambda: counts,
+    }
+    bundle = {"generation": generation[0] if generation else None}
+    for section in DASHBOARD_SECTIONS:
+        if section in sections:
+            bundle[section] = builders[section]()
+    return json_bytes(bundle)
+
+@router.get("/dashboard/bundle")
+def get_dashboard_bundle(
+    fields: Optional[str] = None,
+    alerts_limit: int = Query(5, ge=1, le=100),
+    db = Depends(get_db)
+):
+    """
+    Get the dashboard's summary, system status, top alerts and current
+    vehicles per route in one response.
+    
+    Each bundle is built once per ingest generation and shared by every
+    poll (and every worker); fields selects a comma-separated subset.
+    """
+    sections = [field.strip() for field in fields.split(",") if field.strip()] if fields else DASHBOARD_SECTIONS
+    unknown = [section for section in sections if section not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}; expected any of {', '.join(DASHBOARD_SECTIONS)}"
+        )
+    
+    try:
+        generation = bundle_cache.refresh(lambda: dashboard_generation(db))
+        key = (tuple(section for section in DASHBOARD_SECTIONS if section in sections), alerts_limit)
+        bundle, _ = bundle_cache.get_or_build(key, generation, lambda: dashboard_bundle(db, generation, key[0], alerts_limit))
+        return Response(content=bundle, media_type="application/json")
+    except Exception as e:
+        logger.error(f"Error fetching dashboard bundle: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+async def change_events(subscriber):
+    """
+    Server-sent events for one subscriber: a change event per burst of writes, keepalives in between.
+    """
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # Let the rest of an ingest cycle's writes land before telling the client
+            await asyncio.sleep(CHANGE_STREAM_COALESCE_SECONDS)
+            changed = change_feed.take(subscriber)
+            if changed:
+                yield f"event: change\ndata: {json.dumps({'collections': sorted(changed)})}\n\n"
+    finally:
+        change_feed.unsubscribe(subscriber)
+
+@router.get("/stream")
+async def stream_changes(collections: Optional[str] = None):
+    """
+    Stream server-sent events naming the collections that changed, so clients
+    refetch on new data instead of polling.
+    
+    collections selects a comma-separated subset of the watched collections
+    (default: all). Returns 503 while MongoDB change streams are unavailable.
+    """
+    names = [name.strip() for name in collections.split(",") if name.strip()] if collections else WATCHED_COLLECTIONS
+    unknown = [name for name in names if name not in WATCHED_COLLECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown collections: {', '.join(unknown)}; expected any of {', '.join(WATCHED_COLLECTIONS)}"
+        )
+    if not change_feed.active:
+        raise HTTPException(status_code=503, detail="Change streams are unavailable; poll instead")
+    
+    return StreamingResponse(
+        change_events(change_feed.subscribe(names)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,130 @@
+"""
+In-memory search over elevator and escalator equipment.
+
+Station names, boroughs and equipment types are normalized (accents stripped,
+lowercased, punctuation collapsed to single spaces) and station names are
+indexed by trigram, so a case-insensitive substring query intersects a few
+posting sets and verifies the candidates instead of scanning every document
+with an unanchored regex. User input is only ever compared as a plain string.
+
+The index is rebuilt whenever the equipment collection is refreshed: the
+newest processed_at in elevator_equipment is checked whenever the change
+stream reports a write to it, or at most every EQUIPMENT_SEARCH_CHECK_SECONDS
+while change streams are unavailable.
+"""
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import defaultdict
+
+# How often the equipment collection is checked for a refresh
+EQUIPMENT_SEARCH_CHECK_SECONDS = float(os.getenv('EQUIPMENT_SEARCH_CHECK_SECONDS', 30))
+
+def normalize(text):
+    """Lowercase text without accents, with runs of other characters collapsed to one space"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'[a-z0-9]+', stripped.lower()))
+
+def trigrams(text):
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+class SubstringIndex:
+    """Trigram index answering substring queries over a list of normalized texts"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        postings = defaultdict(set)
+        for position, text in enumerate(texts):
+            for gram in trigrams(text):
+                postings[gram].add(position)
+        self.postings = dict(postings)
+
+    def search(self, query):
+        """Positions of the texts containing the normalized query"""
+        if len(query) < 3:
+            return [position for position, text in enumerate(self.texts) if query in text]
+        posting_sets = sorted((self.postings.get(gram, set()) for gram in trigrams(query)), key=len)
+        candidates = set.intersection(*posting_sets)
+        return sorted(position for position in candidates if query in self.texts[position])
+
+class EquipmentIndex:
+    """Immutable snapshot of the equipment list and its search indexes"""
+
+    def __init__(self, equipment):
+        self.equipment = equipment
+        self.station_equipment = self.group_by(equipment, 'station')
+        self.borough_equipment = self.group_by(equipment, 'borough')
+        self.type_equipment = self.group_by(equipment, 'equipment_type')
+        self.stations = list(self.station_equipment)
+        self.station_index = SubstringIndex(self.stations)
+
+    @staticmethod
+    def group_by(equipment, field):
+        """{normalized value: [equipment positions]} for one field"""
+        groups = defaultdict(list)
+        for position, item in enumerate(equipment):
+            groups[normalize(item.get(field))].append(position)
+        return dict(groups)
+
+    def matching_stations(self, query):
+        return [self.stations[position] for position in self.station_index.search(normalize(query))]
+
+    @staticmethod
+    def matching_values(groups, query):
+        # Boroughs and equipment types have a handful of distinct values; scan those
+        query = normalize(query)
+        return [value for value in groups if query in value]
+
+    def match(self, station=None, borough=None, equipment_type=None):
+        """Positions of the equipment whose fields contain each given query, in collection order"""
+        selected = None
+        for groups, values in (
+            (self.station_equipment, station is not None and self.matching_stations(station)),
+            (self.borough_equipment, borough is not None and self.matching_values(self.borough_equipment, borough)),
+            (self.type_equipment, equipment_type is not None and self.matching_values(self.type_equipment, equipment_type)),
+        ):
+            if values is False:
+                continue
+            matched = {position for value in values for position in groups[value]}
+            selected = matched if selected is None else selected & matched
+        return range(len(self.equipment)) if selected is None else sorted(selected)
+
+class EquipmentSearch:
+    """Equipment search index, rebuilt whenever elevator_equipment is refreshed"""
+
+    def __init__(self, check_seconds=EQUIPMENT_SEARCH_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self.index = EquipmentIndex([])
+        self.generation = None
+        self.checked_at = 0.0
+        # Change-stream version of elevator_equipment at the last check
+        self.version = None
+        self._lock = threading.Lock()
+
+    def is_current(self, version):
+        if version is not None:
+            return version == self.version
+        return time.monotonic() - self.checked_at < self.check_seconds
+
+    def refresh(self, collection, version=None):
+        """
+        Rebuild the index if the collection changed since the last check; returns the current index.
+        With a change-stream version the collection is checked only when the version moved,
+        otherwise at most every check_seconds.
+        """
+        if self.is_current(version):
+            return self.index
+        with self._lock:
+            if self.is_current(version):
+                return self.index
+            self.version = version
+            newest = collection.find_one({}, {'processed_at': 1}, sort=[('processed_at', -1)])
+            generation = newest.get('processed_at') if newest else None
+            if generation != self.generation or self.generation is None:
+                self.index = EquipmentIndex(list(collection.find({}, {'_id': 0})))
+                self.generation = generation
+            self.checked_at = time.monotonic()
+        return self.index
@@ -0,0 +1,123 @@
+"""
+Response cache shared by the API worker processes of one host.
+
+In the multi-worker serving mode (API_WORKERS > 1) every worker would otherwise
+keep its own per-generation cache and query MongoDB for the same tiles and
+bundles. Instead, serialized responses are kept as files under
+API_SHARED_CACHE_DIR (tmpfs by default), in one directory per ingest
+generation. The first worker to miss a key takes an exclusive flock on its file
+and builds it; the other workers block on the same lock and then read the
+finished entry, so each key is built once per generation however many workers
+there are. The current generation is shared the same way: one worker looks it
+up per check interval and the others read it from a file.
+"""
+import os
+import time
+import fcntl
+import pickle
+import shutil
+import hashlib
+import logging
+import struct
+
+from tiles import GenerationCache, TILE_GENERATION_CHECK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Worker processes serving the API; more than one switches to the shared cache
+API_WORKERS = int(os.getenv('API_WORKERS', 1))
+
+# Directory of the shared cache files, on tmpfs so entries never touch disk
+API_SHARED_CACHE_DIR = os.getenv('API_SHARED_CACHE_DIR', '/dev/shm/mta-api-cache')
+
+# Entries are prefixed with their length, so a write cut short is read as missing
+LENGTH = struct.Struct('<Q')
+
+def file_key(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+def read_entry(fd):
+    """The payload of a cache file, or None if it is empty or incomplete"""
+    header = os.pread(fd, LENGTH.size, 0)
+    if len(header) < LENGTH.size:
+        return None
+    length, = LENGTH.unpack(header)
+    payload = os.pread(fd, length, LENGTH.size)
+    return payload if len(payload) == length else None
+
+def write_entry(fd, payload):
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, LENGTH.pack(len(payload)) + payload, 0)
+
+class SharedGenerationCache:
+    """Per-generation cache of serialized responses, shared by worker processes through flock-ed files"""
+
+    def __init__(self, name, check_seconds):
+        self.directory = os.path.join(API_SHARED_CACHE_DIR, name)
+        self.check_seconds = check_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def refresh(self, load_generation):
+        """The current generation, looked up by one worker at most every check_seconds"""
+        fd = os.open(os.path.join(self.directory, 'generation'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            entry = read_entry(fd)
+            if entry is not None:
+                checked_at, generation = pickle.loads(entry)
+                if time.time() - checked_at < self.check_seconds:
+                    return generation
+
+            # Stale: the first worker here looks it up, the others wait for it and reread
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            entry = read_entry(fd)
+            previous = None
+            if entry is not None:
+                checked_at, previous = pickle.loads(entry)
+                if time.time() - checked_at < self.check_seconds:
+                    return previous
+            generation = load_generation()
+            write_entry(fd, pickle.dumps((time.time(), generation)))
+            if generation != previous:
+                self.remove_other_generations(generation)
+            return generation
+        finally:
+            os.close(fd)
+
+    def remove_other_generations(self, generation):
+        """Drop the entries of earlier generations"""
+        current = file_key(generation)
+        for name in os.listdir(self.directory):
+            if name not in ('generation', current):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def get_or_build(self, key, generation, build):
+        """Return (serialized response, hit), building it in at most one worker per generation"""
+        directory = os.path.join(self.directory, file_key(generation))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(os.path.join(directory, file_key(key)), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            body = read_entry(fd)
+            if body is not None:
+                return body, True
+
+            # Missing: the first worker here builds it, the others wait for it and reread
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            body = read_entry(fd)
+            if body is not None:
+                return body, True
+            body = build()
+            write_entry(fd, body)
+            return body, False
+        finally:
+            os.close(fd)
+
+def response_cache(name, **options):
+    """A generation cache for serialized responses: shared across workers when there are several"""
+    if API_WORKERS > 1:
+        try:
+            return SharedGenerationCache(name, options.get('check_seconds', TILE_GENERATION_CHECK_SECONDS))
+        except OSError as e:
+            logger.error(f"Shared cache directory {API_SHARED_CACHE_DIR} unavailable, caching per worker: {e}")
+    return GenerationCache(**options)
@@ -0,0 +1,245 @@
+"""
+Live vehicle and alert state, consumed from the producer's compacted Kafka topics.
+
+With STATE_STORE_ENABLED the API reads the latest-state topics from the
+beginning at startup and then follows them on a background thread, so
+/vehicles, /alerts and /system/status are answered from memory and MongoDB
+only serves history. Until the store has caught up with the high watermarks
+the topics had at startup, those endpoints keep reading MongoDB.
+
+Vehicles live in array-backed columns whose slots are reused after deletes,
+with secondary indexes from route and line to slots. Alerts are applied to an
+AlertIndex of their own, the same structure the MongoDB mirror uses.
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import threading
+from array import array
+from collections import defaultdict
+from datetime import datetime
+
+from confluent_kafka import Consumer, TopicPartition, OFFSET_BEGINNING
+
+from alerts import AlertIndex
+
+logger = logging.getLogger(__name__)
+
+# Serve live views from the Kafka state topics instead of MongoDB
+STATE_STORE_ENABLED = os.getenv('STATE_STORE_ENABLED', 'false').lower() == 'true'
+
+# Kafka connection and the producer's compacted latest-state topics
+KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
+KAFKA_TOPIC_VEHICLE_STATE = os.getenv('KAFKA_TOPIC_VEHICLE_STATE', 'mta-vehicle-state')
+KAFKA_TOPIC_ALERT_STATE = os.getenv('KAFKA_TOPIC_ALERT_STATE', 'mta-alert-state')
+
+# Messages applied per poll
+STATE_STORE_BATCH_SIZE = int(os.getenv('STATE_STORE_BATCH_SIZE', 500))
+
+# Earth radius MongoDB uses for spherical distances, so radius queries match $nearSphere
+EARTH_RADIUS_METERS = 6378100.0
+
+def distance_meters(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, by the haversine formula"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+class VehicleStore:
+    """Latest vehicle documents in reusable slots, indexed by route and line"""
+
+    def __init__(self):
+        # Key (vehicle id, or entity id for vehicles without one) -> slot
+        self.slots = {}
+        self.free = []
+        # Columns per slot; deleted slots hold NaN coordinates and no document
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.route_ids = []
+        self.line_ids = []
+        self.docs = []
+        self.by_route = defaultdict(set)
+        self.by_line = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def allocate(self):
+        self.latitudes.append(math.nan)
+        self.longitudes.append(math.nan)
+        self.route_ids.append(None)
+        self.line_ids.append(None)
+        self.docs.append(None)
+        return len(self.docs) - 1
+
+    def unindex(self, slot):
+        for index, value in ((self.by_route, self.route_ids[slot]), (self.by_line, self.line_ids[slot])):
+            index[value].discard(slot)
+            if not index[value]:
+                del index[value]
+
+    def put(self, key, doc):
+        """Insert or replace the vehicle stored under key"""
+        with self._lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self.free.pop() if self.free else self.allocate()
+                self.slots[key] = slot
+            else:
+                self.unindex(slot)
+            latitude, longitude = doc.get('latitude'), doc.get('longitude')
+            self.latitudes[slot] = math.nan if latitude is None else latitude
+            self.longitudes[slot] = math.nan if longitude is None else longitude
+            self.route_ids[slot] = sys.intern(doc.get('route_id') or '')
+            self.line_ids[slot] = sys.intern(doc.get('line_id') or '')
+            self.by_route[self.route_ids[slot]].add(slot)
+            self.by_line[self.line_ids[slot]].add(slot)
+            self.docs[slot] = doc
+
+    def delete(self, key):
+        """Remove the vehicle stored under key, if any"""
+        with self._lock:
+            slot = self.slots.pop(key, None)
+            if slot is None:
+                return
+            self.unindex(slot)
+            self.latitudes[slot] = self.longitudes[slot] = math.nan
+            self.docs[slot] = None
+            self.free.append(slot)
+
+    def routes(self):
+        """Route ids that currently have vehicles"""
+        with self._lock:
+            return list(self.by_route)
+
+    def query(self, route_ids=None, bbox=None, near=None, limit=100):
+        """
+        Up to limit vehicle documents on any of route_ids (all routes if None),
+        inside bbox (min_lon, min_lat, max_lon, max_lat) if given, or within
+        near (lat, lon, radius in meters) if given, nearest first.
+        """
+        with self._lock:
+            if route_ids is None:
+                slots = [slot for slot, doc in enumerate(self.docs) if doc is not None]
+            else:
+                slots = sorted(set().union(*(self.by_route.get(route_id, ()) for route_id in route_ids)))
+
+            # NaN coordinates fail every comparison, so vehicles without a position drop out
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                slots = [
+                    slot for slot in slots
+                    if min_lon <= self.longitudes[slot] <= max_lon and min_lat <= self.latitudes[slot] <= max_lat
+                ]
+            if near is not None:
+                latitude, longitude, radius = near
+                distances = [
+                    (distance_meters(latitude, longitude, self.latitudes[slot], self.longitudes[slot]), slot)
+                    for slot in slots
+                    if not math.isnan(self.latitudes[slot])
+                ]
+                slots = [slot for distance, slot in sorted(distances) if distance <= radius]
+
+            return [self.docs[slot] for slot in slots[:limit]]
+
+class StateStore:
+    """Follows the latest-state topics into a VehicleStore and an AlertIndex"""
+
+    def __init__(self):
+        self.vehicles = VehicleStore()
+        self.alerts = AlertIndex()
+        # True once the topics have been read up to where they stood at startup
+        self.ready = False
+        self.thread = None
+
+    def start(self):
+        """Start following the topics on a daemon thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='state-store', daemon=True)
+            self.thread.start()
+
+    def apply(self, message, vehicles, alerts):
+        """Apply a state message to a vehicle store and an alert index"""
+        key = message.key().decode('utf-8')
+        value = message.value()
+        doc = json.loads(value) if value is not None else None
+        if message.topic() == KAFKA_TOPIC_VEHICLE_STATE:
+            if doc is None:
+                vehicles.delete(key)
+            else:
+                vehicles.put(key, doc)
+        else:
+            # A tombstone resolves the alert
+            alerts.apply(doc if doc is not None else {'id': key, 'resolved': True})
+
+    def run(self):
+        """Consume the topics forever, reconnecting after errors"""
+        while True:
+            try:
+                self.consume()
+            except Exception as e:
+                logger.error(f"State store consumer failed, restarting: {e}")
+                time.sleep(5)
+
+    def consume(self):
+        # Replaying the topics passes through older states; serve MongoDB until caught up again.
+        # The replay fills new stores, swapped in once caught up: keys whose tombstones were
+        # compacted away since the last replay must not survive from the previous stores
+        self.ready = False
+        vehicles, alerts = VehicleStore(), AlertIndex()
+        consumer = Consumer({
+            'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
+            'group.id': 'mta-api-state-store',
+            'enable.auto.commit': False,
+        })
+        try:
+            # Every API process reads whole topics, so partitions are assigned rather than balanced in a group
+            partitions = []
+            for topic in (KAFKA_TOPIC_VEHICLE_STATE, KAFKA_TOPIC_ALERT_STATE):
+                metadata = consumer.list_topics(topic, timeout=10)
+                partitions += [TopicPartition(topic, partition, OFFSET_BEGINNING) for partition in metadata.topics[topic].partitions]
+
+            # Offsets to reach before the store reflects the topics
+            pending = {}
+            for partition in partitions:
+                low, high = consumer.get_watermark_offsets(partition, timeout=10)
+                if high > low:
+                    pending[(partition.topic, partition.partition)] = high
+            consumer.assign(partitions)
+            logger.info(f"State store loading {sum(pending.values())} messages from {len(partitions)} partitions")
+
+            while True:
+                messages = consumer.consume(STATE_STORE_BATCH_SIZE, timeout=1.0)
+                alerts_changed = False
+                for message in messages:
+                    if message.error():
+                        logger.error(f"State store consumer error: {message.error()}")
+                        continue
+                    self.apply(message, vehicles, alerts)
+                    alerts_changed |= message.topic() == KAFKA_TOPIC_ALERT_STATE
+                    target = pending.get((message.topic(), message.partition()))
+                    if target is not None and message.offset() + 1 >= target:
+                        del pending[(message.topic(), message.partition())]
+
+                # Compaction can remove the last offsets; an idle partition at its target is loaded too
+                if pending and not messages:
+                    for position in consumer.position([TopicPartition(topic, partition) for topic, partition in pending]):
+                        if position.offset >= pending[(position.topic, position.partition)]:
+                            del pending[(position.topic, position.partition)]
+
+                # Mark the alert change for caches keyed on the alert generation
+                if alerts_changed:
+                    alerts.synced_until = datetime.utcnow()
+
+                if not self.ready and not pending:
+                    alerts.synced_until = datetime.utcnow()
+                    self.vehicles, self.alerts = vehicles, alerts
+                    self.ready = True
+                    logger.info(f"State store ready with {len(vehicles)} vehicles and {len(alerts.alerts)} alerts")
+        finally:
+            consumer.close()
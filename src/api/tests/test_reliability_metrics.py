@@ -0,0 +1,43 @@
+"""Availability, MTBF and MTTR from the producer's running reliability totals"""
+from datetime import datetime
+
+from reliability import epoch_seconds, reliability, outage_intervals
+
+NOW = datetime(2025, 5, 11, 12, 0)
+
+def test_reliability_from_totals():
+    now = epoch_seconds(NOW)
+    # Two pieces of equipment tracked for 1000 s; one closed outage of 100 s and one open for 50 s
+    totals = {
+        'equipment': 2, 'tracked_since_sum': 2 * (now - 1000), 'outages': 2, 'planned_outages': 1,
+        'closed_outages': 1, 'repair_seconds': 100, 'open_outages': 1, 'open_since_sum': now - 50,
+    }
+    assert reliability(totals, NOW) == {
+        'observed_seconds': 2000,
+        'downtime_seconds': 150,
+        'availability': 1 - 150 / 2000,
+        'mtbf_seconds': (2000 - 150) / 2,
+        'mttr_seconds': 100,
+        'outages': 2,
+        'planned_outages': 1,
+        'open_outages': 1,
+    }
+
+def test_reliability_without_history():
+    result = reliability({}, NOW)
+    assert result['availability'] is None
+    assert result['mtbf_seconds'] is None
+    assert result['mttr_seconds'] is None
+
+def test_outage_intervals_pair_events_newest_first():
+    events = [
+        {'event': 'opened', 'at': datetime(2025, 5, 11, 11, 50), 'planned': True, 'reason': 'Capital Replacement'},
+        {'event': 'closed', 'at': datetime(2025, 5, 11, 11, 0)},
+        {'event': 'opened', 'at': datetime(2025, 5, 11, 10, 30), 'reason': 'Repair'},
+    ]
+    assert outage_intervals(events, NOW) == [
+        {'start': datetime(2025, 5, 11, 11, 50), 'end': None, 'duration_seconds': 600,
+         'planned': True, 'reason': 'Capital Replacement'},
+        {'start': datetime(2025, 5, 11, 10, 30), 'end': datetime(2025, 5, 11, 11, 0), 'duration_seconds': 1800,
+         'planned': False, 'reason': 'Repair'},
+    ]
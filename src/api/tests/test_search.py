@@ -0,0 +1,33 @@
+"""Trigram substring search over normalized equipment fields"""
+from search import SubstringIndex, EquipmentIndex, normalize
+
+def test_normalize_strips_accents_case_and_punctuation():
+    assert normalize('Times Sq-42 St') == 'times sq 42 st'
+    assert normalize('  Café / Métro  ') == 'cafe metro'
+    assert normalize(None) == ''
+
+def test_substring_search_returns_matching_positions():
+    index = SubstringIndex(['times sq 42 st', '42 st bryant pk', 'grand central 42 st', 'fulton st'])
+    assert index.search('42 st') == [0, 1, 2]
+    assert index.search('central') == [2]
+    assert index.search('st') == [0, 1, 2, 3]
+    assert index.search('') == [0, 1, 2, 3]
+    assert index.search('zzz') == []
+
+def test_substring_search_verifies_trigram_candidates():
+    # Both trigrams of 'abcd' occur in the first text, but not next to each other
+    index = SubstringIndex(['abc xbcd', 'zabcdz'])
+    assert index.search('abcd') == [1]
+
+def test_equipment_match_combines_fields():
+    index = EquipmentIndex([
+        {'equipment_id': 'EL1', 'station': 'Times Sq-42 St', 'borough': 'Manhattan', 'equipment_type': 'EL'},
+        {'equipment_id': 'ES1', 'station': 'Times Sq-42 St', 'borough': 'Manhattan', 'equipment_type': 'ES'},
+        {'equipment_id': 'EL2', 'station': '42 St-Bryant Pk', 'borough': 'Manhattan', 'equipment_type': 'EL'},
+        {'equipment_id': 'EL3', 'station': 'Court Sq', 'borough': 'Queens', 'equipment_type': 'EL'},
+    ])
+    assert list(index.match(station='42 ST')) == [0, 1, 2]
+    assert list(index.match(station='times sq', equipment_type='el')) == [0]
+    assert list(index.match(station='sq', borough='queens')) == [3]
+    assert list(index.match(station='nowhere')) == []
+    assert list(index.match()) == [0, 1, 2, 3]
@@ -0,0 +1,58 @@
+"""Tile bounds and the vehicle conditions of tile_filter"""
+import operator
+
+import pytest
+
+from tiles import INDEXED_MIN_ZOOM, tile_bounds, tile_filter
+
+OPERATORS = {'$gte': operator.ge, '$gt': operator.gt, '$lt': operator.lt, '$lte': operator.le}
+
+def in_tile(match, longitude, latitude):
+    """Whether a point satisfies a tile filter's coordinate ranges"""
+    coordinates = {'location.coordinates.0': longitude, 'location.coordinates.1': latitude}
+    return all(
+        OPERATORS[op](coordinates[field], bound)
+        for field, condition in match.items() if field in coordinates
+        for op, bound in condition.items()
+    )
+
+def test_tile_bounds():
+    assert tile_bounds(0, 0, 0) == pytest.approx((-180, -85.0511287798, 180, 85.0511287798))
+    west, south, east, north = tile_bounds(1, 1, 0)
+    assert (west, east) == (0, 180)
+    assert south == pytest.approx(0, abs=1e-9)
+
+@pytest.mark.parametrize('z', [3, INDEXED_MIN_ZOOM + 2])
+def test_points_on_shared_edges_belong_to_one_tile(z):
+    tiles = {(x, y): tile_bounds(z, x, y) for x in (4, 5) for y in (2, 3)}
+    matches = {tile: tile_filter(bounds, z) for tile, bounds in tiles.items()}
+    # The corner shared by the four tiles, points on each shared edge and inside each tile
+    west, _, _, north = tiles[(4, 2)]
+    edge_longitude, south, east, edge_latitude = tiles[(5, 3)]
+    points = [(edge_longitude, edge_latitude)]
+    points += [(edge_longitude, (edge_latitude + north) / 2), (edge_longitude, (edge_latitude + south) / 2)]
+    points += [((west + edge_longitude) / 2, edge_latitude), ((edge_longitude + east) / 2, edge_latitude)]
+    points += [((west + edge_longitude) / 2, (edge_latitude + north) / 2), ((edge_longitude + east) / 2, (south + edge_latitude) / 2)]
+    for longitude, latitude in points:
+        owners = [tile for tile, match in matches.items() if in_tile(match, longitude, latitude)]
+        assert len(owners) == 1, (longitude, latitude, owners)
+
+    # Edge points go to the tile east or south of the edge
+    assert [tile for tile, match in matches.items() if in_tile(match, edge_longitude, edge_latitude)] == [(5, 3)]
+
+def test_low_zoom_filter_uses_coordinate_ranges_only():
+    assert 'location' not in tile_filter(tile_bounds(2, 1, 1), 2)
+
+def test_indexed_zoom_adds_a_padded_polygon_clamped_to_the_world():
+    z = INDEXED_MIN_ZOOM
+    west, south, east, north = tile_bounds(z, 0, 0)
+    polygon = tile_filter((west, south, east, north), z)['location']['$geoWithin']['$geometry']
+    assert polygon['type'] == 'Polygon'
+    ring = polygon['coordinates'][0]
+    assert ring[0] == ring[-1]
+    longitudes = [point[0] for point in ring]
+    latitudes = [point[1] for point in ring]
+    assert min(longitudes) == -180
+    assert max(longitudes) == pytest.approx(east + (east - west) * 0.1)
+    assert min(latitudes) == pytest.approx(south - (north - south) * 0.1)
+    assert max(latitudes) <= 90
@@ -0,0 +1,155 @@
+"""
+Server-side clustering of vehicle positions into web-map tiles.
+
+Tiles use the slippy-map z/x/y scheme Leaflet and OpenStreetMap use. Each
+tile is split into a TILE_GRID_SIZE x TILE_GRID_SIZE grid and MongoDB groups
+the vehicles inside it per grid cell, so a tile's payload is bounded by the
+grid no matter how many vehicles it covers.
+
+Clustered tiles are cached per ingest generation: the newest processed_at in
+latest_vehicle_positions. A new producer or processor write starts a new
+generation and drops the cache, so between writes every tile is computed once.
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+
+# Tile configuration
+TILE_GRID_SIZE = int(os.getenv('TILE_GRID_SIZE', 8))
+TILE_MAX_ZOOM = int(os.getenv('TILE_MAX_ZOOM', 18))
+TILE_CACHE_MAX_ENTRIES = int(os.getenv('TILE_CACHE_MAX_ENTRIES', 2048))
+# How often the current ingest generation is looked up in MongoDB
+TILE_GENERATION_CHECK_SECONDS = float(os.getenv('TILE_GENERATION_CHECK_SECONDS', 1))
+
+# Lowest zoom at which tile queries use the 2dsphere index
+INDEXED_MIN_ZOOM = 6
+
+def tile_bounds(z, x, y):
+    """Return (west, south, east, north) in degrees for slippy-map tile z/x/y"""
+    tiles = 2 ** z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / tiles))))
+
+    return x / tiles * 360 - 180, latitude(y + 1), (x + 1) / tiles * 360 - 180, latitude(y)
+
+def tile_filter(bounds, z):
+    """
+    Query conditions selecting the vehicles whose location lies in bounds.
+
+    Coordinate ranges give exact, half-open tile edges, so a vehicle on a
+    shared edge is counted once (in the tile east or south of it). From zoom
+    INDEXED_MIN_ZOOM on, a slightly padded polygon also lets the 2dsphere
+    index narrow the scan; at lower zooms geodesic polygon edges stray too far
+    from the tile's edges.
+    """
+    west, south, east, north = bounds
+    match = {
+        'location.coordinates.0': {'$gte': west, '$lt': east},
+        'location.coordinates.1': {'$gt': south, '$lte': north},
+    }
+    if z >= INDEXED_MIN_ZOOM:
+        pad_x = (east - west) * 0.1
+        pad_y = (north - south) * 0.1
+        west, east = max(-180, west - pad_x), min(180, east + pad_x)
+        south, north = max(-90, south - pad_y), min(90, north + pad_y)
+        match['location'] = {'$geoWithin': {'$geometry': {
+            'type': 'Polygon',
+            'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]
+        }}}
+    return match
+
+def cluster_pipeline(match, bounds, grid_size=TILE_GRID_SIZE):
+    """
+    Aggregation grouping the matched vehicles into a grid_size x grid_size grid
+    over bounds, one document per occupied cell.
+    """
+    west, south, east, north = bounds
+    longitude = {'$arrayElemAt': ['$location.coordinates', 0]}
+    latitude = {'$arrayElemAt': ['$location.coordinates', 1]}
+
+    def cell(value, low, high):
+        # Vehicles on the east/north edge belong to the last cell
+        index = {'$floor': {'$multiply': [{'$subtract': [value, low]}, grid_size / (high - low)]}}
+        return {'$max': [0, {'$min': [grid_size - 1, index]}]}
+
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': {'column': cell(longitude, west, east), 'row': cell(latitude, south, north)},
+            'count': {'$sum': 1},
+            'latitude': {'$avg': latitude},
+            'longitude': {'$avg': longitude},
+            'routes': {'$addToSet': '$route_id'},
+            'id': {'$first': '$id'},
+            'route_id': {'$first': '$route_id'},
+        }},
+    ]
+
+def cluster_from_doc(doc):
+    """
+    Convert a grouped grid cell to a cluster; single-vehicle cells keep the
+    vehicle's id and route so the map can draw a regular marker.
+    """
+    cluster = {
+        'latitude': round(doc['latitude'], 6),
+        'longitude': round(doc['longitude'], 6),
+        'count': doc['count'],
+    }
+    if doc['count'] == 1:
+        cluster['id'] = doc['id']
+        cluster['route_id'] = doc['route_id']
+    else:
+        cluster['routes'] = sorted(route for route in doc['routes'] if route)
+    return cluster
+
+class GenerationCache:
+    """LRU cache of computed responses, emptied whenever the ingest generation changes"""
+
+    def __init__(self, max_entries=TILE_CACHE_MAX_ENTRIES, check_seconds=TILE_GENERATION_CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self.generation = None
+        self.checked_at = 0.0
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def refresh(self, load_generation):
+        """Look up the current generation at most every check_seconds; returns it"""
+        now = time.monotonic()
+        if now - self.checked_at < self.check_seconds:
+            return self.generation
+        generation = load_generation()
+        with self._lock:
+            self.checked_at = now
+            if generation != self.generation:
+                self.generation = generation
+                self.entries.clear()
+        return generation
+
+    def get(self, key):
+        with self._lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, generation, value):
+        """Store value computed for generation, unless a newer generation has started"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_build(self, key, generation, build):
+        """Return (value, hit), building and storing the value on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = build()
+        self.put(key, generation, value)
+        return value, False
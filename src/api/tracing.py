@@ -0,0 +1,22 @@
+"""
+OpenTelemetry tracing for the MTA API.
+
+Every request runs in a span whose trace id is returned in the X-Trace-Id
+header. Endpoints serving pipeline data add the age of the newest feed
+timestamp, the ingest delay and the producer cycle ids behind the response.
+Exporters are set up by common.tracing; TRACE_FILE defaults to
+traces/api.jsonl.
+"""
+import os
+from opentelemetry import trace
+
+from common import tracing
+from common.tracing import current_trace_id
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces/api.jsonl')
+
+tracer = trace.get_tracer('mta.api')
+
+def setup_tracing(service_name):
+    """Install the global tracer provider for the API"""
+    tracing.setup_tracing(service_name, TRACE_FILE)
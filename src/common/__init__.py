@@ -0,0 +1,7 @@
+"""
+Modules shared by the producer, processor and API.
+
+Every image copies this package to /opt/mta/common and puts /opt/mta on
+PYTHONPATH, so the services import it as common.<module>. Outside Docker, run
+the services and benchmarks with src on PYTHONPATH.
+"""
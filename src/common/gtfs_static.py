@@ -0,0 +1,340 @@
+"""
+Static GTFS index: stops, routes, trips and shapes from a GTFS zip.
+
+The zip's tables are compiled once into a binary cache file (GTFS_STATIC_CACHE)
+of sorted key tables and flat arrays, which is memory-mapped at startup.
+Lookups binary-search the mapped keys and read names and coordinates straight
+from the mapped arrays, so loading takes milliseconds and every process mapping
+the same file shares its pages. The cache is rebuilt when the zip's size or
+modification time changes.
+
+If GTFS_STATIC_PATH does not exist and GTFS_STATIC_URL is set, the zip is
+downloaded first. Run this module directly to download and build the cache
+ahead of time:
+
+    PYTHONPATH=src python -m common.gtfs_static
+"""
+import io
+import os
+import sys
+import csv
+import json
+import mmap
+import struct
+import logging
+import zipfile
+import tempfile
+import urllib.request
+from array import array
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Static GTFS configuration
+GTFS_STATIC_PATH = os.getenv('GTFS_STATIC_PATH', 'gtfs/gtfs_subway.zip')
+GTFS_STATIC_CACHE = os.getenv('GTFS_STATIC_CACHE', '') or GTFS_STATIC_PATH + '.idx'
+GTFS_STATIC_URL = os.getenv('GTFS_STATIC_URL', 'https://rrgtfsfeeds.s3.amazonaws.com/gtfs_subway.zip')
+
+CACHE_MAGIC = b'MTAGTFS1'
+CACHE_ALIGNMENT = 8
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus an offsets array; keys tables are sorted for binary search"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index):
+        return self.raw(index).decode('utf-8')
+
+    def find(self, key):
+        """Index of key in a sorted table, or -1"""
+        target = key.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self.raw(low) == target else -1
+
+def string_table_sections(name, values):
+    """Sections for a string table: '<name>.offsets' and '<name>.data'"""
+    offsets = array('I', [0])
+    data = bytearray()
+    for value in values:
+        data += (value or '').encode('utf-8')
+        offsets.append(len(data))
+    return [(f"{name}.offsets", offsets), (f"{name}.data", array('B', data))]
+
+def read_table(archive, name):
+    """Rows of a GTFS table as dicts, or an empty list if the zip lacks it"""
+    if name not in archive.namelist():
+        return []
+    with archive.open(name) as raw:
+        return list(csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig')))
+
+def sorted_by_key(rows, key):
+    """Rows with a key, sorted by the UTF-8 bytes of the key (the order StringTable.find expects)"""
+    return sorted((row for row in rows if row.get(key)), key=lambda row: row[key].encode('utf-8'))
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+def build_sections(zip_path):
+    """Read the GTFS zip into a list of (section name, array) pairs"""
+    with zipfile.ZipFile(zip_path) as archive:
+        stops = sorted_by_key(read_table(archive, 'stops.txt'), 'stop_id')
+        routes = sorted_by_key(read_table(archive, 'routes.txt'), 'route_id')
+        trips = sorted_by_key(read_table(archive, 'trips.txt'), 'trip_id')
+        shape_points = defaultdict(list)
+        for row in read_table(archive, 'shapes.txt'):
+            shape_points[row['shape_id']].append((
+                int(row.get('shape_pt_sequence') or 0),
+                to_float(row.get('shape_pt_lat')),
+                to_float(row.get('shape_pt_lon'))
+            ))
+
+    stop_index = {row['stop_id']: index for index, row in enumerate(stops)}
+    route_index = {row['route_id']: index for index, row in enumerate(routes)}
+    shape_ids = sorted(shape_points, key=lambda shape_id: shape_id.encode('utf-8'))
+    shape_index = {shape_id: index for index, shape_id in enumerate(shape_ids)}
+
+    shape_offsets = array('I', [0])
+    shape_lat = array('d')
+    shape_lon = array('d')
+    for shape_id in shape_ids:
+        for _, lat, lon in sorted(shape_points[shape_id]):
+            shape_lat.append(lat)
+            shape_lon.append(lon)
+        shape_offsets.append(len(shape_lat))
+
+    sections = []
+    sections += string_table_sections('stops.keys', [row['stop_id'] for row in stops])
+    sections += string_table_sections('stops.names', [row.get('stop_name') for row in stops])
+    sections += [
+        ('stops.lat', array('d', [to_float(row.get('stop_lat')) for row in stops])),
+        ('stops.lon', array('d', [to_float(row.get('stop_lon')) for row in stops])),
+        ('stops.parent', array('i', [stop_index.get(row.get('parent_station'), -1) for row in stops])),
+    ]
+    sections += string_table_sections('routes.keys', [row['route_id'] for row in routes])
+    sections += string_table_sections('routes.short_names', [row.get('route_short_name') for row in routes])
+    sections += string_table_sections('routes.long_names', [row.get('route_long_name') for row in routes])
+    sections += string_table_sections('routes.colors', [row.get('route_color') for row in routes])
+    sections += string_table_sections('trips.keys', [row['trip_id'] for row in trips])
+    sections += string_table_sections('trips.headsigns', [row.get('trip_headsign') for row in trips])
+    sections += [
+        ('trips.route', array('i', [route_index.get(row.get('route_id'), -1) for row in trips])),
+        ('trips.shape', array('i', [shape_index.get(row.get('shape_id'), -1) for row in trips])),
+    ]
+    sections += string_table_sections('shapes.keys', shape_ids)
+    sections += [
+        ('shapes.offsets', shape_offsets),
+        ('shapes.lat', shape_lat),
+        ('shapes.lon', shape_lon),
+    ]
+    return sections
+
+def source_signature(zip_path):
+    """Size and modification time identifying the zip a cache was built from"""
+    stat = os.stat(zip_path)
+    return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+def build_cache(zip_path, cache_path):
+    """Compile the GTFS zip into the cache file, replacing it atomically"""
+    sections = build_sections(zip_path)
+    layout = {}
+    offset = 0
+    for name, values in sections:
+        length = len(values) * values.itemsize
+        layout[name] = [offset, length, values.typecode]
+        offset += -(-length // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+    header = json.dumps({
+        'source': source_signature(zip_path),
+        'byteorder': sys.byteorder,
+        'sections': layout
+    }).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as output:
+        output.write(CACHE_MAGIC + struct.pack('<I', len(header)) + header)
+        data_start = -(-output.tell() // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+        for name, values in sections:
+            output.seek(data_start + layout[name][0])
+            values.tofile(output)
+        output.truncate(data_start + offset)
+    os.chmod(output.name, 0o644)
+    os.replace(output.name, cache_path)
+    logger.info(f"Built static GTFS cache {cache_path} from {zip_path}")
+
+class StaticGTFS:
+    """Read-only stop, route, trip and shape lookups over a memory-mapped cache file"""
+
+    def __init__(self, cache_path):
+        with open(cache_path, 'rb') as source:
+            self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+            raise ValueError(f"{cache_path} is not a static GTFS cache")
+        header_length, = struct.unpack_from('<I', self._mmap, len(CACHE_MAGIC))
+        header_end = len(CACHE_MAGIC) + 4 + header_length
+        self.header = json.loads(self._mmap[len(CACHE_MAGIC) + 4:header_end])
+        data_start = -(-header_end // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+
+        view = memoryview(self._mmap)
+        self._sections = {
+            name: view[data_start + offset:data_start + offset + length].cast(typecode)
+            for name, (offset, length, typecode) in self.header['sections'].items()
+        }
+        self.stop_ids = self._strings('stops.keys')
+        self.stop_names = self._strings('stops.names')
+        self.route_ids = self._strings('routes.keys')
+        self.trip_ids = self._strings('trips.keys')
+        self.shape_ids = self._strings('shapes.keys')
+        self.route_short_names = self._strings('routes.short_names')
+        self.route_long_names = self._strings('routes.long_names')
+        self.route_colors = self._strings('routes.colors')
+        self.trip_headsigns = self._strings('trips.headsigns')
+
+    def _strings(self, name):
+        return StringTable(self._sections[f"{name}.offsets"], self._sections[f"{name}.data"])
+
+    def _stop_index(self, stop_id):
+        if not stop_id:
+            return -1
+        index = self.stop_ids.find(stop_id)
+        # Realtime feeds use directional platform ids (e.g. 127N) that may only exist as the parent station
+        if index < 0 and stop_id[-1] in 'NS':
+            index = self.stop_ids.find(stop_id[:-1])
+        return index
+
+    def stop(self, stop_id):
+        """Stop details for a stop id, or None if unknown"""
+        index = self._stop_index(stop_id)
+        if index < 0:
+            return None
+        parent = self._sections['stops.parent'][index]
+        return {
+            'stop_id': self.stop_ids[index],
+            'name': self.stop_names[index],
+            'latitude': self._sections['stops.lat'][index],
+            'longitude': self._sections['stops.lon'][index],
+            'parent_station': self.stop_ids[parent] if parent >= 0 else None,
+        }
+
+    def stop_name(self, stop_id):
+        """Name of a stop, or None if unknown"""
+        index = self._stop_index(stop_id)
+        return self.stop_names[index] if index >= 0 else None
+
+    def stop_position(self, stop_id):
+        """(latitude, longitude) of a stop, or None if unknown or without coordinates"""
+        index = self._stop_index(stop_id)
+        if index < 0:
+            return None
+        lat = self._sections['stops.lat'][index]
+        lon = self._sections['stops.lon'][index]
+        if lat != lat or lon != lon:
+            return None
+        return lat, lon
+
+    def route(self, route_id):
+        """Route names and color for a route id, or None if unknown"""
+        index = self.route_ids.find(route_id) if route_id else -1
+        if index < 0:
+            return None
+        return {
+            'route_id': route_id,
+            'short_name': self.route_short_names[index],
+            'long_name': self.route_long_names[index],
+            'color': self.route_colors[index],
+        }
+
+    def trip(self, trip_id):
+        """Route, shape and headsign of a scheduled trip, or None if unknown"""
+        index = self.trip_ids.find(trip_id) if trip_id else -1
+        if index < 0:
+            return None
+        route = self._sections['trips.route'][index]
+        shape = self._sections['trips.shape'][index]
+        return {
+            'trip_id': trip_id,
+            'route_id': self.route_ids[route] if route >= 0 else None,
+            'shape_id': self.shape_ids[shape] if shape >= 0 else None,
+            'headsign': self.trip_headsigns[index],
+        }
+
+    def shape(self, shape_id):
+        """Points of a shape as [(latitude, longitude), ...], empty if unknown"""
+        index = self.shape_ids.find(shape_id) if shape_id else -1
+        if index < 0:
+            return []
+        offsets = self._sections['shapes.offsets']
+        lat = self._sections['shapes.lat']
+        lon = self._sections['shapes.lon']
+        return [(lat[point], lon[point]) for point in range(offsets[index], offsets[index + 1])]
+
+    def counts(self):
+        return {
+            'stops': len(self.stop_ids),
+            'routes': len(self.route_ids),
+            'trips': len(self.trip_ids),
+            'shapes': len(self.shape_ids),
+        }
+
+def download_zip(url, zip_path):
+    """Download the GTFS zip, replacing zip_path atomically"""
+    directory = os.path.dirname(os.path.abspath(zip_path))
+    os.makedirs(directory, exist_ok=True)
+    with urllib.request.urlopen(url, timeout=60) as response, \
+            tempfile.NamedTemporaryFile(dir=directory, delete=False) as output:
+        output.write(response.read())
+    os.replace(output.name, zip_path)
+    logger.info(f"Downloaded static GTFS from {url} to {zip_path}")
+
+def cache_is_current(zip_path, cache_path):
+    """True if the cache exists and was built from the current zip on this platform"""
+    try:
+        with open(cache_path, 'rb') as source:
+            if source.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return False
+            header_length, = struct.unpack('<I', source.read(4))
+            header = json.loads(source.read(header_length))
+    except (OSError, ValueError, struct.error):
+        return False
+    if header.get('byteorder') != sys.byteorder:
+        return False
+    return not os.path.exists(zip_path) or header.get('source') == source_signature(zip_path)
+
+def load_static_gtfs(zip_path=GTFS_STATIC_PATH, cache_path=GTFS_STATIC_CACHE, url=GTFS_STATIC_URL):
+    """Map the static GTFS cache, downloading and building it as needed; None if unavailable"""
+    try:
+        if not os.path.exists(zip_path) and not os.path.exists(cache_path) and url:
+            download_zip(url, zip_path)
+        if not cache_is_current(zip_path, cache_path):
+            if not os.path.exists(zip_path):
+                logger.warning(f"No static GTFS at {zip_path}; stop lookups are disabled")
+                return None
+            build_cache(zip_path, cache_path)
+        static_gtfs = StaticGTFS(cache_path)
+        logger.info(f"Loaded static GTFS index {cache_path}: {static_gtfs.counts()}")
+        return static_gtfs
+    except Exception as e:
+        logger.error(f"Error loading static GTFS from {zip_path}: {e}")
+        return None
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if load_static_gtfs() is None:
+        sys.exit(1)
@@ -0,0 +1,99 @@
+"""
+Liveness and readiness of the service, served as /healthz and /readyz next to /metrics.
+
+At startup the service registers the dependencies it needs and warms them up
+after the probe server is already listening, so orchestrators see the process
+within a second of starting. /healthz answers 200 while the main loop keeps
+beating; /readyz answers 200 once every required dependency is ready. Both
+report each dependency's state, so a slow warm-up shows which client it is
+waiting on.
+"""
+import os
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from prometheus_client import MetricsHandler
+
+# A main loop silent for longer than this fails the liveness probe
+HEALTH_MAX_STALL_SECONDS = float(os.getenv('HEALTH_MAX_STALL_SECONDS', 300))
+
+class Health:
+    """Dependency states and the main-loop heartbeat"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.beat_at = time.monotonic()
+        # Dependency -> {'state': starting|ready|failed, 'required': bool, 'detail': str}
+        self.dependencies = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, required=True):
+        with self._lock:
+            self.dependencies[name] = {'state': 'starting', 'required': required, 'detail': None}
+
+    def set_state(self, name, state, detail=None):
+        with self._lock:
+            dependency = self.dependencies.setdefault(name, {'required': False})
+            dependency['state'] = state
+            dependency['detail'] = detail
+
+    def ready(self, name, detail=None):
+        self.set_state(name, 'ready', detail)
+
+    def failed(self, name, error):
+        self.set_state(name, 'failed', str(error))
+
+    def beat(self):
+        """Record that the main loop is making progress"""
+        self.beat_at = time.monotonic()
+
+    def is_live(self):
+        return time.monotonic() - self.beat_at < HEALTH_MAX_STALL_SECONDS
+
+    def is_ready(self):
+        with self._lock:
+            return all(dependency['state'] == 'ready' for dependency in self.dependencies.values() if dependency['required'])
+
+    def report(self):
+        with self._lock:
+            dependencies = {name: dict(dependency) for name, dependency in self.dependencies.items()}
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started_at, 1),
+            'last_beat_seconds': round(time.monotonic() - self.beat_at, 1),
+            'dependencies': dependencies,
+        }
+
+# The process-wide health state
+health = Health()
+
+class ProbeHandler(MetricsHandler):
+    """Prometheus /metrics handler that also answers the /healthz and /readyz probes"""
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/healthz':
+            live = health.is_live()
+            self.send_json(200 if live else 503, dict(status='live' if live else 'stalled', **health.report()))
+        elif path == '/readyz':
+            ready = health.is_ready()
+            self.send_json(200 if ready else 503, dict(status='ready' if ready else 'not ready', **health.report()))
+        else:
+            super().do_GET()
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_probe_server(port):
+    """Serve /metrics, /healthz and /readyz on the given port from a background thread"""
+    server = ThreadingHTTPServer(('', port), ProbeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='probe-server', daemon=True).start()
+    return server
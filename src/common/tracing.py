@@ -0,0 +1,48 @@
+"""
+OpenTelemetry exporter setup shared by the producer, processor and API.
+
+Spans are sent to an OTLP/HTTP collector (TRACE_EXPORTER=otlp, endpoint from
+OTEL_EXPORTER_OTLP_ENDPOINT) or appended as JSON lines to the service's trace
+file (TRACE_EXPORTER=file). With TRACE_EXPORTER=none ids are still generated.
+"""
+import os
+import logging
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+logger = logging.getLogger(__name__)
+
+# Tracing configuration
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none').lower()
+
+def build_exporter(trace_file):
+    """Create the span exporter selected by TRACE_EXPORTER, or None"""
+    if TRACE_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACE_EXPORTER == 'file':
+        if os.path.dirname(trace_file):
+            os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(trace_file, 'a'),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep
+        )
+    return None
+
+def setup_tracing(service_name, trace_file):
+    """Install the global tracer provider for a service"""
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    exporter = build_exporter(trace_file)
+    if exporter is not None:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        logger.info(f"Exporting traces with the {TRACE_EXPORTER} exporter")
+    trace.set_tracer_provider(provider)
+
+def current_trace_id():
+    """Hex trace id of the active span, or None outside a recorded trace"""
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return format(span_context.trace_id, '032x')
@@ -0,0 +1,14 @@
+#!/bin/sh
+# Start the processor engine selected by PROCESSOR_ENGINE (spark or lite)
+if [ "${PROCESSOR_ENGINE:-spark}" = "lite" ]; then
+    exec python3 lite.py
+fi
+
+# Use the connector jars baked into the image; resolve them from Maven only if they are missing
+SPARK_PACKAGES="${SPARK_PACKAGES:-org.apache.spark:spark-sql-kafka-0-10_2.12:3.3.1,org.mongodb.spark:mongo-spark-connector_2.12:10.1.1}"
+SPARK_JARS=$(ls "${SPARK_JARS_DIR:-/opt/spark-jars}"/*.jar 2>/dev/null | paste -sd, -)
+if [ -n "$SPARK_JARS" ]; then
+    exec spark-submit --jars "$SPARK_JARS" main.py
+fi
+
+exec spark-submit --packages "$SPARK_PACKAGES" main.py
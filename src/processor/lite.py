@@ -0,0 +1,347 @@
+"""
+Lightweight processor engine for small deployments.
+
+Runs the same topic routing, transformations and MongoDB sinks as the Spark
+engine in main.py on a plain asyncio Kafka consumer, without a JVM or connector
+jars. Select it with PROCESSOR_ENGINE=lite.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from aiokafka import AIOKafkaConsumer
+from pymongo import MongoClient, InsertOne, UpdateOne
+from pipeline import (
+    KAFKA_BOOTSTRAP_SERVERS, PROCESSOR_STARTING_OFFSETS, MONGODB_URI, MONGODB_DATABASE,
+    TOPIC_SINKS, SINK_KEYS, GEO_SINKS, PROCESSOR_METRICS_PORT, plan_write, sink_stats, record_sink_stats,
+    ensure_sink_indexes, geojson_point, key_fallbacks, fill_key_fallbacks
+)
+from metrics import BATCH_SECONDS, FAILED_BATCHES, CONSUMER_LAG, start_metrics_server
+from common.health import health
+from tracing import tracer, setup_tracing, span_context_from_headers
+from opentelemetry import trace
+from opentelemetry.trace import Link
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Lite engine configuration
+LITE_CONSUMER_GROUP = os.getenv('LITE_CONSUMER_GROUP', 'mta-processor-lite')
+LITE_MAX_BATCH_RECORDS = int(os.getenv('LITE_MAX_BATCH_RECORDS', 5000))
+LITE_FLUSH_INTERVAL_SECONDS = float(os.getenv('LITE_FLUSH_INTERVAL_SECONDS', 5))
+
+# The last offset of each topic partition written to each sink. A batch that
+# fails part-way is consumed again from the committed offsets; each sink skips
+# the messages it already holds, so unkeyed sinks are not appended to twice.
+# A record at or beyond its partition's high watermark was left by an earlier
+# topic with the same name and is ignored.
+SINK_OFFSETS_COLLECTION = '_sink_offsets'
+
+def coerce_timestamp(value):
+    """Convert epoch seconds or ISO-8601 strings to UTC datetimes, as Spark's from_json does"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+def coerce_string(value):
+    """Strings pass through; other JSON values keep their raw JSON text"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+def coerce_value(value, field_type):
+    """Coerce a JSON value to a field type, returning None where Spark would yield null"""
+    if value is None:
+        return None
+    if field_type == 'string':
+        return coerce_string(value)
+    if field_type == 'int':
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if field_type == 'float':
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    if field_type == 'bool':
+        return value if isinstance(value, bool) else None
+    if field_type == 'timestamp':
+        return coerce_timestamp(value)
+    if field_type == 'string_array':
+        return [coerce_string(item) for item in value] if isinstance(value, list) else None
+    return None
+
+def parse_message(raw_value, fields, processed_at):
+    """Parse one Kafka message into a document with exactly the Spark schema's fields"""
+    try:
+        data = json.loads(raw_value)
+    except (TypeError, ValueError):
+        data = None
+    # Malformed or non-object payloads become an all-null row, like Spark's PERMISSIVE mode
+    if not isinstance(data, dict):
+        data = {}
+    doc = {name: coerce_value(data.get(name), field_type) for name, field_type in fields}
+    doc['processed_at'] = processed_at
+    return doc
+
+def transform(messages_by_topic, processed_at=None):
+    """Turn raw Kafka values grouped by topic into documents grouped by target collection"""
+    processed_at = processed_at or datetime.now(timezone.utc)
+    docs_by_collection = {}
+    for topic, raw_values in messages_by_topic.items():
+        if topic not in TOPIC_SINKS:
+            continue
+        fields, sinks = TOPIC_SINKS[topic]
+        fallbacks = key_fallbacks(fields)
+        docs = [fill_key_fallbacks(parse_message(raw_value, fields, processed_at), fallbacks) for raw_value in raw_values]
+        geo_fields = {GEO_SINKS[collection_name] for collection_name, _ in sinks if collection_name in GEO_SINKS}
+        for field in geo_fields:
+            for doc in docs:
+                point = geojson_point(doc.get('latitude'), doc.get('longitude'))
+                if point is not None:
+                    doc[field] = point
+        for collection_name, row_filter in sinks:
+            sink_docs = docs if row_filter is None else [doc for doc in docs if doc.get(row_filter) is True]
+            docs_by_collection.setdefault(collection_name, []).extend(sink_docs)
+    return docs_by_collection
+
+def sink_offset_id(collection_name, topic, partition):
+    return f"{LITE_CONSUMER_GROUP}:{topic}:{partition}:{collection_name}"
+
+def written_offsets(db, records_by_partition, highwaters):
+    """{(collection name, partition): last offset written} for the sinks fed by a batch's partitions"""
+    record_ids = {}
+    for partition in records_by_partition:
+        for collection_name, _ in TOPIC_SINKS.get(partition.topic, ((), ()))[1]:
+            record_ids[sink_offset_id(collection_name, partition.topic, partition.partition)] = (collection_name, partition)
+    written = {}
+    for doc in db[SINK_OFFSETS_COLLECTION].find({'_id': {'$in': list(record_ids)}}):
+        collection_name, partition = record_ids[doc['_id']]
+        highwater = highwaters.get(partition)
+        if highwater is None or doc['offset'] < highwater:
+            written[(collection_name, partition)] = doc['offset']
+    return written
+
+def sink_documents(records_by_partition, written, processed_at=None):
+    """Documents per collection for a batch of records, without the records each sink already holds"""
+    processed_at = processed_at or datetime.now(timezone.utc)
+    messages_by_topic = {}
+    for partition, records in records_by_partition.items():
+        messages_by_topic.setdefault(partition.topic, []).extend(record.value for record in records)
+    docs_by_collection = transform(messages_by_topic, processed_at)
+    if not written:
+        return docs_by_collection
+
+    # Rebuild the sinks that hold part of the batch from their unwritten records only
+    for collection_name in {collection_name for collection_name, _ in written}:
+        unwritten = {}
+        for partition, records in records_by_partition.items():
+            last_offset = written.get((collection_name, partition), -1)
+            unwritten.setdefault(partition.topic, []).extend(
+                record.value for record in records if record.offset > last_offset
+            )
+        docs_by_collection[collection_name] = transform(unwritten, processed_at).get(collection_name, [])
+    return docs_by_collection
+
+def mark_offsets_written(db, collection_name, records_by_partition):
+    """Record the last offset of each partition feeding collection_name as written to it"""
+    operations = [
+        UpdateOne(
+            {'_id': sink_offset_id(collection_name, partition.topic, partition.partition)},
+            {'$max': {'offset': records[-1].offset}, '$set': {'written_at': datetime.utcnow()}},
+            upsert=True
+        )
+        for partition, records in records_by_partition.items()
+        if records and any(sink == collection_name for sink, _ in TOPIC_SINKS.get(partition.topic, ((), ()))[1])
+    ]
+    if operations:
+        db[SINK_OFFSETS_COLLECTION].bulk_write(operations, ordered=False)
+
+def build_operations(collection_name, docs):
+    """Build bulk operations for a sink: keyed $set upserts or plain inserts"""
+    key_fields = SINK_KEYS.get(collection_name)
+    if not key_fields:
+        # Copy so pymongo's generated _id does not leak into documents shared between sinks
+        return [InsertOne(dict(doc)) for doc in docs]
+    return [
+        UpdateOne({key: doc[key] for key in key_fields}, {'$set': doc}, upsert=True)
+        for doc in docs
+        if all(doc.get(key) is not None for key in key_fields)
+    ]
+
+@tracer.start_as_current_span('mongo_write')
+def write_collection(db, collection_name, docs, batch_id, records_by_partition):
+    """Write one sink's documents in bulk batches sized from the batch, then record its offsets"""
+    started = time.time()
+    operations = build_operations(collection_name, docs)
+    span = trace.get_current_span()
+    span.set_attribute('mongodb.collection', collection_name)
+    span.set_attribute('mta.rows', len(operations))
+    if not operations:
+        mark_offsets_written(db, collection_name, records_by_partition)
+        record_sink_stats(collection_name, batch_id, 0, time.time() - started)
+        return
+
+    _, batch_size = plan_write(len(operations))
+    collection = db[collection_name]
+    for offset in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[offset:offset + batch_size], ordered=False)
+    mark_offsets_written(db, collection_name, records_by_partition)
+
+    write_seconds = time.time() - started
+    record_sink_stats(collection_name, batch_id, len(operations), write_seconds)
+    logger.info(
+        f"Wrote {len(operations)} rows of batch #{batch_id} to MongoDB collection {collection_name} "
+        f"in {write_seconds * 1000:.0f} ms (maxBatchSize={batch_size}, "
+        f"{'upsert' if SINK_KEYS.get(collection_name) else 'append'})"
+    )
+
+async def process_batch(db, records_by_partition, highwaters, batch_id, source_spans=()):
+    """Transform a batch and write every sink in parallel"""
+    started = time.time()
+    with tracer.start_as_current_span(
+        'process_batch',
+        attributes={'mta.stream': LITE_CONSUMER_GROUP, 'mta.epoch': batch_id},
+        links=[Link(span_context) for span_context in source_spans]
+    ):
+        written = written_offsets(db, records_by_partition, highwaters)
+        if written:
+            logger.info(f"Batch #{batch_id} replays records already written to {sorted({name for name, _ in written})}, skipping them")
+        docs_by_collection = sink_documents(records_by_partition, written)
+        loop = asyncio.get_running_loop()
+        # Executor threads do not inherit context; copy it so sink spans nest under the batch
+        await asyncio.gather(*[
+            loop.run_in_executor(
+                None, contextvars.copy_context().run, write_collection,
+                db, collection_name, docs, batch_id, records_by_partition
+            )
+            for collection_name, docs in docs_by_collection.items()
+        ])
+
+    batch_seconds = time.time() - started
+    BATCH_SECONDS.labels(stream=LITE_CONSUMER_GROUP).observe(batch_seconds)
+    epoch_rows = sum(stats['last_rows'] for stats in sink_stats.values() if stats.get('last_epoch') == batch_id)
+    logger.info(f"Processed batch #{batch_id} in {batch_seconds * 1000:.0f} ms ({epoch_rows} rows written)")
+
+async def record_consumer_lag(consumer):
+    """Publish per-partition lag between the high watermark and the consumer position"""
+    for partition in consumer.assignment():
+        highwater = consumer.highwater(partition)
+        if highwater is None:
+            continue
+        position = await consumer.position(partition)
+        CONSUMER_LAG.labels(
+            stream=LITE_CONSUMER_GROUP,
+            topic=partition.topic,
+            partition=str(partition.partition)
+        ).set(max(0, highwater - position))
+
+async def rewind_to_committed(consumer):
+    """Seek every assigned partition back to its last committed offset"""
+    for partition in consumer.assignment():
+        committed = await consumer.committed(partition)
+        if committed is None:
+            await consumer.seek_to_beginning(partition)
+        else:
+            consumer.seek(partition, committed)
+
+async def consume():
+    """Consume all topics, flushing a batch when it is full or the flush interval elapses"""
+    consumer = AIOKafkaConsumer(
+        *TOPIC_SINKS.keys(),
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+        group_id=LITE_CONSUMER_GROUP,
+        enable_auto_commit=False,
+        auto_offset_reset=PROCESSOR_STARTING_OFFSETS
+    )
+    db = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=10000)[MONGODB_DATABASE]
+    # Offsets are committed after the writes, so a crash replays the batch;
+    # the unique keys make that replay overwrite instead of duplicate, and
+    # the per-sink offset records keep unkeyed sinks from being appended twice
+    health.register('mongodb')
+    health.register('kafka')
+    start_metrics_server(PROCESSOR_METRICS_PORT)
+    setup_tracing('mta-processor-lite')
+    try:
+        db.command('ping')
+        health.ready('mongodb')
+    except Exception as e:
+        health.failed('mongodb', e)
+        logger.error(f"MongoDB not available: {e}")
+    ensure_sink_indexes(db)
+
+    await consumer.start()
+    health.ready('kafka')
+    logger.info(f"Lite processor consuming topics {list(TOPIC_SINKS.keys())}")
+
+    batch_id = 0
+    try:
+        while True:
+            health.beat()
+            records_by_partition = {}
+            # Producer cycles in this batch, deduplicated by trace id
+            source_spans = {}
+            record_count = 0
+            deadline = time.time() + LITE_FLUSH_INTERVAL_SECONDS
+
+            while record_count < LITE_MAX_BATCH_RECORDS and time.time() < deadline:
+                timeout_ms = max(1, int((deadline - time.time()) * 1000))
+                records = await consumer.getmany(
+                    timeout_ms=timeout_ms,
+                    max_records=LITE_MAX_BATCH_RECORDS - record_count
+                )
+                for partition, partition_records in records.items():
+                    records_by_partition.setdefault(partition, []).extend(partition_records)
+                    for record in partition_records:
+                        span_context = span_context_from_headers(record.headers)
+                        if span_context is not None:
+                            source_spans[span_context.trace_id] = span_context
+                    record_count += len(partition_records)
+
+            if record_count == 0:
+                continue
+
+            try:
+                highwaters = {partition: consumer.highwater(partition) for partition in records_by_partition}
+                await process_batch(db, records_by_partition, highwaters, batch_id, source_spans.values())
+            except Exception as e:
+                # Offsets stay uncommitted; rewind so the batch is consumed again
+                logger.error(f"Error processing batch #{batch_id}: {str(e)}")
+                FAILED_BATCHES.labels(stream=LITE_CONSUMER_GROUP).inc()
+                health.failed('mongodb', e)
+                await rewind_to_committed(consumer)
+                continue
+
+            # Commit only after every sink has been written
+            health.ready('mongodb')
+            await consumer.commit()
+            await record_consumer_lag(consumer)
+            batch_id += 1
+    finally:
+        await consumer.stop()
+
+def run():
+    """Run the lightweight processor until interrupted"""
+    logger.info("Starting lightweight MTA data processor...")
+    asyncio.run(consume())
+
+if __name__ == "__main__":
+    try:
+        run()
+    except Exception as e:
+        logger.error(f"Error in main process: {str(e)}")
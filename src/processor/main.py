@@ -4,20 +4,30 @@
 # @Last Modified by:   Mukhil Sundararaj
 # @Last Modified time: 2025-05-11 21:01:38
 import os
+import glob
 import json
 import time
 import logging
 from datetime import datetime
-from dotenv import load_dotenv
 from pyspark.sql import SparkSession
 from pyspark.sql.types import (
-    StructType, StructField, StringType, IntegerType, 
-    FloatType, ArrayType, TimestampType, BooleanType, MapType
+    StructType, StructField, StringType, IntegerType,
+    FloatType, ArrayType, TimestampType, BooleanType
 )
 from pyspark.sql.functions import (
-    col, from_json, explode, to_timestamp, unix_timestamp, 
-    expr, lit, current_timestamp, window
+    col, from_json, explode, lit, current_timestamp, when, struct, array, coalesce
 )
+from pipeline import (
+    KAFKA_BOOTSTRAP_SERVERS, PROCESSOR_STARTING_OFFSETS, MONGODB_URI, MONGODB_DATABASE,
+    TOPIC_SINKS, SINK_KEYS, GEO_SINKS, key_fallbacks, PROCESSOR_METRICS_PORT, plan_write, sink_stats, record_sink_stats,
+    ensure_sink_indexes
+)
+from metrics import BATCH_SECONDS, FAILED_BATCHES, CONSUMER_LAG, start_metrics_server
+from tracing import tracer, setup_tracing, span_context_from_headers
+from common.health import health
+from opentelemetry import trace
+from opentelemetry.trace import Link
+from pymongo import MongoClient
 
 # Configure logging
 logging.basicConfig(
@@ -26,259 +36,431 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Streaming trigger and backpressure configuration
+PROCESSOR_TRIGGER_SECONDS = int(os.getenv('PROCESSOR_TRIGGER_SECONDS', 10))
+PROCESSOR_MAX_OFFSETS_PER_TRIGGER = os.getenv('PROCESSOR_MAX_OFFSETS_PER_TRIGGER')
+PROCESSOR_CHECKPOINT_DIR = os.getenv('PROCESSOR_CHECKPOINT_DIR', '/tmp/checkpoints')
+# Catch-up mode replays the backlog from the checkpoint (or the earliest retained
+# offsets) in bounded batches, then switches back to the steady-state trigger
+PROCESSOR_CATCHUP = os.getenv('PROCESSOR_CATCHUP', 'false').lower() == 'true'
+PROCESSOR_CATCHUP_MAX_OFFSETS_PER_TRIGGER = int(os.getenv('PROCESSOR_CATCHUP_MAX_OFFSETS_PER_TRIGGER', 2000))
+PROCESSOR_CATCHUP_LAG_THRESHOLD = int(os.getenv('PROCESSOR_CATCHUP_LAG_THRESHOLD', 100))
+# Optional JSON list splitting topics into separately configured streams, e.g.
+# [{"name": "vehicles", "topics": ["subway_vehicles"], "trigger_seconds": 5, "max_offsets_per_trigger": 5000}]
+PROCESSOR_STREAMS = os.getenv('PROCESSOR_STREAMS')
+PROCESSOR_PROGRESS_INTERVAL = int(os.getenv('PROCESSOR_PROGRESS_INTERVAL', 30))
+
+# Kafka and MongoDB connectors, as Maven coordinates resolved at startup unless
+# their jars are already in SPARK_JARS_DIR (baked into the image at build time)
+SPARK_PACKAGES = os.getenv(
+    'SPARK_PACKAGES',
+    'org.apache.spark:spark-sql-kafka-0-10_2.12:3.3.1,org.mongodb.spark:mongo-spark-connector_2.12:10.1.1'
+)
+SPARK_JARS_DIR = os.getenv('SPARK_JARS_DIR', '/opt/spark-jars')
+
+# Spark session, created by get_spark when the processor starts rather than on import
+spark = None
+
+def get_spark():
+    """Return the Spark session, creating it on first use"""
+    global spark
+    if spark is None:
+        spark = build_spark_session()
+    return spark
+
+def build_spark_session():
+    """Configure Spark Session with improved MongoDB connector settings"""
+    builder = SparkSession.builder.appName("MTA Data Processor")
+    local_jars = sorted(glob.glob(os.path.join(SPARK_JARS_DIR, '*.jar')))
+    if local_jars:
+        builder = builder.config("spark.jars", ",".join(local_jars))
+    else:
+        logger.warning(f"No connector jars in {SPARK_JARS_DIR}, resolving {SPARK_PACKAGES}")
+        builder = builder.config("spark.jars.packages", SPARK_PACKAGES)
+    
+    session = builder \
+        .config("spark.mongodb.output.uri", MONGODB_URI) \
+        .config("spark.mongodb.output.database", MONGODB_DATABASE) \
+        .config("spark.mongodb.database", MONGODB_DATABASE) \
+        .config("spark.mongodb.write.connection.uri", MONGODB_URI) \
+        .config("spark.mongodb.write.database", MONGODB_DATABASE) \
+        .config("spark.mongodb.write.maxBatchSize", "512") \
+        .config("spark.mongodb.write.ordered", "false") \
+        .config("spark.mongodb.connection.timeout", "10000") \
+        .config("spark.mongodb.socket.timeout", "10000") \
+        .config("spark.mongodb.server.selection.timeout", "10000") \
+        .getOrCreate()
+    
+    # Set log level
+    session.sparkContext.setLogLevel("WARN")
+    return session
 
-# Kafka Configuration
-KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
-KAFKA_TOPIC_VEHICLES = os.getenv('KAFKA_TOPIC_VEHICLES', 'subway_vehicles')
-KAFKA_TOPIC_ALERTS = os.getenv('KAFKA_TOPIC_ALERTS', 'service_alerts')
-KAFKA_TOPIC_ELEVATOR_OUTAGES = os.getenv('KAFKA_TOPIC_ELEVATOR_OUTAGES', 'elevator_outages')
-KAFKA_TOPIC_ELEVATOR_EQUIPMENT = os.getenv('KAFKA_TOPIC_ELEVATOR_EQUIPMENT', 'elevator_equipment')
+# The last epoch each stream has written to each sink. Spark re-runs the last
+# uncommitted epoch after a restart; sinks that already hold it are skipped and
+# the rest are upserted, so a replay never duplicates documents. Epoch ids
+# restart at 0 with a new checkpoint, so the records are kept per checkpoint id.
+SINK_EPOCHS_COLLECTION = '_sink_epochs'
+mongo_db = None
 
-# MongoDB Configuration
-MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/')
-MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'mta_data')
+# Checkpoint id per stream (the query id Spark keeps in the checkpoint's metadata file)
+checkpoint_ids = {}
 
-# Configure Spark Session with improved MongoDB connector settings
-spark = SparkSession.builder \
-    .appName("MTA Data Processor") \
-    .config("spark.jars.packages", "org.apache.spark:spark-sql-kafka-0-10_2.12:3.3.1,org.mongodb.spark:mongo-spark-connector_2.12:10.1.1") \
-    .config("spark.mongodb.output.uri", MONGODB_URI) \
-    .config("spark.mongodb.output.database", MONGODB_DATABASE) \
-    .config("spark.mongodb.database", MONGODB_DATABASE) \
-    .config("spark.mongodb.write.connection.uri", MONGODB_URI) \
-    .config("spark.mongodb.write.database", MONGODB_DATABASE) \
-    .config("spark.mongodb.write.maxBatchSize", "512") \
-    .config("spark.mongodb.write.ordered", "false") \
-    .config("spark.mongodb.connection.timeout", "10000") \
-    .config("spark.mongodb.socket.timeout", "10000") \
-    .config("spark.mongodb.server.selection.timeout", "10000") \
-    .getOrCreate()
+def get_mongo_db():
+    """Return the driver-side MongoDB database used for epoch tracking and indexes"""
+    global mongo_db
+    if mongo_db is None:
+        mongo_db = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=10000)[MONGODB_DATABASE]
+    return mongo_db
 
-# Set log level
-spark.sparkContext.setLogLevel("WARN")
+def checkpoint_id(stream_name):
+    """Return the id of stream_name's checkpoint, or None if it cannot be read"""
+    if stream_name not in checkpoint_ids:
+        try:
+            with open(os.path.join(PROCESSOR_CHECKPOINT_DIR, stream_name, 'metadata')) as metadata:
+                checkpoint_ids[stream_name] = json.loads(metadata.readline())['id']
+        except Exception as e:
+            logger.warning(f"Cannot read the checkpoint id of stream {stream_name}, replayed batches rewrite every sink: {e}")
+            checkpoint_ids[stream_name] = None
+    return checkpoint_ids[stream_name]
+
+def last_written_epoch(checkpoint, collection_name):
+    """Return the last epoch of a checkpoint written to collection_name, or -1"""
+    doc = get_mongo_db()[SINK_EPOCHS_COLLECTION].find_one({'_id': f"{checkpoint}:{collection_name}"})
+    return doc['epoch'] if doc else -1
+
+def mark_epoch_written(checkpoint, collection_name, epoch_id):
+    """Record that epoch_id of a checkpoint has been written to collection_name"""
+    get_mongo_db()[SINK_EPOCHS_COLLECTION].update_one(
+        {'_id': f"{checkpoint}:{collection_name}"},
+        {'$max': {'epoch': epoch_id}, '$set': {'written_at': datetime.utcnow()}},
+        upsert=True
+    )
 
 # Helper function to write MongoDB data with retries and error handling
+@tracer.start_as_current_span('mongo_write')
 def write_to_mongodb(batch_df, epoch_id, collection_name):
+    """Write a batch to a collection, returning True on success"""
+    started = time.time()
+    span = trace.get_current_span()
+    span.set_attribute('mongodb.collection', collection_name)
+    key_fields = SINK_KEYS.get(collection_name)
+    
+    # Upserts need a key on every row
+    if key_fields:
+        batch_df = batch_df.dropna(subset=key_fields)
+    
+    # Persist once so counting and writing share a single evaluation;
+    # a batch the caller already cached is left for the caller to release
+    persisted_here = not batch_df.is_cached
+    if persisted_here:
+        batch_df.persist()
     try:
-        # Skip empty batches
-        if batch_df.isEmpty():
+        row_count = batch_df.count()
+        span.set_attribute('mta.rows', row_count)
+        if row_count == 0:
             logger.info(f"Empty batch for collection {collection_name}, skipping write")
-            return
+            record_sink_stats(collection_name, epoch_id, 0, time.time() - started)
+            return True
         
-        # Convert to MongoDB format and write
-        logger.info(f"Writing batch #{epoch_id} to MongoDB collection {collection_name}")
+        current_partitions = batch_df.rdd.getNumPartitions()
+        partitions, batch_size = plan_write(row_count)
+        if partitions < current_partitions:
+            write_df = batch_df.coalesce(partitions)
+        elif partitions > current_partitions:
+            write_df = batch_df.repartition(partitions)
+        else:
+            write_df = batch_df
         
-        # Convert DataFrame to MongoDB format and write
-        batch_df.write.format("mongodb") \
+        writer = write_df.write.format("mongodb") \
             .mode("append") \
             .option("collection", collection_name) \
             .option("database", MONGODB_DATABASE) \
             .option("uri", MONGODB_URI) \
-            .option("replaceDocument", "false") \
             .option("ordered", "false") \
-            .option("maxBatchSize", "128") \
-            .save()
-            
-        logger.info(f"Successfully wrote batch #{epoch_id} to MongoDB collection {collection_name}")
+            .option("maxBatchSize", str(batch_size))
+        
+        # Keyed collections are upserted with $set semantics so documents
+        # written by the producer keep the fields the processor does not carry
+        if key_fields:
+            writer = writer \
+                .option("operationType", "update") \
+                .option("idFieldList", ",".join(key_fields)) \
+                .option("upsertDocument", "true")
+        
+        writer.save()
+        
+        write_seconds = time.time() - started
+        record_sink_stats(collection_name, epoch_id, row_count, write_seconds)
+        logger.info(
+            f"Wrote {row_count} rows of batch #{epoch_id} to MongoDB collection {collection_name} "
+            f"in {write_seconds * 1000:.0f} ms ({partitions} partitions, maxBatchSize={batch_size}, "
+            f"{'upsert' if key_fields else 'append'})"
+        )
+        return True
     except Exception as e:
         logger.error(f"Error writing to MongoDB collection {collection_name}: {str(e)}")
+        span.record_exception(e)
+        return False
+    finally:
+        if persisted_here:
+            batch_df.unpersist()
 
-# Define schema for subway vehicle data
-vehicle_schema = StructType([
-    StructField("line_id", StringType(), True),
-    StructField("vehicle_id", StringType(), True),
-    StructField("trip_id", StringType(), True),
-    StructField("route_id", StringType(), True),
-    StructField("start_date", StringType(), True),
-    StructField("latitude", FloatType(), True),
-    StructField("longitude", FloatType(), True),
-    StructField("bearing", FloatType(), True),
-    StructField("status", StringType(), True),
-    StructField("stop_id", StringType(), True),
-    StructField("timestamp", TimestampType(), True),
-    StructField("current_stop_sequence", IntegerType(), True),
-])
+# Spark types for the engine-independent field types in pipeline.py
+SPARK_TYPES = {
+    'string': StringType(),
+    'int': IntegerType(),
+    'float': FloatType(),
+    'bool': BooleanType(),
+    'timestamp': TimestampType(),
+    'string_array': ArrayType(StringType()),
+}
 
-# Define schema for service alerts
-alert_schema = StructType([
-    StructField("id", StringType(), True),
-    StructField("alert_type", StringType(), True),
-    StructField("effect", StringType(), True),
-    StructField("header", StringType(), True),
-    StructField("description", StringType(), True),
-    StructField("start", TimestampType(), True),
-    StructField("end", TimestampType(), True),
-    StructField("updated", TimestampType(), True),
-    StructField("severity", StringType(), True),
-    StructField("routes", ArrayType(StringType()), True),
-])
+def build_schema(fields):
+    """Build a nullable Spark schema from (name, type) field definitions"""
+    return StructType([StructField(name, SPARK_TYPES[field_type], True) for name, field_type in fields])
 
-# Define schema for elevator/escalator outages
-elevator_outage_schema = StructType([
-    StructField("equipment_id", StringType(), True),
-    StructField("station", StringType(), True),
-    StructField("borough", StringType(), True),
-    StructField("equipment_type", StringType(), True),
-    StructField("serving", StringType(), True),
-    StructField("outage_start", TimestampType(), True),
-    StructField("outage_end", TimestampType(), True),
-    StructField("reason", StringType(), True),
-    StructField("latest_status", StringType(), True),
-    StructField("is_current", BooleanType(), True),
-])
+# Schemas for subway vehicles, service alerts and elevator/escalator data, by topic
+TOPIC_SCHEMAS = {topic: build_schema(fields) for topic, (fields, _) in TOPIC_SINKS.items()}
 
-# Define schema for elevator/escalator equipment
-elevator_equipment_schema = StructType([
-    StructField("equipment_id", StringType(), True),
-    StructField("station", StringType(), True),
-    StructField("borough", StringType(), True),
-    StructField("equipment_type", StringType(), True),
-    StructField("serving", StringType(), True),
-    StructField("ada", BooleanType(), True),
-])
+def parse_topic(batch_df, topic):
+    """Parse the JSON payloads of one topic in a raw (topic, json_data, processed_at) batch"""
+    return batch_df \
+        .filter(col("topic") == topic) \
+        .select(from_json(col("json_data"), TOPIC_SCHEMAS[topic]).alias("data"), col("processed_at")) \
+        .select("data.*", "processed_at")
 
-def start_processing():
-    logger.info("Setting up subway data stream processor...")
-    
-    # Read subway vehicle stream from Kafka
-    vehicle_stream = spark \
-        .readStream \
-        .format("kafka") \
-        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("subscribe", KAFKA_TOPIC_VEHICLES) \
-        .option("startingOffsets", "latest") \
-        .option("failOnDataLoss", "false") \
-        .load()
-    
-    # Parse JSON data from Kafka
-    parsed_vehicle_stream = vehicle_stream \
-        .selectExpr("CAST(value AS STRING) as json_data") \
-        .select(from_json(col("json_data"), vehicle_schema).alias("data")) \
-        .select("data.*") \
-        .withColumn("processed_at", current_timestamp())
+def with_key_fallbacks(df, fields):
+    """Fill the key fields of KEY_FALLBACKS that apply to a topic's fields from their fallback fields"""
+    for field, sources in key_fallbacks(fields):
+        df = df.withColumn(field, coalesce(col(field), *[col(source) for source in sources]))
+    return df
+
+def with_geojson_point(df, field):
+    """Add a GeoJSON point column built from latitude/longitude, null when either is missing or out of range"""
+    latitude = col("latitude").cast("double")
+    longitude = col("longitude").cast("double")
+    valid = latitude.between(-90, 90) & longitude.between(-180, 180)
+    return df.withColumn(field, when(
+        valid,
+        struct(lit("Point").alias("type"), array(longitude, latitude).alias("coordinates"))
+    ))
+
+# Per-stream consumer lag keyed by (topic, partition), refreshed from query progress
+stream_lag = {}
+
+def source_span_links(batch_df):
+    """Span links to the producer ingest cycles whose messages are in a raw batch"""
+    rows = batch_df \
+        .select(explode(col("headers")).alias("header")) \
+        .filter(col("header.key") == "traceparent") \
+        .select(col("header.value").cast("string").alias("traceparent")) \
+        .distinct() \
+        .collect()
+    span_contexts = [span_context_from_headers([("traceparent", row.traceparent)]) for row in rows]
+    return [Link(span_context) for span_context in span_contexts if span_context is not None]
+
+def process_batch(batch_df, epoch_id, stream_name, topics):
+    """Parse one multi-topic micro-batch once per topic and fan it out to every sink"""
+    started = time.time()
+    failed_sinks = []
+    # Cache the raw batch so each per-topic filter reads it from memory
+    # instead of re-fetching the offsets from Kafka
+    batch_df.persist()
+    checkpoint = checkpoint_id(stream_name)
+    try:
+        with tracer.start_as_current_span(
+            'process_batch',
+            attributes={'mta.stream': stream_name, 'mta.epoch': epoch_id},
+            links=source_span_links(batch_df)
+        ):
+            for topic in topics:
+                fields, sinks = TOPIC_SINKS[topic]
+                parsed_df = with_key_fallbacks(parse_topic(batch_df, topic), fields).persist()
+                try:
+                    for collection_name, row_filter in sinks:
+                        if checkpoint and last_written_epoch(checkpoint, collection_name) >= epoch_id:
+                            logger.info(f"Batch #{epoch_id} already written to {collection_name}, skipping replay")
+                            continue
+                        sink_df = parsed_df if row_filter is None else parsed_df.filter(col(row_filter) == True)
+                        if collection_name in GEO_SINKS:
+                            sink_df = with_geojson_point(sink_df, GEO_SINKS[collection_name])
+                        if write_to_mongodb(sink_df, epoch_id, collection_name):
+                            if checkpoint:
+                                mark_epoch_written(checkpoint, collection_name, epoch_id)
+                        else:
+                            failed_sinks.append(collection_name)
+                finally:
+                    parsed_df.unpersist()
+    finally:
+        batch_df.unpersist()
     
-    # Stream to MongoDB
-    vehicle_query = parsed_vehicle_stream \
-        .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "vehicle_positions")) \
-        .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/vehicle_positions") \
-        .start()
+    # Fail the epoch so Spark does not commit it; the retry only rewrites the failed sinks
+    if failed_sinks:
+        FAILED_BATCHES.labels(stream=stream_name).inc()
+        health.failed('mongodb', f"Batch #{epoch_id} of stream {stream_name} failed for sinks {failed_sinks}")
+        raise RuntimeError(f"Batch #{epoch_id} of stream {stream_name} failed for sinks {failed_sinks}")
     
-    # Create a view of latest vehicle positions without using aggregations
-    # Simply write directly to latest_vehicle_positions collection
-    latest_vehicle_query = parsed_vehicle_stream \
-        .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "latest_vehicle_positions")) \
-        .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/latest_vehicle_positions") \
-        .start()
+    health.ready('mongodb')
+    batch_seconds = time.time() - started
+    BATCH_SECONDS.labels(stream=stream_name).observe(batch_seconds)
+    epoch_rows = sum(stats['last_rows'] for stats in sink_stats.values() if stats.get('last_epoch') == epoch_id)
+    logger.info(f"Processed batch #{epoch_id} in {batch_seconds * 1000:.0f} ms ({epoch_rows} rows written)")
+
+def load_stream_configs():
+    """Build the streaming query definitions from configuration"""
+    if PROCESSOR_STREAMS:
+        streams = json.loads(PROCESSOR_STREAMS)
+    else:
+        # By default a single query reads every topic
+        streams = [{'name': 'mta_processor', 'topics': list(TOPIC_SINKS.keys())}]
     
-    logger.info("Setting up service alerts stream processor...")
+    configs = []
+    for stream in streams:
+        unknown_topics = [topic for topic in stream['topics'] if topic not in TOPIC_SINKS]
+        if unknown_topics:
+            raise ValueError(f"Stream {stream['name']} references unknown topics {unknown_topics}")
+        configs.append({
+            'name': stream['name'],
+            'topics': stream['topics'],
+            'trigger_seconds': int(stream.get('trigger_seconds', PROCESSOR_TRIGGER_SECONDS)),
+            'max_offsets_per_trigger': stream.get('max_offsets_per_trigger', PROCESSOR_MAX_OFFSETS_PER_TRIGGER),
+            'starting_offsets': stream.get('starting_offsets', PROCESSOR_STARTING_OFFSETS),
+            'catchup': stream.get('catchup', PROCESSOR_CATCHUP),
+        })
+    return configs
+
+def start_stream(config, catching_up=False):
+    """Start one streaming query for the topics in config"""
+    # Catch-up replays from the checkpoint or the earliest retained offset in
+    # bounded batches, back to back; Spark ignores startingOffsets when a
+    # checkpoint exists, so a restart always resumes where it left off
+    starting_offsets = 'earliest' if catching_up else config['starting_offsets']
+    max_offsets = PROCESSOR_CATCHUP_MAX_OFFSETS_PER_TRIGGER if catching_up else config['max_offsets_per_trigger']
     
-    # Read service alerts stream from Kafka
-    alerts_stream = spark \
+    reader = get_spark() \
         .readStream \
         .format("kafka") \
         .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("subscribe", KAFKA_TOPIC_ALERTS) \
-        .option("startingOffsets", "latest") \
+        .option("subscribe", ",".join(config['topics'])) \
+        .option("startingOffsets", starting_offsets) \
         .option("failOnDataLoss", "false") \
-        .load()
+        .option("includeHeaders", "true")
+    
+    if max_offsets:
+        reader = reader.option("maxOffsetsPerTrigger", str(max_offsets))
     
-    # Parse JSON data from Kafka
-    parsed_alerts_stream = alerts_stream \
-        .selectExpr("CAST(value AS STRING) as json_data") \
-        .select(from_json(col("json_data"), alert_schema).alias("data")) \
-        .select("data.*") \
+    # Keep the topic for routing and the headers for trace context; the JSON
+    # payload is parsed per topic inside the batch
+    raw_stream = reader.load() \
+        .selectExpr("topic", "CAST(value AS STRING) as json_data", "headers") \
         .withColumn("processed_at", current_timestamp())
     
-    # Stream to MongoDB
-    alerts_query = parsed_alerts_stream \
+    stream_name = config['name']
+    topics = config['topics']
+    writer = raw_stream \
         .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "service_alerts")) \
+        .queryName(stream_name) \
+        .foreachBatch(lambda df, epoch_id: process_batch(df, epoch_id, stream_name, topics)) \
         .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/service_alerts") \
-        .start()
+        .option("checkpointLocation", os.path.join(PROCESSOR_CHECKPOINT_DIR, config['name']))
     
-    logger.info("Setting up elevator data stream processor...")
+    if not catching_up and config['trigger_seconds'] > 0:
+        writer = writer.trigger(processingTime=f"{config['trigger_seconds']} seconds")
     
-    # Read elevator outages stream from Kafka
-    elevator_outages_stream = spark \
-        .readStream \
-        .format("kafka") \
-        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("subscribe", KAFKA_TOPIC_ELEVATOR_OUTAGES) \
-        .option("startingOffsets", "latest") \
-        .option("failOnDataLoss", "false") \
-        .load()
+    # Read the checkpoint id again on the first batch: the checkpoint may have been reset
+    checkpoint_ids.pop(stream_name, None)
+    query = writer.start()
+    logger.info(
+        f"Started stream {config['name']} over topics {topics} "
+        f"({'catch-up' if catching_up else 'steady'} mode, trigger={'continuous batches' if catching_up else str(config['trigger_seconds']) + 's'}, "
+        f"maxOffsetsPerTrigger={max_offsets or 'unlimited'}, startingOffsets={starting_offsets})"
+    )
+    return query
+
+def parse_offsets(offsets):
+    """Normalize Kafka source offsets from query progress into {topic: {partition: offset}}"""
+    if not offsets:
+        return {}
+    if isinstance(offsets, str):
+        offsets = json.loads(offsets)
+    return {
+        topic: {int(partition): int(offset) for partition, offset in partitions.items()}
+        for topic, partitions in offsets.items()
+    }
+
+def report_stream_progress(query, config):
+    """Log per-partition lag for a stream and return its total lag, or None if unknown"""
+    progress = query.lastProgress
+    if not progress:
+        return None
     
-    # Parse JSON data from Kafka
-    parsed_elevator_outages_stream = elevator_outages_stream \
-        .selectExpr("CAST(value AS STRING) as json_data") \
-        .select(from_json(col("json_data"), elevator_outage_schema).alias("data")) \
-        .select("data.*") \
-        .withColumn("processed_at", current_timestamp())
+    lag = {}
+    for source in progress.get('sources', []):
+        end_offsets = parse_offsets(source.get('endOffset'))
+        latest_offsets = parse_offsets(source.get('latestOffset'))
+        for topic, partitions in latest_offsets.items():
+            for partition, latest_offset in partitions.items():
+                end_offset = end_offsets.get(topic, {}).get(partition, latest_offset)
+                lag[(topic, partition)] = max(0, latest_offset - end_offset)
+    stream_lag[config['name']] = lag
     
-    # Stream to MongoDB
-    elevator_outages_query = parsed_elevator_outages_stream \
-        .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "elevator_outages")) \
-        .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/elevator_outages") \
-        .start()
+    for (topic, partition), partition_lag in sorted(lag.items()):
+        CONSUMER_LAG.labels(stream=config['name'], topic=topic, partition=str(partition)).set(partition_lag)
+        logger.info(f"Stream {config['name']} lag {topic}[{partition}]: {partition_lag} offsets")
     
-    # Stream filtered for current outages
-    current_outages_query = parsed_elevator_outages_stream \
-        .filter(col("is_current") == True) \
-        .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "current_elevator_outages")) \
-        .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/current_elevator_outages") \
-        .start()
+    # A batch that takes longer than the trigger interval means the sink is falling behind
+    batch_ms = progress.get('durationMs', {}).get('triggerExecution', 0)
+    if config['trigger_seconds'] > 0 and batch_ms > config['trigger_seconds'] * 1000:
+        logger.warning(
+            f"Stream {config['name']} batch #{progress.get('batchId')} took {batch_ms} ms, "
+            f"longer than its {config['trigger_seconds']}s trigger interval"
+        )
     
-    # Read elevator equipment stream from Kafka
-    elevator_equipment_stream = spark \
-        .readStream \
-        .format("kafka") \
-        .option("kafka.bootstrap.servers", KAFKA_BOOTSTRAP_SERVERS) \
-        .option("subscribe", KAFKA_TOPIC_ELEVATOR_EQUIPMENT) \
-        .option("startingOffsets", "latest") \
-        .option("failOnDataLoss", "false") \
-        .load()
+    return sum(lag.values()) if lag else None
+
+def start_processing():
+    logger.info("Setting up MTA data stream processor...")
     
-    # Parse JSON data from Kafka
-    parsed_elevator_equipment_stream = elevator_equipment_stream \
-        .selectExpr("CAST(value AS STRING) as json_data") \
-        .select(from_json(col("json_data"), elevator_equipment_schema).alias("data")) \
-        .select("data.*") \
-        .withColumn("processed_at", current_timestamp())
+    # Serve metrics and the health probes before the Spark session starts
+    health.register('mongodb')
+    health.register('spark')
+    health.register('streams')
+    start_metrics_server(PROCESSOR_METRICS_PORT)
     
-    # Stream to MongoDB
-    elevator_equipment_query = parsed_elevator_equipment_stream \
-        .writeStream \
-        .foreachBatch(lambda df, epoch_id: write_to_mongodb(df, epoch_id, "elevator_equipment")) \
-        .outputMode("append") \
-        .option("checkpointLocation", "/tmp/checkpoints/elevator_equipment") \
-        .start()
+    setup_tracing('mta-processor')
+    try:
+        get_mongo_db().command('ping')
+        health.ready('mongodb')
+    except Exception as e:
+        health.failed('mongodb', e)
+        logger.error(f"MongoDB not available: {e}")
+    ensure_sink_indexes(get_mongo_db())
+    
+    started = time.time()
+    spark = get_spark()
+    health.ready('spark', f"Session started in {time.time() - started:.1f}s")
     
-    # List of all queries to await termination
-    queries = [
-        vehicle_query,
-        latest_vehicle_query,
-        alerts_query,
-        elevator_outages_query,
-        current_outages_query,
-        elevator_equipment_query
-    ]
+    configs = load_stream_configs()
+    queries = {config['name']: start_stream(config, catching_up=config['catchup']) for config in configs}
+    catching_up = {config['name'] for config in configs if config['catchup']}
+    health.ready('streams', f"{len(queries)} streaming queries")
     
     logger.info(f"Started {len(queries)} streaming queries. Awaiting termination...")
     
-    # Wait for any of the queries to terminate
-    for query in queries:
-        query.awaitTermination()
+    # Report lag periodically until any query terminates
+    while not spark.streams.awaitAnyTermination(PROCESSOR_PROGRESS_INTERVAL):
+        health.beat()
+        for config in configs:
+            name = config['name']
+            total_lag = report_stream_progress(queries[name], config)
+            
+            # Once the backlog is drained, restart from the checkpoint with the steady-state trigger
+            if name in catching_up and total_lag is not None and total_lag <= PROCESSOR_CATCHUP_LAG_THRESHOLD:
+                logger.info(f"Stream {name} caught up (lag {total_lag}), switching to steady-state trigger")
+                queries[name].stop()
+                spark.streams.resetTerminated()
+                queries[name] = start_stream(config)
+                catching_up.discard(name)
 
 if __name__ == "__main__":
     try:
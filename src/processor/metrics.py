@@ -0,0 +1,39 @@
+"""
+Prometheus metrics for the MTA data processor, shared by the Spark and lite engines.
+
+Exposed over HTTP on PROCESSOR_METRICS_PORT from the driver process.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.health import start_probe_server
+
+SINK_WRITE_SECONDS = Histogram(
+    'mta_processor_sink_write_seconds',
+    'Latency of writing one micro-batch to a MongoDB collection',
+    ['collection']
+)
+SINK_ROWS_WRITTEN = Counter(
+    'mta_processor_sink_rows_written_total',
+    'Rows written to a MongoDB collection',
+    ['collection']
+)
+BATCH_SECONDS = Histogram(
+    'mta_processor_batch_seconds',
+    'End-to-end duration of a micro-batch across all of its sinks',
+    ['stream'],
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+FAILED_BATCHES = Counter(
+    'mta_processor_failed_batches_total',
+    'Micro-batches with at least one failed sink',
+    ['stream']
+)
+CONSUMER_LAG = Gauge(
+    'mta_processor_consumer_lag',
+    'Offsets between the latest Kafka offset and the last processed offset',
+    ['stream', 'topic', 'partition']
+)
+
+def start_metrics_server(port):
+    """Serve /metrics, with the /healthz and /readyz probes, on the given port from a background thread"""
+    start_probe_server(port)
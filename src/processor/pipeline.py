@@ -0,0 +1,232 @@
+"""
+Engine-independent description of the processor's streams and sinks.
+
+Both the Spark engine (main.py) and the lightweight engine (lite.py) build their
+schemas, topic routing and MongoDB write semantics from these definitions, so
+either engine produces the same documents.
+"""
+import os
+from dotenv import load_dotenv
+from metrics import SINK_WRITE_SECONDS, SINK_ROWS_WRITTEN
+
+# Load environment variables
+load_dotenv()
+
+# Kafka Configuration
+KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
+KAFKA_TOPIC_VEHICLES = os.getenv('KAFKA_TOPIC_VEHICLES', 'subway_vehicles')
+KAFKA_TOPIC_ALERTS = os.getenv('KAFKA_TOPIC_ALERTS', 'service_alerts')
+KAFKA_TOPIC_ELEVATOR_OUTAGES = os.getenv('KAFKA_TOPIC_ELEVATOR_OUTAGES', 'elevator_outages')
+KAFKA_TOPIC_ELEVATOR_EQUIPMENT = os.getenv('KAFKA_TOPIC_ELEVATOR_EQUIPMENT', 'elevator_equipment')
+
+# Offsets used when a consumer starts without a checkpoint or committed offsets
+PROCESSOR_STARTING_OFFSETS = os.getenv('PROCESSOR_STARTING_OFFSETS', 'latest')
+
+# Port for the Prometheus metrics endpoint
+PROCESSOR_METRICS_PORT = int(os.getenv('PROCESSOR_METRICS_PORT', 9101))
+
+# MongoDB Configuration
+MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/')
+MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'mta_data')
+
+# Micro-batch write tuning: partitions and Mongo bulk batch sizes are derived
+# from the number of rows in each batch
+MONGODB_WRITE_ROWS_PER_PARTITION = int(os.getenv('MONGODB_WRITE_ROWS_PER_PARTITION', 5000))
+MONGODB_WRITE_MAX_PARTITIONS = int(os.getenv('MONGODB_WRITE_MAX_PARTITIONS', 8))
+MONGODB_WRITE_MIN_BATCH_SIZE = int(os.getenv('MONGODB_WRITE_MIN_BATCH_SIZE', 128))
+MONGODB_WRITE_MAX_BATCH_SIZE = int(os.getenv('MONGODB_WRITE_MAX_BATCH_SIZE', 2048))
+
+# Field definitions as (name, type); type is one of
+# 'string', 'int', 'float', 'bool', 'timestamp' or 'string_array'.
+# cycle_id is the producer's ingest cycle (trace) id, kept for tracing
+VEHICLE_FIELDS = [
+    ("line_id", "string"),
+    ("vehicle_id", "string"),
+    ("id", "string"),
+    ("vehicle_key", "string"),
+    ("trip_id", "string"),
+    ("route_id", "string"),
+    ("start_date", "string"),
+    ("latitude", "float"),
+    ("longitude", "float"),
+    ("bearing", "float"),
+    ("status", "string"),
+    ("stop_id", "string"),
+    ("timestamp", "timestamp"),
+    ("current_stop_sequence", "int"),
+    ("cycle_id", "string"),
+]
+
+ALERT_FIELDS = [
+    ("id", "string"),
+    ("alert_type", "string"),
+    ("effect", "string"),
+    ("header", "string"),
+    ("description", "string"),
+    ("start", "timestamp"),
+    ("end", "timestamp"),
+    ("updated", "timestamp"),
+    ("severity", "string"),
+    ("routes", "string_array"),
+    ("cycle_id", "string"),
+]
+
+ELEVATOR_OUTAGE_FIELDS = [
+    ("equipment_id", "string"),
+    ("station", "string"),
+    ("borough", "string"),
+    ("equipment_type", "string"),
+    ("serving", "string"),
+    ("outage_start", "timestamp"),
+    ("outage_end", "timestamp"),
+    ("reason", "string"),
+    ("latest_status", "string"),
+    ("is_current", "bool"),
+    ("cycle_id", "string"),
+]
+
+ELEVATOR_EQUIPMENT_FIELDS = [
+    ("equipment_id", "string"),
+    ("station", "string"),
+    ("borough", "string"),
+    ("equipment_type", "string"),
+    ("serving", "string"),
+    ("ada", "bool"),
+    ("cycle_id", "string"),
+]
+
+# Route each Kafka topic to its fields and the MongoDB collections it feeds.
+# Each sink is (collection_name, optional boolean field a row must have set to True).
+TOPIC_SINKS = {
+    KAFKA_TOPIC_VEHICLES: (VEHICLE_FIELDS, [
+        ("vehicle_positions", None),
+        ("latest_vehicle_positions", None),
+    ]),
+    KAFKA_TOPIC_ALERTS: (ALERT_FIELDS, [
+        ("service_alerts", None),
+    ]),
+    KAFKA_TOPIC_ELEVATOR_OUTAGES: (ELEVATOR_OUTAGE_FIELDS, [
+        ("elevator_outages", None),
+        ("current_elevator_outages", "is_current"),
+    ]),
+    KAFKA_TOPIC_ELEVATOR_EQUIPMENT: (ELEVATOR_EQUIPMENT_FIELDS, [
+        ("elevator_equipment", None),
+    ]),
+}
+
+# Idempotency keys: documents are upserted on these fields so replayed epochs,
+# retried batches and the producer writing the same data never add duplicates.
+# Collections without a key are appended to.
+SINK_KEYS = {
+    "vehicle_positions": ["vehicle_key", "timestamp"],
+    "latest_vehicle_positions": ["vehicle_key"],
+    "service_alerts": ["id", "updated"],
+    "current_elevator_outages": ["equipment_id"],
+    "elevator_equipment": ["equipment_id"],
+}
+
+# Key fields filled in from other fields when a message has none: vehicles are
+# keyed by vehicle id, or by feed entity id when the feed has none, as the producer keys them
+KEY_FALLBACKS = {
+    "vehicle_key": ["vehicle_id", "id"],
+}
+
+def key_fallbacks(fields):
+    """The (key field, fallback fields) pairs of KEY_FALLBACKS that apply to a topic's fields"""
+    names = {name for name, _ in fields}
+    return [
+        (field, sources) for field, sources in KEY_FALLBACKS.items()
+        if field in names and all(source in names for source in sources)
+    ]
+
+def fill_key_fallbacks(doc, fallbacks):
+    """Set a parsed document's missing key fields from the first of their fallback fields that has a value"""
+    for field, sources in fallbacks:
+        if doc.get(field) is None:
+            doc[field] = next((doc[source] for source in sources if doc.get(source) is not None), None)
+    return doc
+
+# GeoJSON point fields derived from latitude/longitude for vehicle sinks,
+# backed by 2dsphere indexes for viewport and radius queries
+GEO_SINKS = {
+    "vehicle_positions": "location",
+    "latest_vehicle_positions": "location",
+}
+
+# Sinks whose newest processed_at marks the ingest generation the API caches against
+GENERATION_SINKS = ["latest_vehicle_positions", "elevator_equipment"]
+
+# Non-unique lookup indexes: the API matches outages by the equipment ids its station search resolves
+LOOKUP_INDEXES = {
+    "elevator_outages": "equipment_id",
+}
+
+def geojson_point(latitude, longitude):
+    """GeoJSON point for a coordinate pair, or None if it is missing or out of range"""
+    if latitude is None or longitude is None:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+# BSON types for the field types above, used for partial unique indexes
+BSON_TYPES = {
+    'string': 'string',
+    'int': 'int',
+    'float': 'double',
+    'bool': 'bool',
+    'timestamp': 'date',
+    'string_array': 'array',
+}
+
+def ensure_sink_indexes(db):
+    """Create the unique indexes backing idempotent upserts, skipping documents without a key, and the geo and generation indexes"""
+    collection_fields = {}
+    for fields, sinks in TOPIC_SINKS.values():
+        for collection_name, _ in sinks:
+            collection_fields[collection_name] = dict(fields)
+    
+    for collection_name, key_fields in SINK_KEYS.items():
+        field_types = collection_fields[collection_name]
+        db[collection_name].create_index(
+            [(field, 1) for field in key_fields],
+            name='_'.join(key_fields) + '_unique',
+            unique=True,
+            partialFilterExpression={field: {'$type': BSON_TYPES[field_types[field]]} for field in key_fields}
+        )
+    
+    for collection_name, field in GEO_SINKS.items():
+        db[collection_name].create_index([(field, '2dsphere')], name=f"{field}_2dsphere")
+    
+    for collection_name in GENERATION_SINKS:
+        db[collection_name].create_index([("processed_at", -1)], name="processed_at_-1")
+    
+    for collection_name, field in LOOKUP_INDEXES.items():
+        db[collection_name].create_index([(field, 1)], name=f"{field}_1")
+
+def plan_write(row_count):
+    """Choose write parallelism and Mongo bulk batch size for a batch of row_count rows"""
+    partitions = -(-row_count // MONGODB_WRITE_ROWS_PER_PARTITION)
+    partitions = max(1, min(MONGODB_WRITE_MAX_PARTITIONS, partitions))
+    rows_per_partition = -(-row_count // partitions)
+    batch_size = max(MONGODB_WRITE_MIN_BATCH_SIZE, min(MONGODB_WRITE_MAX_BATCH_SIZE, rows_per_partition))
+    return partitions, batch_size
+
+# Per-collection statistics of the most recent write, plus running totals
+sink_stats = {}
+
+def record_sink_stats(collection_name, epoch_id, row_count, write_seconds):
+    """Record per-epoch write latency and row counts for a sink"""
+    stats = sink_stats.setdefault(collection_name, {
+        'total_rows': 0,
+        'total_batches': 0,
+        'total_write_seconds': 0.0
+    })
+    stats['last_epoch'] = epoch_id
+    stats['last_rows'] = row_count
+    stats['last_write_seconds'] = write_seconds
+    stats['total_rows'] += row_count
+    stats['total_batches'] += 1
+    stats['total_write_seconds'] += write_seconds
+    SINK_WRITE_SECONDS.labels(collection=collection_name).observe(write_seconds)
+    SINK_ROWS_WRITTEN.labels(collection=collection_name).inc(row_count)
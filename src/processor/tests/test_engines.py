@@ -0,0 +1,126 @@
+"""
+The Spark and lite engines write the same documents for the same batch.
+
+Runs both engines' batch steps up to the MongoDB write on one set of
+messages: parsing, key fallbacks, sink routing, GeoJSON points and the key
+filter. Skipped where pyspark (and a JVM) is not installed.
+"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import lite
+from pipeline import (
+    TOPIC_SINKS, SINK_KEYS, GEO_SINKS, KAFKA_TOPIC_VEHICLES, KAFKA_TOPIC_ALERTS,
+    KAFKA_TOPIC_ELEVATOR_OUTAGES, KAFKA_TOPIC_ELEVATOR_EQUIPMENT
+)
+
+PROCESSED_AT = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+
+# Coordinates are exact in single precision, as Spark parses them as floats
+MESSAGES = {
+    KAFKA_TOPIC_VEHICLES: [
+        {'line_id': 'ACE', 'vehicle_id': 'A1', 'id': 'e1', 'route_id': 'A', 'latitude': 40.75,
+         'longitude': -73.5, 'timestamp': 1746964800, 'current_stop_sequence': 4},
+        # Keyed by feed entity id when the feed has no vehicle id
+        {'line_id': 'ACE', 'id': 'e2', 'route_id': 'C', 'latitude': 40.625, 'longitude': -73.875,
+         'timestamp': 1746964800},
+        # Stored without a location
+        {'line_id': 'G', 'vehicle_id': 'G1', 'route_id': 'G', 'timestamp': 1746964830},
+        {'line_id': 'G', 'vehicle_id': 'G2', 'route_id': 'G', 'latitude': 91.0, 'longitude': -73.5,
+         'timestamp': 1746964830},
+        # No key at all: appended nowhere
+        {'line_id': 'L', 'route_id': 'L', 'timestamp': 1746964830},
+        'not json',
+    ],
+    KAFKA_TOPIC_ALERTS: [
+        {'id': 'alert-1', 'effect': 'DETOUR', 'header': 'Detour', 'routes': ['A', 'C'],
+         'start': '2025-05-11T10:00:00Z', 'updated': 1746964000},
+        {'id': 'alert-2', 'header': 'No updated time'},
+    ],
+    KAFKA_TOPIC_ELEVATOR_OUTAGES: [
+        {'equipment_id': 'EL101', 'station': '14 St', 'is_current': True,
+         'outage_start': '2025-05-11T08:30:00Z', 'reason': 'Repair'},
+        {'equipment_id': 'EL102', 'station': '14 St', 'is_current': False,
+         'outage_start': '2025-05-12T08:30:00Z', 'reason': 'Capital Replacement'},
+    ],
+    KAFKA_TOPIC_ELEVATOR_EQUIPMENT: [
+        {'equipment_id': 'EL101', 'station': '14 St', 'equipment_type': 'EL', 'ada': True},
+    ],
+}
+
+def raw_messages():
+    return {
+        topic: [message if isinstance(message, str) else json.dumps(message) for message in messages]
+        for topic, messages in MESSAGES.items()
+    }
+
+def normalize(doc):
+    """Comparable form of a sink document: no nulls or _id, timestamps as epoch seconds"""
+    normalized = {}
+    for field, value in doc.items():
+        if value is None or field in ('_id', 'processed_at'):
+            continue
+        normalized[field] = value.timestamp() if isinstance(value, datetime) else value
+    return normalized
+
+def sorted_docs(docs):
+    return sorted((normalize(doc) for doc in docs), key=lambda doc: json.dumps(doc, sort_keys=True))
+
+def lite_sink_docs():
+    """Documents the lite engine writes per collection"""
+    docs_by_collection = {}
+    for collection_name, docs in lite.transform(raw_messages(), PROCESSED_AT).items():
+        key_fields = SINK_KEYS.get(collection_name, [])
+        docs_by_collection[collection_name] = sorted_docs(
+            doc for doc in docs if all(doc.get(field) is not None for field in key_fields)
+        )
+    return docs_by_collection
+
+@pytest.fixture(scope='module')
+def spark():
+    pytest.importorskip('pyspark')
+    from pyspark.sql import SparkSession
+    session = SparkSession.builder \
+        .master('local[1]') \
+        .appName('MTA Processor Engine Tests') \
+        .config('spark.ui.enabled', 'false') \
+        .config('spark.sql.session.timeZone', 'UTC') \
+        .getOrCreate()
+    yield session
+    session.stop()
+
+def spark_sink_docs(spark):
+    """Documents the Spark engine's process_batch() hands to the connector per collection"""
+    import main
+    from pyspark.sql.functions import col
+
+    rows = [
+        (topic, raw_value, PROCESSED_AT)
+        for topic, raw_values in raw_messages().items()
+        for raw_value in raw_values
+    ]
+    batch_df = spark.createDataFrame(rows, ['topic', 'json_data', 'processed_at'])
+    docs_by_collection = {}
+    for topic, (fields, sinks) in TOPIC_SINKS.items():
+        parsed_df = main.with_key_fallbacks(main.parse_topic(batch_df, topic), fields)
+        for collection_name, row_filter in sinks:
+            sink_df = parsed_df if row_filter is None else parsed_df.filter(col(row_filter) == True)
+            if collection_name in GEO_SINKS:
+                sink_df = main.with_geojson_point(sink_df, GEO_SINKS[collection_name])
+            if SINK_KEYS.get(collection_name):
+                sink_df = sink_df.dropna(subset=SINK_KEYS[collection_name])
+            docs_by_collection[collection_name] = sorted_docs(row.asDict(recursive=True) for row in sink_df.collect())
+    return docs_by_collection
+
+def test_engines_write_the_same_documents(spark):
+    assert spark_sink_docs(spark) == lite_sink_docs()
+
+def test_lite_sinks_cover_every_collection():
+    docs_by_collection = lite_sink_docs()
+    collections = {collection_name for _, sinks in TOPIC_SINKS.values() for collection_name, _ in sinks}
+    assert set(docs_by_collection) == collections
+    assert sorted(doc['vehicle_key'] for doc in docs_by_collection['latest_vehicle_positions']) == ['A1', 'G1', 'G2', 'e2']
+    assert [doc['equipment_id'] for doc in docs_by_collection['current_elevator_outages']] == ['EL101']
+    assert len(docs_by_collection['elevator_outages']) == 2
@@ -0,0 +1,75 @@
+"""Key fallbacks, bulk operations and replay offsets of the lite engine"""
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from aiokafka.structs import TopicPartition
+from pymongo import InsertOne, UpdateOne
+
+import lite
+from pipeline import KAFKA_TOPIC_VEHICLES, KAFKA_TOPIC_ELEVATOR_OUTAGES
+
+PROCESSED_AT = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+
+Record = namedtuple('Record', ['offset', 'value'])
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find(self, query):
+        return [doc for doc in self.docs if doc['_id'] in query['_id']['$in']]
+
+def vehicle(**fields):
+    return json.dumps(dict({'route_id': 'A', 'timestamp': 1746964800}, **fields))
+
+def outage_records(partition, count):
+    return {partition: [
+        Record(offset, json.dumps({'equipment_id': f"EL{offset}", 'is_current': True}))
+        for offset in range(count)
+    ]}
+
+def test_vehicle_key_falls_back_to_vehicle_id_then_entity_id():
+    docs = lite.transform({KAFKA_TOPIC_VEHICLES: [
+        vehicle(vehicle_key='K1', vehicle_id='A1', id='e1'),
+        vehicle(vehicle_id='A2', id='e2'),
+        vehicle(id='e3'),
+        vehicle(),
+    ]}, PROCESSED_AT)['vehicle_positions']
+    assert [doc['vehicle_key'] for doc in docs] == ['K1', 'A2', 'e3', None]
+
+def test_build_operations_upserts_keyed_sinks_on_their_key():
+    docs = lite.transform({KAFKA_TOPIC_VEHICLES: [vehicle(id='e1'), vehicle()]}, PROCESSED_AT)['vehicle_positions']
+    operations = lite.build_operations('vehicle_positions', docs)
+    key = {'vehicle_key': 'e1', 'timestamp': datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)}
+    # The row without a vehicle key is dropped
+    assert operations == [UpdateOne(key, {'$set': docs[0]}, upsert=True)]
+
+def test_build_operations_inserts_unkeyed_sinks():
+    docs = [{'equipment_id': 'EL1'}, {'equipment_id': None}]
+    assert lite.build_operations('elevator_outages', docs) == [InsertOne(doc) for doc in docs]
+
+def test_batch_without_written_offsets_feeds_every_sink():
+    partition = TopicPartition(KAFKA_TOPIC_ELEVATOR_OUTAGES, 0)
+    docs_by_collection = lite.sink_documents(outage_records(partition, 3), {}, PROCESSED_AT)
+    assert [doc['equipment_id'] for doc in docs_by_collection['elevator_outages']] == ['EL0', 'EL1', 'EL2']
+    assert [doc['equipment_id'] for doc in docs_by_collection['current_elevator_outages']] == ['EL0', 'EL1', 'EL2']
+
+def test_replayed_batch_skips_records_a_sink_already_holds():
+    partition = TopicPartition(KAFKA_TOPIC_ELEVATOR_OUTAGES, 0)
+    written = {('elevator_outages', partition): 1}
+    docs_by_collection = lite.sink_documents(outage_records(partition, 3), written, PROCESSED_AT)
+    assert [doc['equipment_id'] for doc in docs_by_collection['elevator_outages']] == ['EL2']
+    # Sinks that were not written still get the whole batch
+    assert [doc['equipment_id'] for doc in docs_by_collection['current_elevator_outages']] == ['EL0', 'EL1', 'EL2']
+
+def test_written_offsets_ignores_records_past_the_high_watermark():
+    current = TopicPartition(KAFKA_TOPIC_ELEVATOR_OUTAGES, 0)
+    recreated = TopicPartition(KAFKA_TOPIC_ELEVATOR_OUTAGES, 1)
+    db = {lite.SINK_OFFSETS_COLLECTION: FakeCollection([
+        {'_id': lite.sink_offset_id('elevator_outages', current.topic, 0), 'offset': 4},
+        {'_id': lite.sink_offset_id('elevator_outages', recreated.topic, 1), 'offset': 900},
+    ])}
+    records_by_partition = {**outage_records(current, 6), **outage_records(recreated, 2)}
+    written = lite.written_offsets(db, records_by_partition, {current: 10, recreated: 2})
+    assert written == {('elevator_outages', current): 4}
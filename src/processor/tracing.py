@@ -0,0 +1,30 @@
+"""
+OpenTelemetry tracing for the MTA data processor, shared by the Spark and lite engines.
+
+Micro-batch and sink-write spans carry the batch's stream and epoch. The lite
+engine also links each batch span to the producer ingest cycles whose messages
+it consumed, using the W3C traceparent Kafka header. Exporters are set up by
+common.tracing; TRACE_FILE defaults to traces/processor.jsonl.
+"""
+import os
+from opentelemetry import trace, propagate
+
+from common import tracing
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces/processor.jsonl')
+
+tracer = trace.get_tracer('mta.processor')
+
+def setup_tracing(service_name):
+    """Install the global tracer provider for the processor"""
+    tracing.setup_tracing(service_name, TRACE_FILE)
+
+def span_context_from_headers(headers):
+    """Producer span context from Kafka message headers, or None"""
+    carrier = {
+        key: value.decode('utf-8') if isinstance(value, bytes) else value
+        for key, value in (headers or ())
+        if value is not None
+    }
+    span_context = trace.get_current_span(propagate.extract(carrier)).get_span_context()
+    return span_context if span_context.is_valid else None
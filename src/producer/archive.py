@@ -0,0 +1,270 @@
+"""
+Columnar archive of the ingested data as date- and route-partitioned Parquet.
+
+Each cycle's vehicle positions, trip updates (only the trips whose predictions
+changed), alert versions and elevator outage snapshots are buffered in memory
+per dataset and partition. Every ARCHIVE_FLUSH_SECONDS the buffers are written
+out as one Parquet part file per partition:
+
+    <ARCHIVE_DIR>/<dataset>/date=YYYY-MM-DD[/route_id=<route>]/part-<epoch>-<n>.parquet
+
+Once a day is over, the part files of each of its partitions are compacted
+into one file, a few row groups at a time so memory stays bounded, so a
+multi-week query opens one file per day and route. Files are written under a
+hidden temporary name and renamed into place, so readers never see a partial
+file. Every file holds all of its dataset's columns (including route_id), so
+readers can prune on the directory names and still read files on their own.
+"""
+import os
+import glob
+import time
+import logging
+from datetime import datetime
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import ARCHIVE_ROWS_WRITTEN, ARCHIVE_WRITE_ERRORS
+from tracing import current_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Write the Parquet archive (disabled when empty)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+
+# How often buffered rows are written out as part files
+ARCHIVE_FLUSH_SECONDS = int(os.getenv('ARCHIVE_FLUSH_SECONDS', 300))
+
+# Parquet compression codec
+ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')
+
+# Rows per row group of compacted files
+ARCHIVE_ROW_GROUP_ROWS = int(os.getenv('ARCHIVE_ROW_GROUP_ROWS', 100000))
+
+TIMESTAMP = pa.timestamp('ms')
+
+# Columns of each dataset; every file of a dataset has exactly this schema
+ARCHIVE_SCHEMAS = {
+    'vehicle_positions': pa.schema([
+        ('ts', TIMESTAMP),
+        ('route_id', pa.string()),
+        ('vehicle_id', pa.string()),
+        ('trip_id', pa.string()),
+        ('line_id', pa.string()),
+        ('current_status', pa.int32()),
+        ('current_stop_sequence', pa.int32()),
+        ('stop_id', pa.string()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('bearing', pa.float64()),
+        ('cycle_id', pa.string()),
+    ]),
+    'trip_updates': pa.schema([
+        ('ts', TIMESTAMP),
+        ('route_id', pa.string()),
+        ('trip_id', pa.string()),
+        ('vehicle_id', pa.string()),
+        ('line_id', pa.string()),
+        ('start_date', pa.string()),
+        ('stop_index', pa.int32()),
+        ('stop_id', pa.string()),
+        ('arrival', TIMESTAMP),
+        ('departure', TIMESTAMP),
+        ('cycle_id', pa.string()),
+    ]),
+    'service_alerts': pa.schema([
+        ('ts', TIMESTAMP),
+        ('id', pa.string()),
+        ('alert_type', pa.string()),
+        ('effect', pa.string()),
+        ('severity', pa.string()),
+        ('header', pa.string()),
+        ('description', pa.string()),
+        ('start', TIMESTAMP),
+        ('end', TIMESTAMP),
+        ('routes', pa.list_(pa.string())),
+        ('resolved', pa.bool_()),
+        ('cycle_id', pa.string()),
+    ]),
+    'elevator_outages': pa.schema([
+        ('ts', TIMESTAMP),
+        ('equipment_id', pa.string()),
+        ('station', pa.string()),
+        ('borough', pa.string()),
+        ('equipment_type', pa.string()),
+        ('serving', pa.string()),
+        ('outage_start', pa.string()),
+        ('outage_end', pa.string()),
+        ('reason', pa.string()),
+        ('latest_status', pa.string()),
+        ('is_current', pa.bool_()),
+        ('cycle_id', pa.string()),
+    ]),
+}
+
+# Datasets partitioned by route below their date partitions
+ROUTE_PARTITIONED = {'vehicle_positions', 'trip_updates'}
+
+def to_datetime(value):
+    """Epoch seconds as a naive UTC datetime; datetimes and None pass through"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.utcfromtimestamp(value)
+    return value if isinstance(value, datetime) else None
+
+def route_partition(route_id):
+    """Directory-safe route partition value"""
+    value = ''.join(char if char.isalnum() or char in '-.' else '_' for char in (route_id or ''))
+    return value if value and value[0] not in '._' else f"unknown{value}"
+
+def vehicle_rows(vehicle_positions):
+    return [dict(vehicle, ts=to_datetime(vehicle.get('timestamp'))) for vehicle in vehicle_positions]
+
+def trip_update_rows(trip_updates):
+    """One row per predicted stop of each trip update"""
+    rows = []
+    for trip_update in trip_updates:
+        ts = to_datetime(trip_update.get('timestamp'))
+        for stop_index, stop in enumerate(trip_update['stops']):
+            rows.append({
+                'ts': ts,
+                'route_id': trip_update.get('route_id'),
+                'trip_id': trip_update.get('trip_id'),
+                'vehicle_id': trip_update.get('vehicle_id'),
+                'line_id': trip_update.get('line_id'),
+                'start_date': trip_update.get('start_date'),
+                'stop_index': stop_index,
+                'stop_id': stop['stop_id'],
+                'arrival': to_datetime(stop['arrival']),
+                'departure': to_datetime(stop['departure']),
+            })
+    return rows
+
+def alert_rows(alerts, resolved=False, ts=None):
+    """Alert versions, stamped with their feed update time unless ts is given"""
+    return [
+        dict(alert, ts=to_datetime(ts or alert.get('updated')), start=to_datetime(alert.get('start')),
+             end=to_datetime(alert.get('end')), resolved=resolved)
+        for alert in alerts
+    ]
+
+def outage_rows(outages, cycle_time):
+    ts = datetime.utcfromtimestamp(int(cycle_time))
+    return [dict(outage, ts=ts) for outage in outages]
+
+class ParquetArchive:
+    """Per-partition row buffers, flushed to Parquet part files and compacted per finished day"""
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        # (dataset, partition path) -> rows
+        self.buffers = defaultdict(list)
+        # Partition directories written to since their last compaction
+        self.touched = set()
+        self.sequence = 0
+
+    @property
+    def enabled(self):
+        return bool(self.root)
+
+    def add(self, dataset, rows):
+        """Buffer rows of a dataset, each tagged with the current ingest cycle"""
+        if not self.enabled or not rows:
+            return
+        cycle_id = current_trace_id()
+        for row in rows:
+            ts = row.get('ts')
+            if ts is None:
+                continue
+            partition = f"date={ts:%Y-%m-%d}"
+            if dataset in ROUTE_PARTITIONED:
+                partition = os.path.join(partition, f"route_id={route_partition(row.get('route_id'))}")
+            self.buffers[(dataset, partition)].append(dict(row, cycle_id=cycle_id))
+
+    def write_file(self, directory, prefix, schema, tables):
+        """Write an iterable of tables into one new file of directory, renamed into place when complete"""
+        self.sequence += 1
+        name = f"{prefix}-{int(time.time())}-{os.getpid()}-{self.sequence:06d}.parquet"
+        temporary = os.path.join(directory, f".{name}.tmp")
+        try:
+            with pq.ParquetWriter(temporary, schema, compression=ARCHIVE_COMPRESSION) as writer:
+                for table in tables:
+                    writer.write_table(table, row_group_size=ARCHIVE_ROW_GROUP_ROWS)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        os.replace(temporary, os.path.join(directory, name))
+
+    def flush(self):
+        """Write every buffered partition as a part file"""
+        buffers, self.buffers = self.buffers, defaultdict(list)
+        for (dataset, partition), rows in buffers.items():
+            directory = os.path.join(self.root, dataset, partition)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                schema = ARCHIVE_SCHEMAS[dataset]
+                self.write_file(directory, 'part', schema, [pa.Table.from_pylist(rows, schema=schema)])
+                self.touched.add(directory)
+                ARCHIVE_ROWS_WRITTEN.labels(dataset=dataset).inc(len(rows))
+            except Exception as e:
+                ARCHIVE_WRITE_ERRORS.labels(dataset=dataset).inc()
+                logger.error(f"Error archiving {len(rows)} {dataset} rows to {directory}: {e}")
+
+    def partition_directories(self):
+        """Every leaf partition directory of the archive"""
+        directories = []
+        for dataset in ARCHIVE_SCHEMAS:
+            pattern = 'date=*/route_id=*' if dataset in ROUTE_PARTITIONED else 'date=*'
+            directories.extend(glob.glob(os.path.join(self.root, dataset, pattern)))
+        return directories
+
+    def compact(self, directories=None):
+        """
+        Merge the files of each finished day's partitions into one file. Checks
+        the partitions written since the last compaction, or the given ones.
+        """
+        if not self.enabled:
+            return
+        if directories is None:
+            directories, self.touched = self.touched, set()
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        for directory in directories:
+            date = next((part[5:] for part in directory.split(os.sep) if part.startswith('date=')), today)
+            if date >= today:
+                # Still being written: check again once the day is over
+                self.touched.add(directory)
+                continue
+            try:
+                self.compact_partition(directory)
+            except Exception as e:
+                logger.error(f"Error compacting archive partition {directory}: {e}")
+
+    def compact_partition(self, directory):
+        parts = sorted(glob.glob(os.path.join(directory, '*.parquet')))
+        if len(parts) < 2:
+            return
+        schema = pq.read_schema(parts[0])
+        self.write_file(directory, 'day', schema, row_groups(parts, schema))
+        # The merged file is in place before its parts go; a crash in between
+        # leaves duplicates rather than losing rows
+        for part in parts:
+            os.remove(part)
+        logger.info(f"Compacted {len(parts)} archive files in {directory}")
+
+def row_groups(paths, schema):
+    """The rows of Parquet files as tables of about ARCHIVE_ROW_GROUP_ROWS rows, one in memory at a time"""
+    tables, rows = [], 0
+    for path in paths:
+        table = pq.read_table(path).cast(schema)
+        tables.append(table)
+        rows += table.num_rows
+        if rows >= ARCHIVE_ROW_GROUP_ROWS:
+            yield pa.concat_tables(tables)
+            tables, rows = [], 0
+    if tables:
+        yield pa.concat_tables(tables)
+
+def changed_trips(previous_trips, trips):
+    """Ids of the trips whose stop times differ from the previous cycle's"""
+    return {trip_id for trip_id, trip in trips.items() if previous_trips.get(trip_id) != trip}
@@ -0,0 +1,80 @@
+"""
+Next-arrival boards per stop, maintained incrementally from GTFS-RT trip updates.
+
+Each feed's trip updates replace that feed's previous ones: only trips whose
+stop times changed (or that appeared or disappeared) are removed from and
+re-inserted into the sorted per-stop boards, and the stops they touch are
+reported so only those boards are written to MongoDB.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+class ArrivalsIndex:
+    """Sorted (arrival, route_id, trip_id) lists per stop_id across all feeds"""
+
+    def __init__(self):
+        self.boards = defaultdict(list)
+        # Per feed: trip_id -> (route_id, ((stop_id, arrival), ...))
+        self.feed_trips = {}
+
+    def update_feed(self, line_id, trip_updates):
+        """Replace a feed's trips with trip_updates; returns the stop_ids whose boards changed"""
+        trips = {}
+        for trip_update in trip_updates:
+            stop_times = tuple(
+                (stop['stop_id'], stop['arrival'] or stop['departure'])
+                for stop in trip_update['stops']
+                if stop['stop_id'] and (stop['arrival'] or stop['departure'])
+            )
+            if trip_update['trip_id'] and stop_times:
+                trips[trip_update['trip_id']] = (trip_update['route_id'], stop_times)
+
+        previous = self.feed_trips.get(line_id, {})
+        changed = set()
+        for trip_id in previous.keys() | trips.keys():
+            old, new = previous.get(trip_id), trips.get(trip_id)
+            if old == new:
+                continue
+            old_entries = self.trip_entries(trip_id, old)
+            new_entries = self.trip_entries(trip_id, new)
+            for stop_id, entry in old_entries - new_entries:
+                board = self.boards[stop_id]
+                position = bisect_left(board, entry)
+                if position < len(board) and board[position] == entry:
+                    del board[position]
+                if not board:
+                    del self.boards[stop_id]
+                changed.add(stop_id)
+            for stop_id, entry in new_entries - old_entries:
+                insort(self.boards[stop_id], entry)
+                changed.add(stop_id)
+
+        self.feed_trips[line_id] = trips
+        return changed
+
+    @staticmethod
+    def trip_entries(trip_id, trip):
+        """Set of (stop_id, board entry) pairs for a trip's stop times"""
+        if trip is None:
+            return set()
+        route_id, stop_times = trip
+        return {(stop_id, (arrival, route_id, trip_id)) for stop_id, arrival in stop_times}
+
+    def upcoming(self, stop_id, now, limit):
+        """The next limit arrivals at a stop from epoch second now"""
+        board = self.boards.get(stop_id, [])
+        start = bisect_left(board, (now,))
+        return board[start:start + limit]
+
+    def board_documents(self, stop_ids, now, limit):
+        """station_arrivals documents with the next limit arrivals of each stop"""
+        return [
+            {
+                'stop_id': stop_id,
+                'arrivals': [
+                    {'arrival': arrival, 'route_id': route_id, 'trip_id': trip_id}
+                    for arrival, route_id, trip_id in self.upcoming(stop_id, now, limit)
+                ]
+            }
+            for stop_id in sorted(stop_ids)
+        ]
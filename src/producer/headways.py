@@ -0,0 +1,129 @@
+"""
+Headway and bunching analytics over every predicted arrival of a cycle.
+
+The arrivals of all feeds are flattened into parallel NumPy arrays (route
+and stop ids interned to integer codes, and arrival times) and sorted once
+by route, stop and time. The difference between consecutive arrivals of a
+route at the same stop is a headway. Each headway is attributed to its route
+and direction (the N/S platform suffix of subway stop ids), and each
+route/direction's count, mean, median and max come from bincounts and one
+segmented sort, with no Python loop over arrivals.
+
+A headway below HEADWAY_BUNCHING_RATIO times its route/direction's median
+counts as bunching, one above HEADWAY_GAP_RATIO times the median as a gap.
+One compact document per route and direction is stored each cycle in
+route_headways, keyed by (route_id, direction, ts).
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Predicted arrivals this far ahead of the cycle are included
+HEADWAY_HORIZON_SECONDS = int(os.getenv('HEADWAY_HORIZON_SECONDS', 3600))
+
+# A headway below this fraction of its route/direction's median is bunching
+HEADWAY_BUNCHING_RATIO = float(os.getenv('HEADWAY_BUNCHING_RATIO', 0.25))
+
+# A headway above this multiple of its route/direction's median is a gap
+HEADWAY_GAP_RATIO = float(os.getenv('HEADWAY_GAP_RATIO', 2.0))
+
+# Direction codes: subway platforms end in N or S; other stops have no direction
+DIRECTIONS = ('', 'N', 'S')
+
+def feed_arrivals(feed_trips):
+    """
+    Flatten ArrivalsIndex.feed_trips into (route_names, stop_names, routes,
+    stops, arrivals): the distinct ids, and per arrival the codes of its route
+    and stop (positions in those lists) and its epoch-second time.
+    """
+    route_codes, stop_codes = {}, {}
+    routes, stops, arrivals = [], [], []
+    for trips in feed_trips.values():
+        for route_id, stop_times in trips.values():
+            route = route_codes.setdefault(route_id or '', len(route_codes))
+            routes.extend([route] * len(stop_times))
+            for stop_id, arrival in stop_times:
+                stops.append(stop_codes.setdefault(stop_id, len(stop_codes)))
+                arrivals.append(arrival)
+    return (
+        list(route_codes), list(stop_codes),
+        np.array(routes, dtype=np.int64), np.array(stops, dtype=np.int64), np.array(arrivals, dtype=np.int64)
+    )
+
+def direction_codes(stop_ids):
+    """Index into DIRECTIONS of each stop id's platform suffix"""
+    stops = np.asarray(stop_ids, dtype=str)
+    codes = np.zeros(len(stops), dtype=np.int64)
+    codes[np.char.endswith(stops, 'N')] = 1
+    codes[np.char.endswith(stops, 'S')] = 2
+    return codes
+
+def compute_headways(route_names, stop_names, routes, stops, arrivals, now, horizon=HEADWAY_HORIZON_SECONDS):
+    """
+    Headway statistics per route and direction from the arrays of
+    feed_arrivals; returns route_headways documents stamped with now.
+    """
+    now = int(now)
+    window = (arrivals >= now) & (arrivals <= now + horizon)
+    if not window.any():
+        return []
+    routes, stops, arrivals = routes[window], stops[window], arrivals[window]
+    groups = routes * len(DIRECTIONS) + direction_codes(stop_names)[stops]
+    group_count = len(route_names) * len(DIRECTIONS)
+
+    # Consecutive arrivals of a route at the same stop are one headway apart:
+    # sort on one packed (route, stop, seconds after now) key
+    route_stops = routes * len(stop_names) + stops
+    order = np.argsort((route_stops << 32) | (arrivals - now))
+    route_stops, arrivals, groups = route_stops[order], arrivals[order], groups[order]
+    same = route_stops[1:] == route_stops[:-1]
+    headways = np.diff(arrivals)[same]
+    headway_groups = groups[1:][same]
+
+    arrival_counts = np.bincount(groups, minlength=group_count)
+    counts = np.bincount(headway_groups, minlength=group_count)
+    totals = np.bincount(headway_groups, weights=headways, minlength=group_count)
+
+    # Sort headways within each group: medians and maxima are then positional
+    by_group = np.lexsort((headways, headway_groups))
+    sorted_headways = headways[by_group]
+    starts = np.cumsum(counts) - counts
+    has_headways = counts > 0
+    medians = np.zeros(group_count)
+    maxima = np.zeros(group_count, dtype=np.int64)
+    low = starts[has_headways] + (counts[has_headways] - 1) // 2
+    high = starts[has_headways] + counts[has_headways] // 2
+    medians[has_headways] = (sorted_headways[low] + sorted_headways[high]) / 2
+    maxima[has_headways] = sorted_headways[starts[has_headways] + counts[has_headways] - 1]
+
+    group_medians = medians[headway_groups]
+    bunched = np.bincount(headway_groups[headways < HEADWAY_BUNCHING_RATIO * group_medians], minlength=group_count)
+    gaps = np.bincount(headway_groups[headways > HEADWAY_GAP_RATIO * group_medians], minlength=group_count)
+
+    ts = datetime.utcfromtimestamp(int(now))
+    docs = []
+    for group in np.flatnonzero(arrival_counts):
+        route, direction = divmod(int(group), len(DIRECTIONS))
+        count = int(counts[group])
+        docs.append({
+            'ts': ts,
+            'route_id': route_names[route],
+            'direction': DIRECTIONS[direction],
+            'arrivals': int(arrival_counts[group]),
+            'headways': count,
+            'mean_headway': round(float(totals[group]) / count, 1) if count else None,
+            'median_headway': float(medians[group]) if count else None,
+            'max_headway': int(maxima[group]) if count else None,
+            'bunched': int(bunched[group]),
+            'gaps': int(gaps[group]),
+            'bunching': bool(bunched[group]),
+        })
+    return docs
+
+def headway_documents(feed_trips, now):
+    """route_headways documents for the trips of every feed"""
+    route_names, stop_names, routes, stops, arrivals = feed_arrivals(feed_trips)
+    if not len(arrivals):
+        return []
+    return compute_headways(route_names, stop_names, routes, stops, arrivals, now)
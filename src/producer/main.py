@@ -6,16 +6,38 @@
 import os
 import time
 import json
+import signal
 import logging
+import threading
 import schedule
 from dotenv import load_dotenv
-from confluent_kafka import Producer
+from confluent_kafka import Producer, KafkaError
+from confluent_kafka.admin import AdminClient, NewTopic
 import requests
 from google.transit import gtfs_realtime_pb2
 from datetime import datetime
+from collections import defaultdict
 import pymongo
-from pymongo import MongoClient, UpdateOne
-import random  # Add import at the top of the file with other imports
+from pymongo import MongoClient, UpdateOne, InsertOne
+from opentelemetry import trace
+from metrics import (
+    FEED_FETCH_SECONDS, FEED_PAYLOAD_BYTES, FEED_PARSE_SECONDS, FEED_ERRORS,
+    FEED_FRESHNESS_SECONDS, KAFKA_DELIVERY_SECONDS, KAFKA_DELIVERY_ERRORS,
+    MONGO_WRITE_SECONDS, MONGO_DOCUMENTS_WRITTEN, MONGO_WRITE_ERRORS,
+    CYCLE_SECONDS, start_metrics_server
+)
+from tracing import tracer, setup_tracing, current_trace_id, kafka_trace_headers, record_span
+from profiling import profiled, setup_profiling
+from common.gtfs_static import load_static_gtfs
+from arrivals import ArrivalsIndex
+from headways import headway_documents
+from archive import (
+    ARCHIVE_FLUSH_SECONDS, ParquetArchive, vehicle_rows, trip_update_rows, alert_rows, outage_rows, changed_trips
+)
+from alerts import AlertProcessor, build_alert
+from reliability import ReliabilityTracker
+from write_behind import WRITE_BEHIND_ENABLED, WRITE_BEHIND_SHUTDOWN_SECONDS, WriteBehindQueue
+from common.health import health
 
 # Configure logging
 logging.basicConfig(
@@ -42,11 +64,22 @@ KAFKA_TOPIC_ELEVATOR_CURRENT = os.getenv('KAFKA_TOPIC_ELEVATOR_CURRENT', 'mta-el
 KAFKA_TOPIC_ELEVATOR_UPCOMING = os.getenv('KAFKA_TOPIC_ELEVATOR_UPCOMING', 'mta-elevator-upcoming')
 KAFKA_TOPIC_ELEVATOR_EQUIPMENT = os.getenv('KAFKA_TOPIC_ELEVATOR_EQUIPMENT', 'mta-elevator-equipment')
 
+# Compacted latest-state topics keyed by vehicle and alert id, read by the API's
+# in-memory state store; an empty name disables publishing that state
+KAFKA_TOPIC_VEHICLE_STATE = os.getenv('KAFKA_TOPIC_VEHICLE_STATE', 'mta-vehicle-state')
+KAFKA_TOPIC_ALERT_STATE = os.getenv('KAFKA_TOPIC_ALERT_STATE', 'mta-alert-state')
+
 # Data refresh intervals (in seconds)
 SUBWAY_REFRESH_INTERVAL = int(os.getenv('SUBWAY_REFRESH_INTERVAL', 30))
 ALERTS_REFRESH_INTERVAL = int(os.getenv('ALERTS_REFRESH_INTERVAL', 60))
 ELEVATOR_REFRESH_INTERVAL = int(os.getenv('ELEVATOR_REFRESH_INTERVAL', 120))
 
+# Upcoming arrivals stored per stop in station_arrivals
+ARRIVALS_BOARD_SIZE = int(os.getenv('ARRIVALS_BOARD_SIZE', 20))
+
+# Port for the Prometheus metrics endpoint
+METRICS_PORT = int(os.getenv('PRODUCER_METRICS_PORT', 9100))
+
 # MTA API Endpoints
 SUBWAY_ENDPOINTS = {
     'ACE': 'https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/nyct%2Fgtfs-ace',
@@ -79,89 +112,296 @@ producer_config = {
     'client.id': 'mta-producer'
 }
 
-producer = Producer(producer_config)
+# Kafka producer, created on first use so importing this module stays cheap
+producer = None
+
+def get_producer():
+    """Return the shared Kafka producer, creating it on first use"""
+    global producer
+    if producer is None:
+        producer = Producer(producer_config)
+    return producer
 
 # MongoDB Configuration as a fallback if Kafka/Spark pipeline has issues
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/')
 MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'mta_data')
 
-# Initialize MongoDB client for direct data insertion
-try:
-    mongo_client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    mongo_db = mongo_client[MONGODB_DATABASE]
-    logger.info(f"Connected to MongoDB at {MONGODB_URI}")
-except Exception as e:
-    logger.error(f"Error connecting to MongoDB: {e}")
-    mongo_client = None
-    mongo_db = None
+# MongoDB client for direct data insertion, created on first use
+mongo_db = None
+
+def get_mongo_db():
+    """Return the MongoDB database for direct writes, or None if the client cannot be created"""
+    global mongo_db
+    if mongo_db is None:
+        try:
+            mongo_db = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)[MONGODB_DATABASE]
+        except Exception as e:
+            logger.error(f"Error connecting to MongoDB: {e}")
+            health.failed('mongodb', e)
+    return mongo_db
+
+# Static GTFS stop index, loaded in run(); None stores vehicles without a position without coordinates
+static_gtfs = None
+
+# Next-arrival boards per stop, updated from each subway cycle's trip updates
+arrivals_index = ArrivalsIndex()
+
+# Alerts of the previous cycle, so only changed alerts are rebuilt and written
+alert_processor = AlertProcessor()
+
+# Open and scheduled elevator/escalator outages and the reliability totals they feed
+reliability_tracker = ReliabilityTracker()
+
+# Vehicle state keys published per subway feed in its last successful cycle,
+# so vehicles that leave a feed are deleted from the compacted topic
+published_vehicle_keys = {}
 
 def delivery_report(err, msg):
     """Callback function for Kafka producer to report delivery status"""
     if err is not None:
+        KAFKA_DELIVERY_ERRORS.labels(topic=msg.topic()).inc()
+        health.failed('kafka', err)
         logger.error(f'Message delivery failed: {err}')
     else:
+        health.ready('kafka')
+        latency = msg.latency()
+        if latency is not None:
+            KAFKA_DELIVERY_SECONDS.labels(topic=msg.topic()).observe(latency)
         logger.debug(f'Message delivered to {msg.topic()} [{msg.partition()}]')
 
-def write_to_mongodb(collection_name, data, is_vehicle=False):
-    """Write data directly to MongoDB"""
-    if mongo_client is None:
+# Idempotency keys per collection: documents are upserted on these fields so
+# retried cycles, Kafka replays and the processor writing the same data
+# overwrite existing documents instead of adding duplicates
+COLLECTION_KEYS = {
+    'vehicle_positions': ['vehicle_key', 'timestamp'],
+    'latest_vehicle_positions': ['vehicle_key'],
+    'service_alerts': ['id', 'updated'],
+    'current_elevator_outages': ['equipment_id'],
+    'upcoming_elevator_outages': ['equipment_id'],
+    'elevator_equipment': ['equipment_id'],
+    'station_arrivals': ['stop_id'],
+    'current_alerts': ['id'],
+    'vehicle_history': ['ts', 'route_id'],
+    'route_headways': ['route_id', 'direction', 'ts'],
+    'elevator_outage_events': ['equipment_id', 'event', 'at'],
+    'elevator_reliability': ['equipment_id'],
+    'station_reliability': ['station'],
+}
+
+# BSON types of key fields, used to build partial unique indexes that skip
+# documents without a usable key
+KEY_FIELD_TYPES = {
+    'vehicle_key': 'string',
+    'timestamp': 'date',
+    'id': 'string',
+    'updated': 'date',
+    'equipment_id': 'string',
+    'stop_id': 'string',
+    'ts': 'date',
+    'route_id': 'string',
+    'direction': 'string',
+    'event': 'string',
+    'at': 'date',
+    'station': 'string',
+}
+
+# Epoch-second fields stored as datetimes, matching the processor's timestamp schema
+TIMESTAMP_FIELDS = ('timestamp', 'updated')
+
+# GeoJSON point field of each collection with vehicle positions, backed by a 2dsphere index
+GEO_COLLECTIONS = {
+    'vehicle_positions': 'location',
+    'latest_vehicle_positions': 'location',
+}
+
+# Collections whose newest processed_at marks the ingest generation the API caches or syncs against
+GENERATION_COLLECTIONS = ['latest_vehicle_positions', 'station_arrivals', 'current_alerts', 'elevator_equipment']
+
+# Non-unique lookup indexes: the API resolves station searches to equipment ids in memory and matches outages by id
+LOOKUP_INDEXES = {
+    'elevator_outages': 'equipment_id',
+}
+
+# History collections whose documents expire MONGODB_HOT_RETENTION_HOURS after
+# processed_at, leaving older data to the Parquet archive (0 keeps everything)
+MONGODB_HOT_RETENTION_HOURS = int(os.getenv('MONGODB_HOT_RETENTION_HOURS', 0))
+HOT_COLLECTIONS = ['vehicle_positions', 'vehicle_history', 'route_headways', 'elevator_outages']
+
+def ensure_retention(mongo_db, collection_name):
+    """Create, update or drop a history collection's TTL index to match MONGODB_HOT_RETENTION_HOURS"""
+    collection = mongo_db[collection_name]
+    indexes = collection.index_information()
+    if not MONGODB_HOT_RETENTION_HOURS:
+        if 'processed_at_ttl' in indexes:
+            collection.drop_index('processed_at_ttl')
+        return
+    seconds = MONGODB_HOT_RETENTION_HOURS * 3600
+    if 'processed_at_ttl' not in indexes:
+        collection.create_index([('processed_at', pymongo.ASCENDING)], name='processed_at_ttl', expireAfterSeconds=seconds)
+    elif indexes['processed_at_ttl'].get('expireAfterSeconds') != seconds:
+        mongo_db.command('collMod', collection_name, index={'name': 'processed_at_ttl', 'expireAfterSeconds': seconds})
+
+def ensure_indexes():
+    """Create the unique indexes backing idempotent writes, plus the geo, generation and retention indexes"""
+    mongo_db = get_mongo_db()
+    if mongo_db is None:
+        return
+    
+    for collection_name, key_fields in COLLECTION_KEYS.items():
+        try:
+            mongo_db[collection_name].create_index(
+                [(field, pymongo.ASCENDING) for field in key_fields],
+                name='_'.join(key_fields) + '_unique',
+                unique=True,
+                partialFilterExpression={field: {'$type': KEY_FIELD_TYPES[field]} for field in key_fields}
+            )
+        except Exception as e:
+            logger.error(f"Error creating unique index on {collection_name}: {e}")
+    
+    # Vehicles without a vehicle id used to be inserted again every cycle; the
+    # latest-state copies without a vehicle_key are those duplicates
+    try:
+        mongo_db['latest_vehicle_positions'].delete_many({'vehicle_key': {'$exists': False}})
+    except Exception as e:
+        logger.error(f"Error removing unkeyed latest vehicle positions: {e}")
+    
+    for collection_name, field in GEO_COLLECTIONS.items():
+        try:
+            mongo_db[collection_name].create_index([(field, pymongo.GEOSPHERE)], name=f"{field}_2dsphere")
+        except Exception as e:
+            logger.error(f"Error creating 2dsphere index on {collection_name}: {e}")
+    
+    for collection_name in GENERATION_COLLECTIONS:
+        try:
+            mongo_db[collection_name].create_index([('processed_at', pymongo.DESCENDING)], name='processed_at_-1')
+        except Exception as e:
+            logger.error(f"Error creating processed_at index on {collection_name}: {e}")
+    
+    for collection_name, field in LOOKUP_INDEXES.items():
+        try:
+            mongo_db[collection_name].create_index([(field, pymongo.ASCENDING)], name=f"{field}_1")
+        except Exception as e:
+            logger.error(f"Error creating {field} index on {collection_name}: {e}")
+
+    for collection_name in HOT_COLLECTIONS:
+        try:
+            ensure_retention(mongo_db, collection_name)
+        except Exception as e:
+            logger.error(f"Error updating the retention index on {collection_name}: {e}")
+
+@tracer.start_as_current_span('mongo_write')
+def write_to_mongodb(collection_name, data):
+    """Write data directly to MongoDB, upserting on the collection's idempotency key"""
+    span = trace.get_current_span()
+    span.set_attribute('mongodb.collection', collection_name)
+    span.set_attribute('mta.documents', len(data) if data else 0)
+    mongo_db = get_mongo_db()
+    if mongo_db is None:
         logger.error("MongoDB client not initialized")
         return
     
+    if not data:
+        return
+    
     try:
         collection = mongo_db[collection_name]
+        key_fields = COLLECTION_KEYS.get(collection_name)
+        # Tag documents with the ingest cycle that wrote them
+        cycle_id = current_trace_id()
         
-        # For vehicle positions, we want to maintain the latest position for each vehicle
-        if is_vehicle and data:
-            # Create bulk operations to upsert vehicle positions
-            bulk_ops = []
-            for vehicle in data:
-                # Add processed timestamp
-                vehicle['processed_at'] = datetime.now()
-                
-                # Convert timestamp to datetime if it's an integer
-                if 'timestamp' in vehicle and isinstance(vehicle['timestamp'], int):
-                    vehicle['timestamp'] = datetime.fromtimestamp(vehicle['timestamp'])
-                
-                # Upsert based on vehicle_id to maintain latest positions
-                vehicle_id = vehicle.get('vehicle_id')
-                if vehicle_id:
-                    bulk_ops.append(
-                        UpdateOne(
-                            {'vehicle_id': vehicle_id},
-                            {'$set': vehicle},
-                            upsert=True
-                        )
-                    )
-                else:
-                    # Fallback to simple insert if vehicle_id is not available
-                    collection.insert_one(vehicle)
+        bulk_ops = []
+        for doc in data:
+            # Add processed timestamp
+            doc['processed_at'] = datetime.utcnow()
+            doc.setdefault('cycle_id', cycle_id)
             
-            # Execute bulk operations if any
-            if bulk_ops:
-                result = collection.bulk_write(bulk_ops)
-                logger.info(f"MongoDB: Updated {result.modified_count}, inserted {result.upserted_count} vehicle positions")
-        else:
-            # For non-vehicle data, just insert
-            if data:
-                # Add processed timestamp to each document
-                for doc in data:
-                    doc['processed_at'] = datetime.now()
-                
-                result = collection.insert_many(data)
-                logger.info(f"MongoDB: Inserted {len(result.inserted_ids)} documents into {collection_name}")
+            # Convert epoch-second timestamps to datetimes
+            for field in TIMESTAMP_FIELDS:
+                if isinstance(doc.get(field), int):
+                    doc[field] = datetime.utcfromtimestamp(doc[field])
+            
+            if key_fields and all(doc.get(field) is not None for field in key_fields):
+                # Upsert on the key so a repeated write replaces rather than duplicates
+                bulk_ops.append(
+                    UpdateOne(
+                        {field: doc[field] for field in key_fields},
+                        {'$set': doc},
+                        upsert=True
+                    )
+                )
+            else:
+                # Fallback to a plain insert for unkeyed collections or documents without a key
+                bulk_ops.append(InsertOne(dict(doc)))
+        
+        with MONGO_WRITE_SECONDS.labels(collection=collection_name).time():
+            result = collection.bulk_write(bulk_ops, ordered=False)
+        MONGO_DOCUMENTS_WRITTEN.labels(collection=collection_name).inc(len(bulk_ops))
+        health.ready('mongodb')
+        logger.info(
+            f"MongoDB: Updated {result.modified_count}, upserted {result.upserted_count}, "
+            f"inserted {result.inserted_count} documents in {collection_name}"
+        )
     except Exception as e:
+        MONGO_WRITE_ERRORS.labels(collection=collection_name).inc()
+        health.failed('mongodb', e)
+        span.record_exception(e)
         logger.error(f"Error writing to MongoDB collection {collection_name}: {e}")
 
+# Collections holding only the latest document per key: a queued document is
+# superseded by a newer one with the same key
+SNAPSHOT_COLLECTIONS = [
+    'latest_vehicle_positions', 'station_arrivals', 'current_alerts', 'current_elevator_outages',
+    'upcoming_elevator_outages', 'elevator_equipment', 'elevator_reliability', 'station_reliability'
+]
+
+# MongoDB writes run behind the fetch cycles, started in run() when WRITE_BEHIND_ENABLED is set
+mongo_writer = WriteBehindQueue(
+    write_to_mongodb,
+    {collection_name: COLLECTION_KEYS[collection_name] for collection_name in SNAPSHOT_COLLECTIONS}
+)
+
+# Columnar archive of the ingested data, written when ARCHIVE_DIR is set
+archive = ParquetArchive()
+
+# Fields of each vehicle kept in its vehicle_history snapshot
+HISTORY_FIELDS = (
+    'id', 'line_id', 'trip_id', 'route_id', 'vehicle_id', 'current_status',
+    'current_stop_sequence', 'stop_id', 'latitude', 'longitude', 'bearing', 'timestamp'
+)
+
+def history_snapshots(vehicle_positions, cycle_time):
+    """
+    The cycle's fleet as vehicle_history documents: one per route, all stamped
+    with the cycle time, so the (ts, route_id) key finds any instant's fleet
+    with an index seek.
+    """
+    ts = datetime.utcfromtimestamp(int(cycle_time))
+    routes = defaultdict(list)
+    for vehicle in vehicle_positions:
+        snapshot = {field: vehicle.get(field) for field in HISTORY_FIELDS}
+        if isinstance(snapshot['timestamp'], int):
+            snapshot['timestamp'] = datetime.utcfromtimestamp(snapshot['timestamp'])
+        routes[vehicle.get('route_id') or ''].append(snapshot)
+    return [
+        {'ts': ts, 'route_id': route_id, 'count': len(vehicles), 'vehicles': vehicles}
+        for route_id, vehicles in routes.items()
+    ]
+
 def fetch_gtfs_feed(endpoint, line_id):
     """Fetch GTFS feed from MTA API and parse it"""
     try:
-        response = requests.get(endpoint, headers=HEADERS)
-        response.raise_for_status()
+        with FEED_FETCH_SECONDS.labels(feed=line_id).time(), tracer.start_as_current_span('http_get'):
+            response = requests.get(endpoint, headers=HEADERS)
+            response.raise_for_status()
+        FEED_PAYLOAD_BYTES.labels(feed=line_id).observe(len(response.content))
+        parse_started = time.perf_counter()
+        parse_started_ns = time.time_ns()
         
         # Parse the protobuf message
         feed = gtfs_realtime_pb2.FeedMessage()
         feed.ParseFromString(response.content)
+        FEED_FRESHNESS_SECONDS.labels(feed=line_id).set(time.time() - feed.header.timestamp)
+        trace.get_current_span().set_attribute('mta.feed_timestamp', feed.header.timestamp)
         
         # Convert to JSON-serializable format
         entity_list = []
@@ -196,52 +436,18 @@ def fetch_gtfs_feed(endpoint, line_id):
             elif entity.HasField('vehicle'):
                 vehicle = entity.vehicle
                 
-                # Get latitude/longitude from vehicle data or generate mock data if missing
-                lat = None
-                lon = None
+                # Use the reported position, or place the vehicle at its current stop
+                lat = lng = bearing = None
                 if vehicle.HasField('position'):
                     lat = vehicle.position.latitude
-                    lon = vehicle.position.longitude
-                
-                # If coordinates are missing, generate mock data based on route ID for NYC area
-                if lat is None or lon is None:
-                    # Get the route ID to create more realistic positions based on subway lines
-                    route_id = vehicle.trip.route_id
-                    
-                    # Different lines operate in different areas
-                    if route_id in ['1', '2', '3']:  # West side
-                        lat = random.uniform(40.70, 40.85)
-                        lng = random.uniform(-74.01, -73.96)
-                    elif route_id in ['4', '5', '6']:  # East side
-                        lat = random.uniform(40.70, 40.85) 
-                        lng = random.uniform(-73.98, -73.92)
-                    elif route_id in ['N', 'Q', 'R', 'W']:  # Broadway
-                        lat = random.uniform(40.72, 40.76)
-                        lng = random.uniform(-73.99, -73.96)
-                    elif route_id in ['B', 'D', 'F', 'M']:  # 6th Avenue
-                        lat = random.uniform(40.72, 40.78)
-                        lng = random.uniform(-73.99, -73.95)
-                    elif route_id in ['G']:  # Brooklyn-Queens
-                        lat = random.uniform(40.68, 40.74)
-                        lng = random.uniform(-73.95, -73.93)
-                    elif route_id in ['L']:  # 14th Street
-                        lat = random.uniform(40.71, 40.74)
-                        lng = random.uniform(-74.01, -73.92)
-                    elif route_id in ['J', 'Z']:  # Jamaica line
-                        lat = random.uniform(40.67, 40.73)
-                        lng = random.uniform(-73.99, -73.88)
-                    elif route_id in ['7']:  # Flushing line
-                        lat = random.uniform(40.74, 40.75)
-                        lng = random.uniform(-74.0, -73.84)
-                    elif route_id in ['A', 'C', 'E']:  # 8th Avenue
-                        lat = random.uniform(40.70, 40.85)
-                        lng = random.uniform(-74.01, -73.97)
-                    else:  # Default - Manhattan area
-                        lat = random.uniform(40.70, 40.88)
-                        lng = random.uniform(-74.02, -73.91)
-                else:
-                    lng = lon
+                    lng = vehicle.position.longitude
+                    bearing = vehicle.position.bearing
+                elif static_gtfs is not None:
+                    stop_position = static_gtfs.stop_position(vehicle.stop_id)
+                    if stop_position:
+                        lat, lng = stop_position
                 
+                vehicle_id = vehicle.vehicle.id if vehicle.HasField('vehicle') else None
                 vehicle_data = {
                     'id': entity.id,
                     'line_id': line_id,
@@ -249,20 +455,32 @@ def fetch_gtfs_feed(endpoint, line_id):
                     'route_id': vehicle.trip.route_id,
                     'start_time': vehicle.trip.start_time,
                     'start_date': vehicle.trip.start_date,
-                    'vehicle_id': vehicle.vehicle.id if vehicle.HasField('vehicle') else None,
+                    'vehicle_id': vehicle_id,
+                    # Key of the vehicle: subway feeds usually leave the vehicle id
+                    # out, so fall back to the feed entity id
+                    'vehicle_key': vehicle_id or entity.id,
                     'current_status': vehicle.current_status,
                     'current_stop_sequence': vehicle.current_stop_sequence,
                     'stop_id': vehicle.stop_id,
                     'latitude': lat,
                     'longitude': lng,
-                    'bearing': vehicle.position.bearing if vehicle.HasField('position') else random.uniform(0, 359),
+                    'bearing': bearing,
+                    # Nested position for the API and a GeoJSON point for geospatial queries
+                    'position': {'latitude': lat, 'longitude': lng, 'bearing': bearing},
+                    'location': {'type': 'Point', 'coordinates': [lng, lat]} if lat is not None else None,
                     'timestamp': feed.header.timestamp
                 }
                 vehicle_positions.append(vehicle_data)
         
+        FEED_PARSE_SECONDS.labels(feed=line_id).observe(time.perf_counter() - parse_started)
+        record_span('parse_feed', parse_started_ns, time.time_ns(), {
+            'mta.entities': len(feed.entity)
+        })
         return entity_list, vehicle_positions
     
     except Exception as e:
+        FEED_ERRORS.labels(feed=line_id).inc()
+        trace.get_current_span().record_exception(e)
         logger.error(f"Error fetching GTFS feed from {endpoint}: {e}")
         return [], []
 
@@ -271,58 +489,10 @@ def process_alerts(alerts_data):
     processed_alerts = []
     
     try:
-        if 'entity' in alerts_data:
-            for entity in alerts_data['entity']:
-                if 'alert' in entity:
-                    alert = entity['alert']
-                    
-                    # Extract header text
-                    header = ""
-                    if 'header_text' in alert and 'translation' in alert['header_text']:
-                        for translation in alert['header_text']['translation']:
-                            if translation.get('language') == 'en':
-                                header = translation.get('text', '')
-                                break
-                    
-                    # Extract description text
-                    description = ""
-                    if 'description_text' in alert and 'translation' in alert['description_text']:
-                        for translation in alert['description_text']['translation']:
-                            if translation.get('language') == 'en':
-                                description = translation.get('text', '')
-                                break
-                    
-                    # Get affected routes
-                    routes = []
-                    if 'informed_entity' in alert:
-                        for entity in alert['informed_entity']:
-                            if 'route_id' in entity and entity['route_id'] not in routes:
-                                routes.append(entity['route_id'])
-                    
-                    # Get time details
-                    start_time = None
-                    end_time = None
-                    if 'active_period' in alert and alert['active_period']:
-                        period = alert['active_period'][0]
-                        if 'start' in period:
-                            start_time = period['start']
-                        if 'end' in period:
-                            end_time = period['end']
-                    
-                    alert_obj = {
-                        'id': entity.get('id', ''),
-                        'alert_type': alert.get('cause', ''),
-                        'effect': alert.get('effect', ''),
-                        'header': header,
-                        'description': description,
-                        'start': start_time,
-                        'end': end_time,
-                        'updated': alerts_data.get('header', {}).get('timestamp'),
-                        'severity': 'UNKNOWN',  # This would need more processing based on effect
-                        'routes': routes
-                    }
-                    
-                    processed_alerts.append(alert_obj)
+        updated = alerts_data.get('header', {}).get('timestamp')
+        for entity in alerts_data.get('entity', []):
+            if 'alert' in entity:
+                processed_alerts.append(build_alert(entity, updated))
     except Exception as e:
         logger.error(f"Error processing alerts: {e}")
     
@@ -349,8 +519,8 @@ def process_elevator_equipment(equipment_data):
     
     return equipment_list
 
-def process_elevator_outages(outages_data):
-    """Process elevator outages data"""
+def process_elevator_outages(outages_data, outage_type='current'):
+    """Process elevator outages data from the current or upcoming outages feed"""
     outages = []
     
     try:
@@ -366,7 +536,8 @@ def process_elevator_outages(outages_data):
                     'outage_end': outage.get('estimated_return_date_time'),
                     'reason': outage.get('reason', {}).get('reason_name', ''),
                     'latest_status': outage.get('latest_status', {}).get('status_name', ''),
-                    'is_current': True
+                    'type': outage_type,
+                    'is_current': outage_type == 'current'
                 }
                 outages.append(outage_obj)
     except Exception as e:
@@ -374,43 +545,142 @@ def process_elevator_outages(outages_data):
     
     return outages
 
-def fetch_json_feed(endpoint):
+def fetch_json_feed(endpoint, feed_name='json'):
     """Fetch JSON feed from MTA API"""
     try:
-        response = requests.get(endpoint, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        with FEED_FETCH_SECONDS.labels(feed=feed_name).time(), tracer.start_as_current_span('http_get'):
+            response = requests.get(endpoint, headers=HEADERS)
+            response.raise_for_status()
+        FEED_PAYLOAD_BYTES.labels(feed=feed_name).observe(len(response.content))
+        
+        with FEED_PARSE_SECONDS.labels(feed=feed_name).time(), tracer.start_as_current_span('parse_feed'):
+            data = response.json()
+        
+        # GTFS-RT style JSON feeds carry the generation time in their header
+        header_timestamp = data.get('header', {}).get('timestamp') if isinstance(data, dict) else None
+        if header_timestamp:
+            FEED_FRESHNESS_SECONDS.labels(feed=feed_name).set(time.time() - int(header_timestamp))
+            trace.get_current_span().set_attribute('mta.feed_timestamp', int(header_timestamp))
+        return data
     except Exception as e:
+        FEED_ERRORS.labels(feed=feed_name).inc()
+        trace.get_current_span().record_exception(e)
         logger.error(f"Error fetching JSON feed from {endpoint}: {e}")
         return {}
 
+def publish(topic, message, key=None):
+    """Publish a message envelope to Kafka with the cycle's trace context"""
+    with tracer.start_as_current_span('kafka_publish', attributes={'messaging.destination': topic}):
+        # Tie the message to the ingest cycle for the processor and API
+        message['cycle_id'] = current_trace_id()
+        producer = get_producer()
+        producer.produce(
+            topic,
+            key=key,
+            value=json.dumps(message).encode('utf-8'),
+            headers=kafka_trace_headers(),
+            callback=delivery_report
+        )
+        producer.flush()
+
+def ensure_state_topics():
+    """Create the compacted latest-state topics if they do not exist yet"""
+    topics = [
+        NewTopic(topic, num_partitions=1, replication_factor=1, config={'cleanup.policy': 'compact'})
+        for topic in (KAFKA_TOPIC_VEHICLE_STATE, KAFKA_TOPIC_ALERT_STATE)
+        if topic
+    ]
+    if not topics:
+        return
+    
+    admin = AdminClient({'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS})
+    for topic, future in admin.create_topics(topics, request_timeout=10).items():
+        try:
+            future.result()
+            logger.info(f"Created compacted topic {topic}")
+        except Exception as e:
+            if e.args and isinstance(e.args[0], KafkaError) and e.args[0].code() == KafkaError.TOPIC_ALREADY_EXISTS:
+                continue
+            logger.error(f"Error creating compacted topic {topic}: {e}")
+
+def publish_state(topic, updates):
+    """
+    Publish (key, document) updates to a compacted latest-state topic in one
+    flush; a None document is a tombstone deleting the key.
+    """
+    if not topic or not updates:
+        return
+    with tracer.start_as_current_span('kafka_publish', attributes={'messaging.destination': topic, 'mta.documents': len(updates)}):
+        cycle_id = current_trace_id()
+        headers = kafka_trace_headers()
+        producer = get_producer()
+        for key, doc in updates:
+            producer.produce(
+                topic,
+                key=key.encode('utf-8'),
+                value=None if doc is None else json.dumps(dict(doc, cycle_id=cycle_id)).encode('utf-8'),
+                headers=headers,
+                callback=delivery_report
+            )
+            producer.poll(0)
+        producer.flush()
+
+def vehicle_state_updates(line_id, vehicle_positions):
+    """
+    Vehicle state updates for one feed: every vehicle it reports, keyed by
+    vehicle id (or entity id when the feed has none), plus tombstones for
+    the vehicles it reported last cycle but no longer does.
+    """
+    updates = {vehicle['vehicle_key']: vehicle for vehicle in vehicle_positions}
+    for key in published_vehicle_keys.get(line_id, set()) - updates.keys():
+        updates[key] = None
+    published_vehicle_keys[line_id] = {key for key, vehicle in updates.items() if vehicle is not None}
+    return list(updates.items())
+
+@CYCLE_SECONDS.labels(job='subway').time()
+@tracer.start_as_current_span('subway_cycle')
+@profiled('subway')
 def fetch_and_publish_subway_data():
     """Fetch subway data from all GTFS endpoints and publish to Kafka"""
-    logger.info("Fetching subway data...")
+    logger.info(f"Fetching subway data (cycle {current_trace_id()})...")
+    cycle_time = time.time()
     
     all_vehicle_positions = []
+    vehicle_updates = []
+    changed_stops = set()
     
     for line_id, endpoint in SUBWAY_ENDPOINTS.items():
         try:
-            entity_list, vehicle_positions = fetch_gtfs_feed(endpoint, line_id)
+            with tracer.start_as_current_span('fetch_feed', attributes={'mta.feed': line_id}):
+                entity_list, vehicle_positions = fetch_gtfs_feed(endpoint, line_id)
             
             if entity_list:
-                # Add timestamp for when this data was fetched
+                # Add timestamp for when this data was fetched, and the
+                # feed header timestamp the data was generated at
                 message = {
                     'line_id': line_id,
                     'timestamp': int(time.time()),
+                    'feed_timestamp': entity_list[0]['timestamp'],
                     'data': entity_list
                 }
                 
                 # Publish to Kafka
-                producer.produce(
-                    KAFKA_TOPIC_SUBWAY,
-                    key=line_id,
-                    value=json.dumps(message).encode('utf-8'),
-                    callback=delivery_report
-                )
-                producer.flush()
+                publish(KAFKA_TOPIC_SUBWAY, message, key=line_id)
                 logger.info(f"Published {len(entity_list)} subway updates for line {line_id}")
+                
+                # Update the arrival boards of the stops this feed's trips touch
+                previous_trips = arrivals_index.feed_trips.get(line_id, {})
+                changed_stops |= arrivals_index.update_feed(line_id, entity_list)
+                
+                # Archive the trips whose predictions changed since the last cycle
+                if archive.enabled:
+                    changed = changed_trips(previous_trips, arrivals_index.feed_trips[line_id])
+                    archive.add('trip_updates', trip_update_rows(
+                        trip_update for trip_update in entity_list if trip_update['trip_id'] in changed
+                    ))
+                
+                # Replace this feed's vehicles in the latest-state topic
+                vehicle_updates.extend(vehicle_state_updates(line_id, vehicle_positions))
             
             # Collect vehicle positions for MongoDB direct write
             all_vehicle_positions.extend(vehicle_positions)
@@ -418,49 +688,97 @@ def fetch_and_publish_subway_data():
         except Exception as e:
             logger.error(f"Error processing subway data for line {line_id}: {e}")
     
-    # Write vehicle positions directly to MongoDB
+    # Publish the latest vehicle state
+    try:
+        publish_state(KAFKA_TOPIC_VEHICLE_STATE, vehicle_updates)
+    except Exception as e:
+        logger.error(f"Error publishing vehicle state: {e}")
+    
+    # Queue vehicle positions for MongoDB
     if all_vehicle_positions:
-        write_to_mongodb('vehicle_positions', all_vehicle_positions, is_vehicle=True)
+        mongo_writer.submit('vehicle_positions', all_vehicle_positions)
         
         # Also write to latest_vehicle_positions collection for dashboard queries
-        write_to_mongodb('latest_vehicle_positions', all_vehicle_positions, is_vehicle=True)
+        mongo_writer.submit('latest_vehicle_positions', all_vehicle_positions)
+        
+        # And a per-route snapshot of the fleet for point-in-time playback
+        mongo_writer.submit('vehicle_history', history_snapshots(all_vehicle_positions, cycle_time))
+        
+        if archive.enabled:
+            archive.add('vehicle_positions', vehicle_rows(all_vehicle_positions))
+    
+    # Write only the arrival boards that changed this cycle
+    if changed_stops:
+        mongo_writer.submit(
+            'station_arrivals',
+            arrivals_index.board_documents(changed_stops, int(time.time()), ARRIVALS_BOARD_SIZE)
+        )
+    
+    # Headways and bunching per route and direction over every feed's predicted arrivals
+    try:
+        mongo_writer.submit('route_headways', headway_documents(arrivals_index.feed_trips, cycle_time))
+    except Exception as e:
+        logger.error(f"Error computing headways: {e}")
 
+@CYCLE_SECONDS.labels(job='alerts').time()
+@tracer.start_as_current_span('alerts_cycle')
+@profiled('alerts')
 def fetch_and_publish_alerts():
     """Fetch service alerts and publish to Kafka"""
-    logger.info("Fetching service alerts...")
+    logger.info(f"Fetching service alerts (cycle {current_trace_id()})...")
     
     try:
-        data = fetch_json_feed(SERVICE_ALERTS_ENDPOINT)
+        with tracer.start_as_current_span('fetch_feed', attributes={'mta.feed': 'alerts'}):
+            data = fetch_json_feed(SERVICE_ALERTS_ENDPOINT, 'alerts')
         if data:
             # Add timestamp for when this data was fetched
             message = {
                 'timestamp': int(time.time()),
+                'feed_timestamp': data.get('header', {}).get('timestamp'),
                 'data': data
             }
             
             try:
                 # Publish to Kafka
-                producer.produce(
-                    KAFKA_TOPIC_ALERTS,
-                    value=json.dumps(message).encode('utf-8'),
-                    callback=delivery_report
-                )
-                producer.flush()
+                publish(KAFKA_TOPIC_ALERTS, message)
                 logger.info(f"Published service alerts")
             except Exception as ke:
                 logger.error(f"Error processing service alerts: {ke}")
                 # Continue to MongoDB write even if Kafka fails
             
-            # Process alerts and write directly to MongoDB
-            processed_alerts = process_alerts(data)
-            if processed_alerts:
-                write_to_mongodb('service_alerts', processed_alerts)
+            # Rebuild only new and changed alerts, and write those directly to MongoDB
+            changed_alerts, resolved_alerts = alert_processor.process(data)
+            logger.info(f"Alerts: {len(changed_alerts)} new or changed, {len(resolved_alerts)} resolved")
+            
+            # Publish the changes to the latest-state topic, deleting resolved alerts
+            try:
+                publish_state(
+                    KAFKA_TOPIC_ALERT_STATE,
+                    [(alert['id'], alert) for alert in changed_alerts] + [(alert['id'], None) for alert in resolved_alerts]
+                )
+            except Exception as e:
+                logger.error(f"Error publishing alert state: {e}")
+            if changed_alerts:
+                mongo_writer.submit('service_alerts', changed_alerts)
+            
+            # Keep one document per alert in current_alerts, flagging resolved ones
+            current_alerts = [dict(alert, resolved=False) for alert in changed_alerts]
+            current_alerts += [dict(alert, resolved=True) for alert in resolved_alerts]
+            if current_alerts:
+                mongo_writer.submit('current_alerts', current_alerts)
+            
+            # Archive every alert version, and resolutions at the time they were seen
+            if archive.enabled:
+                archive.add('service_alerts', alert_rows(changed_alerts) + alert_rows(resolved_alerts, resolved=True, ts=int(time.time())))
     except Exception as e:
         logger.error(f"Error processing service alerts: {e}")
 
+@CYCLE_SECONDS.labels(job='elevator').time()
+@tracer.start_as_current_span('elevator_cycle')
+@profiled('elevator')
 def fetch_and_publish_elevator_data():
     """Fetch elevator/escalator data and publish to Kafka"""
-    logger.info("Fetching elevator/escalator data...")
+    logger.info(f"Fetching elevator/escalator data (cycle {current_trace_id()})...")
     
     topics = {
         'current': KAFKA_TOPIC_ELEVATOR_CURRENT,
@@ -468,9 +786,11 @@ def fetch_and_publish_elevator_data():
         'equipment': KAFKA_TOPIC_ELEVATOR_EQUIPMENT
     }
     
+    outage_events = []
     for data_type, endpoint in ELEVATOR_ENDPOINTS.items():
         try:
-            data = fetch_json_feed(endpoint)
+            with tracer.start_as_current_span('fetch_feed', attributes={'mta.feed': f"elevator_{data_type}"}):
+                data = fetch_json_feed(endpoint, f"elevator_{data_type}")
             if data:
                 # Add timestamp for when this data was fetched
                 message = {
@@ -479,29 +799,49 @@ def fetch_and_publish_elevator_data():
                 }
                 
                 # Publish to Kafka
-                producer.produce(
-                    topics[data_type],
-                    value=json.dumps(message).encode('utf-8'),
-                    callback=delivery_report
-                )
-                producer.flush()
+                publish(topics[data_type], message)
                 logger.info(f"Published {data_type} elevator/escalator data")
                 
                 # Process data and write directly to MongoDB
                 if data_type == 'equipment':
                     processed_equipment = process_elevator_equipment(data)
                     if processed_equipment:
-                        write_to_mongodb('elevator_equipment', processed_equipment)
+                        mongo_writer.submit('elevator_equipment', processed_equipment)
+                        reliability_tracker.update_equipment(processed_equipment, time.time())
+                elif data_type == 'upcoming':
+                    upcoming_outages = process_elevator_outages(data, 'upcoming')
+                    if upcoming_outages:
+                        mongo_writer.submit('upcoming_elevator_outages', upcoming_outages)
+                    if 'nyct_ene' in data:
+                        outage_events.extend(reliability_tracker.update_upcoming(upcoming_outages, time.time()))
                 elif data_type == 'current':
                     processed_outages = process_elevator_outages(data)
+                    # An empty snapshot that still has the feed's envelope closes every open outage
+                    if 'nyct_ene' in data:
+                        outage_events.extend(reliability_tracker.update_current(processed_outages, time.time()))
                     if processed_outages:
-                        write_to_mongodb('elevator_outages', processed_outages)
+                        mongo_writer.submit('elevator_outages', processed_outages)
+                        if archive.enabled:
+                            archive.add('elevator_outages', outage_rows(processed_outages, time.time()))
                         # Also write to current_elevator_outages for dashboard
                         current_outages = [outage for outage in processed_outages if outage.get('is_current', False)]
                         if current_outages:
-                            write_to_mongodb('current_elevator_outages', current_outages)
+                            mongo_writer.submit('current_elevator_outages', current_outages)
         except Exception as e:
             logger.error(f"Error processing {data_type} elevator/escalator data: {e}")
+    
+    # Outage interval events and the reliability totals they changed
+    try:
+        equipment_totals, station_totals = reliability_tracker.take_changes()
+        if outage_events:
+            mongo_writer.submit('elevator_outage_events', outage_events)
+            logger.info(f"Recorded {len(outage_events)} elevator/escalator outage events")
+        if equipment_totals:
+            mongo_writer.submit('elevator_reliability', equipment_totals)
+        if station_totals:
+            mongo_writer.submit('station_reliability', station_totals)
+    except Exception as e:
+        logger.error(f"Error writing elevator/escalator reliability: {e}")
 
 def setup_schedules():
     """Set up scheduled tasks"""
@@ -513,27 +853,107 @@ def setup_schedules():
     
     # Schedule elevator data fetch
     schedule.every(ELEVATOR_REFRESH_INTERVAL).seconds.do(fetch_and_publish_elevator_data)
+    
+    # Schedule archive flushes
+    if archive.enabled:
+        schedule.every(ARCHIVE_FLUSH_SECONDS).seconds.do(flush_archive)
+
+def flush_archive():
+    """Write the buffered archive rows and compact the days that are over"""
+    archive.flush()
+    archive.compact()
+
+# Set on SIGTERM or SIGINT: the scheduler loop stops after the running job
+stopping = threading.Event()
+
+def request_stop(signum, frame):
+    logger.info(f"Received signal {signum}, stopping after the running job")
+    stopping.set()
+
+def shutdown():
+    """Write out the buffered archive rows and the queued MongoDB documents before exiting"""
+    if archive.enabled:
+        archive.flush()
+    if mongo_writer.flush(WRITE_BEHIND_SHUTDOWN_SECONDS):
+        logger.info("Wrote all queued MongoDB documents")
+    else:
+        logger.error(f"Queued MongoDB documents still unwritten after {WRITE_BEHIND_SHUTDOWN_SECONDS}s, dropping them")
 
 def run():
     """Main function to run the producer"""
     logger.info("Starting MTA data producer...")
+    global static_gtfs
+    
+    # Expose Prometheus metrics and the health probes first, so they answer
+    # while the clients below warm up
+    health.register('mongodb')
+    health.register('kafka')
+    health.register('gtfs_static', required=False)
+    start_metrics_server(METRICS_PORT)
+    logger.info(f"Serving metrics and health probes on port {METRICS_PORT}")
+    
+    # Trace every ingest cycle, and profile cycles when PRODUCER_PROFILE_MODE is set
+    setup_tracing('mta-producer')
+    setup_profiling()
+    
+    # Map the static GTFS index used to place vehicles at their stops
+    static_gtfs = load_static_gtfs()
+    if static_gtfs is not None:
+        health.ready('gtfs_static')
+    else:
+        health.failed('gtfs_static', 'Static GTFS unavailable; vehicles without a position are stored without coordinates')
     
     # Check MongoDB connection
-    if mongo_client is None:
-        logger.error("MongoDB not connected - data may not be available in dashboard")
+    mongo_db = get_mongo_db()
+    try:
+        if mongo_db is None:
+            raise RuntimeError("MongoDB client not initialized")
+        mongo_db.command('ping')
+        health.ready('mongodb')
+        ensure_indexes()
+        alert_processor.seed(mongo_db['current_alerts'].find({'resolved': False}, {'_id': 0}))
+        reliability_tracker.seed(mongo_db['elevator_reliability'].find({}, {'_id': 0}))
+    except Exception as e:
+        health.failed('mongodb', e)
+        logger.error(f"MongoDB not available - data may not be available in dashboard: {e}")
+    
+    # Create the compacted latest-state topics the API can serve from
+    try:
+        get_producer().list_topics(timeout=10)
+        health.ready('kafka')
+        ensure_state_topics()
+    except Exception as e:
+        health.failed('kafka', e)
+        logger.error(f"Error creating state topics: {e}")
+    
+    # Compact archive days left uncompacted by a previous run
+    if archive.enabled:
+        archive.compact(archive.partition_directories())
+    
+    # Write to MongoDB from background writers so fetch cadence never waits on it
+    if WRITE_BEHIND_ENABLED:
+        mongo_writer.start()
+    
+    # Stop cleanly on docker stop, so queued writes and archive buffers are not lost
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
     
     # Set up scheduled tasks
     setup_schedules()
     
-    # Run all tasks once at startup
-    fetch_and_publish_subway_data()
-    fetch_and_publish_alerts()
-    fetch_and_publish_elevator_data()
-    
-    # Run the scheduler
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    try:
+        # Run all tasks once at startup
+        fetch_and_publish_subway_data()
+        fetch_and_publish_alerts()
+        fetch_and_publish_elevator_data()
+        
+        # Run the scheduler
+        while not stopping.is_set():
+            schedule.run_pending()
+            health.beat()
+            stopping.wait(1)
+    finally:
+        shutdown()
 
 if __name__ == "__main__":
     run() 
\ No newline at end of file
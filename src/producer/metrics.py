@@ -0,0 +1,94 @@
+"""
+Prometheus metrics for the MTA data producer.
+
+Exposed over HTTP on METRICS_PORT so every stage of an ingest cycle (fetch,
+parse, Kafka delivery, MongoDB writes) can be scraped and compared.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.health import start_probe_server
+
+# Buckets for small and large MTA payloads (1 KB .. 20 MB)
+PAYLOAD_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2e7)
+
+FEED_FETCH_SECONDS = Histogram(
+    'mta_producer_feed_fetch_seconds',
+    'HTTP latency of fetching an MTA feed',
+    ['feed']
+)
+FEED_PAYLOAD_BYTES = Histogram(
+    'mta_producer_feed_payload_bytes',
+    'Size of the MTA feed response body',
+    ['feed'],
+    buckets=PAYLOAD_BUCKETS
+)
+FEED_PARSE_SECONDS = Histogram(
+    'mta_producer_feed_parse_seconds',
+    'Time spent decoding and converting an MTA feed',
+    ['feed']
+)
+FEED_ERRORS = Counter(
+    'mta_producer_feed_errors_total',
+    'Failed MTA feed fetches or parses',
+    ['feed']
+)
+FEED_FRESHNESS_SECONDS = Gauge(
+    'mta_producer_feed_freshness_seconds',
+    'Seconds between now and the feed header timestamp at fetch time',
+    ['feed']
+)
+KAFKA_DELIVERY_SECONDS = Histogram(
+    'mta_producer_kafka_delivery_seconds',
+    'Time from produce() to broker acknowledgement',
+    ['topic']
+)
+KAFKA_DELIVERY_ERRORS = Counter(
+    'mta_producer_kafka_delivery_errors_total',
+    'Kafka messages that failed delivery',
+    ['topic']
+)
+MONGO_WRITE_SECONDS = Histogram(
+    'mta_producer_mongo_bulk_write_seconds',
+    'Latency of MongoDB bulk writes',
+    ['collection']
+)
+MONGO_DOCUMENTS_WRITTEN = Counter(
+    'mta_producer_mongo_documents_written_total',
+    'Documents sent to MongoDB bulk writes',
+    ['collection']
+)
+MONGO_WRITE_ERRORS = Counter(
+    'mta_producer_mongo_write_errors_total',
+    'Failed MongoDB bulk writes',
+    ['collection']
+)
+WRITE_BEHIND_PENDING = Gauge(
+    'mta_producer_write_behind_pending_documents',
+    'Documents queued for the next MongoDB write',
+    ['collection']
+)
+WRITE_BEHIND_DROPPED = Counter(
+    'mta_producer_write_behind_dropped_documents_total',
+    'Queued documents dropped before being written (superseded by a newer snapshot, or overflow)',
+    ['collection', 'reason']
+)
+ARCHIVE_ROWS_WRITTEN = Counter(
+    'mta_producer_archive_rows_written_total',
+    'Rows written to the Parquet archive',
+    ['dataset']
+)
+ARCHIVE_WRITE_ERRORS = Counter(
+    'mta_producer_archive_write_errors_total',
+    'Failed Parquet archive part file writes',
+    ['dataset']
+)
+CYCLE_SECONDS = Histogram(
+    'mta_producer_cycle_seconds',
+    'Duration of a full scheduled fetch-and-publish job',
+    ['job'],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+
+def start_metrics_server(port):
+    """Serve /metrics, with the /healthz and /readyz probes, on the given port from a background thread"""
+    start_probe_server(port)
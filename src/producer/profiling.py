@@ -0,0 +1,161 @@
+"""
+Opt-in profiling of producer cycles.
+
+With PRODUCER_PROFILE_MODE set, every PRODUCER_PROFILE_EVERY_N_CYCLES-th run
+of each job is profiled and written to PRODUCER_PROFILE_DIR:
+
+- sample: a background thread samples the job's stack every
+  PROFILE_SAMPLE_INTERVAL_MS and writes collapsed stacks (*.collapsed), which
+  flamegraph.pl, speedscope and inferno render as flamegraphs
+- cprofile: deterministic cProfile stats (*.pstats) for snakeviz or flameprof
+
+Profiling stops by itself PRODUCER_PROFILE_WINDOW_SECONDS after it was switched
+on (at startup, or by sending SIGUSR1 to the producer), and only the newest
+PROFILE_MAX_FILES profiles are kept, so it is safe to enable in production.
+"""
+import os
+import sys
+import time
+import signal
+import cProfile
+import logging
+import threading
+import functools
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Profiling configuration
+PRODUCER_PROFILE_MODE = os.getenv('PRODUCER_PROFILE_MODE', 'off').lower()
+PRODUCER_PROFILE_EVERY_N_CYCLES = int(os.getenv('PRODUCER_PROFILE_EVERY_N_CYCLES', 10))
+PRODUCER_PROFILE_WINDOW_SECONDS = int(os.getenv('PRODUCER_PROFILE_WINDOW_SECONDS', 900))
+PRODUCER_PROFILE_DIR = os.getenv('PRODUCER_PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))
+
+PROFILE_MODES = ('sample', 'cprofile')
+
+# Profiling is active until this time; set at startup and by SIGUSR1
+profile_until = 0.0
+cycle_counts = Counter()
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval_seconds):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+def collapse_stack(frame):
+    """Render a frame's stack root-first as 'module:function;...', with the line of the innermost frame"""
+    names = []
+    leaf = frame
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        name = f"{module}:{code.co_name}"
+        names.append(f"{name}:{frame.f_lineno}" if frame is leaf else name)
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def write_collapsed(path, stacks):
+    """Write collapsed stacks, one 'stack count' line each"""
+    with open(path, 'w') as output:
+        for stack, count in stacks.most_common():
+            output.write(f"{stack} {count}\n")
+
+def prune_profiles(directory, keep):
+    """Delete all but the newest keep profile files"""
+    profiles = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for path in profiles[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def open_profile_window(*_):
+    """Enable profiling for the next PRODUCER_PROFILE_WINDOW_SECONDS"""
+    global profile_until
+    profile_until = time.time() + PRODUCER_PROFILE_WINDOW_SECONDS
+    logger.info(
+        f"Profiling every {PRODUCER_PROFILE_EVERY_N_CYCLES} cycles ({PRODUCER_PROFILE_MODE}) "
+        f"for {PRODUCER_PROFILE_WINDOW_SECONDS}s into {PRODUCER_PROFILE_DIR}"
+    )
+
+def setup_profiling():
+    """Open the initial profiling window and let SIGUSR1 reopen it"""
+    if PRODUCER_PROFILE_MODE not in PROFILE_MODES:
+        return
+    os.makedirs(PRODUCER_PROFILE_DIR, exist_ok=True)
+    open_profile_window()
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, open_profile_window)
+
+def should_profile(job):
+    """Count a cycle of job and decide whether to profile it"""
+    cycle_counts[job] += 1
+    if PRODUCER_PROFILE_MODE not in PROFILE_MODES or time.time() > profile_until:
+        return False
+    return cycle_counts[job] % PRODUCER_PROFILE_EVERY_N_CYCLES == 0
+
+def profiled(job):
+    """Decorator profiling every Nth cycle of a scheduled job while the window is open"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not should_profile(job):
+                return function(*args, **kwargs)
+
+            started = time.time()
+            path = os.path.join(
+                PRODUCER_PROFILE_DIR,
+                f"{job}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(started))}-{cycle_counts[job]}"
+            )
+            if PRODUCER_PROFILE_MODE == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    finish_profile(job, path + '.pstats', started, profiler.dump_stats)
+
+            sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            sampler.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                sampler.stop()
+                finish_profile(job, path + '.collapsed', started, lambda target: write_collapsed(target, sampler.stacks))
+        return wrapper
+    return decorator
+
+def finish_profile(job, path, started, save):
+    """Save a profile with save(path) and enforce the retention limit; never raises into the job"""
+    try:
+        save(path)
+        prune_profiles(PRODUCER_PROFILE_DIR, PROFILE_MAX_FILES)
+    except OSError as e:
+        logger.error(f"Error writing profile {path}: {e}")
+        return
+    logger.info(f"Profiled {job} cycle ({time.time() - started:.2f}s) to {path}")
@@ -0,0 +1,164 @@
+"""
+Incremental elevator and escalator outage intervals and reliability totals.
+
+Each current-outage snapshot is compared with the equipment that was out in
+the previous one: equipment that appears opens an outage interval, equipment
+that disappears closes it. Upcoming-outage snapshots are compared the same way
+into scheduled and unscheduled events, and an outage that opens while its
+equipment is scheduled is counted as planned. Every event updates running
+totals of its equipment and station in O(1), and the same totals answer both:
+
+- observed seconds = equipment * now - tracked_since_sum
+- downtime seconds = repair_seconds + open_outages * now - open_since_sum
+- availability = 1 - downtime / observed, MTBF = uptime / outages,
+  MTTR = repair_seconds / closed_outages
+
+Intervals are timed by when the snapshots were taken, so they are accurate to
+one elevator refresh. Only changed totals are written, and the tracker is
+seeded from the stored equipment totals at startup.
+"""
+from datetime import datetime
+
+EPOCH = datetime(1970, 1, 1)
+
+# Running totals kept per equipment and summed per station
+TOTAL_FIELDS = (
+    'equipment', 'tracked_since_sum', 'outages', 'planned_outages', 'closed_outages',
+    'repair_seconds', 'open_outages', 'open_since_sum',
+)
+
+# Descriptive fields of equipment, taken from the outage and equipment feeds
+EQUIPMENT_FIELDS = ('station', 'borough', 'equipment_type', 'serving')
+
+def epoch_seconds(value):
+    """Naive UTC datetime as epoch seconds"""
+    return (value - EPOCH).total_seconds()
+
+def to_datetime(seconds):
+    return datetime.utcfromtimestamp(seconds) if seconds is not None else None
+
+def new_totals():
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+class ReliabilityTracker:
+    """Open outages, scheduled outages and reliability totals per equipment and station"""
+
+    def __init__(self):
+        # equipment id -> descriptive fields, totals, open_since and scheduled
+        self.equipment = {}
+        # station -> summed totals of its equipment
+        self.stations = {}
+        # Totals changed since the last take_changes()
+        self.changed_equipment = set()
+        self.changed_stations = set()
+
+    def seed(self, documents):
+        """Start from stored equipment totals, rebuilding the station sums from them"""
+        for document in documents:
+            equipment_id = document.get('equipment_id')
+            if not equipment_id or equipment_id in self.equipment:
+                continue
+            state = {field: document.get(field, '') for field in EQUIPMENT_FIELDS}
+            state.update({field: document.get(field) or 0 for field in TOTAL_FIELDS})
+            state['open_since'] = epoch_seconds(document['open_since']) if document.get('open_since') else None
+            state['scheduled'] = bool(document.get('scheduled'))
+            self.equipment[equipment_id] = state
+            station = self.stations.setdefault(state['station'], new_totals())
+            for field in TOTAL_FIELDS:
+                station[field] += state[field]
+
+    def add(self, state, totals):
+        """Add totals to an equipment and its station"""
+        station = self.stations.setdefault(state['station'], new_totals())
+        for field, value in totals.items():
+            state[field] += value
+            station[field] += value
+        self.changed_stations.add(state['station'])
+
+    def register(self, item, now):
+        """State of an equipment, tracked from now if it is new"""
+        equipment_id = item['equipment_id']
+        state = self.equipment.get(equipment_id)
+        if state is None:
+            state = {field: item.get(field, '') for field in EQUIPMENT_FIELDS}
+            state.update(new_totals())
+            state['open_since'] = None
+            state['scheduled'] = False
+            self.equipment[equipment_id] = state
+            self.add(state, {'equipment': 1, 'tracked_since_sum': now})
+            self.changed_equipment.add(equipment_id)
+        return state
+
+    def update_equipment(self, equipment, now):
+        """Start tracking equipment listed by the equipment feed"""
+        for item in equipment:
+            if item.get('equipment_id'):
+                self.register(item, now)
+
+    def event(self, equipment_id, state, event, now, **fields):
+        self.changed_equipment.add(equipment_id)
+        return dict(fields, equipment_id=equipment_id, station=state['station'], event=event, at=to_datetime(now))
+
+    def update_current(self, outages, now):
+        """Open and close outage intervals against a current-outage snapshot; returns the events"""
+        events = []
+        current = {outage['equipment_id']: outage for outage in outages if outage.get('equipment_id')}
+        for equipment_id, outage in current.items():
+            state = self.register(outage, now)
+            if state['open_since'] is not None:
+                continue
+            state['open_since'] = now
+            planned = state['scheduled']
+            self.add(state, {'outages': 1, 'planned_outages': int(planned), 'open_outages': 1, 'open_since_sum': now})
+            events.append(self.event(
+                equipment_id, state, 'opened', now, planned=planned, reason=outage.get('reason', ''),
+                outage_start=outage.get('outage_start'), outage_end=outage.get('outage_end')
+            ))
+
+        for equipment_id, state in self.equipment.items():
+            if state['open_since'] is None or equipment_id in current:
+                continue
+            opened, state['open_since'] = state['open_since'], None
+            duration = now - opened
+            self.add(state, {
+                'closed_outages': 1, 'repair_seconds': duration, 'open_outages': -1, 'open_since_sum': -opened
+            })
+            events.append(self.event(equipment_id, state, 'closed', now, opened_at=to_datetime(opened), duration_seconds=duration))
+        return events
+
+    def update_upcoming(self, outages, now):
+        """Mark equipment with scheduled outages against an upcoming-outage snapshot; returns the events"""
+        events = []
+        upcoming = {outage['equipment_id']: outage for outage in outages if outage.get('equipment_id')}
+        for equipment_id, outage in upcoming.items():
+            state = self.register(outage, now)
+            if not state['scheduled']:
+                state['scheduled'] = True
+                events.append(self.event(
+                    equipment_id, state, 'scheduled', now, reason=outage.get('reason', ''),
+                    outage_start=outage.get('outage_start'), outage_end=outage.get('outage_end')
+                ))
+
+        for equipment_id, state in self.equipment.items():
+            if state['scheduled'] and equipment_id not in upcoming:
+                state['scheduled'] = False
+                events.append(self.event(equipment_id, state, 'unscheduled', now))
+        return events
+
+    def take_changes(self):
+        """(equipment documents, station documents) whose totals changed since the last call"""
+        equipment_ids, self.changed_equipment = self.changed_equipment, set()
+        stations, self.changed_stations = self.changed_stations, set()
+        equipment_documents = []
+        for equipment_id in equipment_ids:
+            state = self.equipment[equipment_id]
+            document = {field: state[field] for field in EQUIPMENT_FIELDS + TOTAL_FIELDS}
+            document.update({
+                'equipment_id': equipment_id,
+                'tracked_since': to_datetime(state['tracked_since_sum']),
+                'open_since': to_datetime(state['open_since']),
+                'scheduled': state['scheduled'],
+            })
+            equipment_documents.append(document)
+        station_documents = [dict(self.stations[station], station=station) for station in stations]
+        return equipment_documents, station_documents
@@ -0,0 +1,7 @@
+"""Import the producer modules and the shared common package as the producer image does"""
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
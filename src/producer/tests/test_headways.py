@@ -0,0 +1,50 @@
+"""Headway, bunching and gap statistics of compute_headways"""
+from datetime import datetime
+
+from headways import headway_documents
+
+NOW = 1746964800
+
+def feed_trips(*arrivals):
+    """One feed of single-stop trips from (route_id, stop_id, seconds after NOW)"""
+    return {'ACE': {
+        f"trip-{index}": (route_id, [(stop_id, NOW + offset)])
+        for index, (route_id, stop_id, offset) in enumerate(arrivals)
+    }}
+
+def test_headway_statistics_per_route_and_direction():
+    docs = headway_documents(feed_trips(
+        # Headways of 300, 400, 60 and 1140 seconds northbound
+        ('A', '101N', 0), ('A', '101N', 300), ('A', '101N', 700), ('A', '101N', 760), ('A', '101N', 1900),
+        ('A', '101S', 100), ('A', '101S', 700),
+        ('G', 'G22N', 200),
+    ), NOW)
+    ts = datetime.utcfromtimestamp(NOW)
+    assert docs == [
+        {'ts': ts, 'route_id': 'A', 'direction': 'N', 'arrivals': 5, 'headways': 4, 'mean_headway': 475.0,
+         'median_headway': 350.0, 'max_headway': 1140, 'bunched': 1, 'gaps': 1, 'bunching': True},
+        {'ts': ts, 'route_id': 'A', 'direction': 'S', 'arrivals': 2, 'headways': 1, 'mean_headway': 600.0,
+         'median_headway': 600.0, 'max_headway': 600, 'bunched': 0, 'gaps': 0, 'bunching': False},
+        {'ts': ts, 'route_id': 'G', 'direction': 'N', 'arrivals': 1, 'headways': 0, 'mean_headway': None,
+         'median_headway': None, 'max_headway': None, 'bunched': 0, 'gaps': 0, 'bunching': False},
+    ]
+
+def test_headways_are_taken_per_route_at_one_stop():
+    docs = headway_documents(feed_trips(
+        ('A', '101N', 0), ('C', '101N', 60), ('A', '102N', 30), ('A', '102N', 630),
+    ), NOW)
+    assert [(doc['route_id'], doc['arrivals'], doc['headways'], doc['median_headway']) for doc in docs] == [
+        ('A', 3, 1, 600.0), ('C', 1, 0, None)
+    ]
+
+def test_arrivals_outside_the_horizon_are_ignored():
+    trips = feed_trips(('A', '101N', -60), ('A', '101N', 0), ('A', '101N', 600), ('A', '101N', 3700))
+    docs = headway_documents(trips, NOW)
+    assert [(doc['arrivals'], doc['headways'], doc['max_headway']) for doc in docs] == [(2, 1, 600)]
+    assert headway_documents(feed_trips(('A', '101N', -60)), NOW) == []
+    assert headway_documents({}, NOW) == []
+
+def test_fractional_cycle_time_is_truncated():
+    docs = headway_documents(feed_trips(('A', '101N', 0), ('A', '101N', 300)), NOW + 0.75)
+    assert docs[0]['ts'] == datetime.utcfromtimestamp(NOW)
+    assert docs[0]['headways'] == 1
@@ -0,0 +1,99 @@
+"""Outage intervals and reliability totals of the ReliabilityTracker"""
+from datetime import datetime
+
+from reliability import ReliabilityTracker, to_datetime
+
+def outage(equipment_id, station='14 St', **fields):
+    return dict({'equipment_id': equipment_id, 'station': station, 'equipment_type': 'EL'}, **fields)
+
+def totals_of(tracker, equipment_id):
+    state = tracker.equipment[equipment_id]
+    return {field: state[field] for field in ('equipment', 'outages', 'planned_outages', 'closed_outages',
+                                             'repair_seconds', 'open_outages', 'open_since_sum')}
+
+def test_new_equipment_is_tracked_from_its_first_snapshot():
+    tracker = ReliabilityTracker()
+    tracker.update_equipment([outage('EL1'), outage('EL2'), {'station': 'no id'}], 1000)
+    assert tracker.stations['14 St']['equipment'] == 2
+    assert tracker.stations['14 St']['tracked_since_sum'] == 2000
+    equipment_documents, station_documents = tracker.take_changes()
+    assert sorted(document['equipment_id'] for document in equipment_documents) == ['EL1', 'EL2']
+    assert equipment_documents[0]['tracked_since'] == datetime(1970, 1, 1, 0, 16, 40)
+    assert station_documents == [dict(tracker.stations['14 St'], station='14 St')]
+
+def test_outage_opens_and_closes_an_interval():
+    tracker = ReliabilityTracker()
+    tracker.update_equipment([outage('EL1')], 0)
+    events = tracker.update_current([outage('EL1', reason='Repair')], 1000)
+    assert [(event['event'], event['planned'], event['reason']) for event in events] == [('opened', False, 'Repair')]
+    assert totals_of(tracker, 'EL1') == {
+        'equipment': 1, 'outages': 1, 'planned_outages': 0, 'closed_outages': 0,
+        'repair_seconds': 0, 'open_outages': 1, 'open_since_sum': 1000,
+    }
+
+    # Still out: no new event or outage
+    assert tracker.update_current([outage('EL1')], 1300) == []
+
+    events = tracker.update_current([], 1600)
+    assert [(event['event'], event['duration_seconds'], event['opened_at']) for event in events] == [
+        ('closed', 600, to_datetime(1000))
+    ]
+    assert totals_of(tracker, 'EL1') == {
+        'equipment': 1, 'outages': 1, 'planned_outages': 0, 'closed_outages': 1,
+        'repair_seconds': 600, 'open_outages': 0, 'open_since_sum': 0,
+    }
+
+def test_outage_of_scheduled_equipment_is_planned():
+    tracker = ReliabilityTracker()
+    events = tracker.update_upcoming([outage('EL1', reason='Capital Replacement')], 0)
+    assert [event['event'] for event in events] == ['scheduled']
+    events = tracker.update_current([outage('EL1')], 100)
+    assert [(event['event'], event['planned']) for event in events] == [('opened', True)]
+
+    events = tracker.update_upcoming([], 200)
+    assert [event['event'] for event in events] == ['unscheduled']
+    tracker.update_current([], 300)
+    # The next outage, no longer scheduled, is unplanned
+    events = tracker.update_current([outage('EL1')], 400)
+    assert [(event['event'], event['planned']) for event in events] == [('opened', False)]
+    assert tracker.stations['14 St']['outages'] == 2
+    assert tracker.stations['14 St']['planned_outages'] == 1
+
+def test_station_totals_sum_their_equipment():
+    tracker = ReliabilityTracker()
+    tracker.update_equipment([outage('EL1'), outage('EL2'), outage('ES1', station='59 St')], 0)
+    tracker.update_current([outage('EL1'), outage('EL2')], 100)
+    tracker.update_current([outage('EL2')], 400)
+    tracker.update_current([], 1000)
+    assert tracker.stations['14 St']['outages'] == 2
+    assert tracker.stations['14 St']['closed_outages'] == 2
+    assert tracker.stations['14 St']['repair_seconds'] == 300 + 900
+    assert tracker.stations['14 St']['open_outages'] == 0
+    assert tracker.stations['59 St']['outages'] == 0
+
+def test_take_changes_returns_only_changed_totals():
+    tracker = ReliabilityTracker()
+    tracker.update_equipment([outage('EL1'), outage('ES1', station='59 St')], 0)
+    tracker.take_changes()
+    assert tracker.take_changes() == ([], [])
+
+    tracker.update_current([outage('EL1')], 100)
+    equipment_documents, station_documents = tracker.take_changes()
+    assert [document['equipment_id'] for document in equipment_documents] == ['EL1']
+    assert equipment_documents[0]['open_since'] == to_datetime(100)
+    assert [document['station'] for document in station_documents] == ['14 St']
+
+def test_seeded_tracker_closes_outages_open_before_a_restart():
+    tracker = ReliabilityTracker()
+    tracker.update_equipment([outage('EL1'), outage('EL2')], 0)
+    tracker.update_current([outage('EL1')], 100)
+    stored, _ = tracker.take_changes()
+
+    restarted = ReliabilityTracker()
+    restarted.seed(stored)
+    assert restarted.stations == tracker.stations
+    # Open since before the restart, so no second outage is counted
+    assert restarted.update_current([outage('EL1')], 500) == []
+    events = restarted.update_current([], 700)
+    assert [(event['event'], event['duration_seconds']) for event in events] == [('closed', 600)]
+    assert restarted.stations['14 St']['repair_seconds'] == 600
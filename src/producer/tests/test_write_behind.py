@@ -0,0 +1,84 @@
+"""Coalescing and draining of the WriteBehindQueue"""
+import threading
+
+from write_behind import WriteBehindQueue
+
+class BlockingWriter:
+    """Records writes; the first write to a blocked collection waits for release()"""
+
+    def __init__(self, blocked=()):
+        self.writes = []
+        self.blocked = set(blocked)
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.written = threading.Event()
+
+    def __call__(self, collection_name, docs):
+        if collection_name in self.blocked:
+            self.blocked.discard(collection_name)
+            self.started.set()
+            assert self.released.wait(5)
+        self.writes.append((collection_name, [{k: v for k, v in doc.items() if k != 'cycle_id'} for doc in docs]))
+        self.written.set()
+
+    def release(self):
+        self.released.set()
+
+def started_queue(writer, snapshot_keys, **options):
+    queue = WriteBehindQueue(writer, snapshot_keys, **options)
+    queue.start()
+    return queue
+
+def test_writes_inline_without_writer_threads():
+    writer = BlockingWriter()
+    docs = [{'vehicle_key': 'A'}]
+    WriteBehindQueue(writer, {}).submit('latest', docs)
+    assert writer.writes == [('latest', [{'vehicle_key': 'A'}])]
+    # Tagged copies are written; the caller's documents are left alone
+    assert docs == [{'vehicle_key': 'A'}]
+
+def test_newer_snapshots_replace_pending_ones_while_a_write_is_in_flight():
+    writer = BlockingWriter(blocked=['latest'])
+    queue = started_queue(writer, {'latest': ['vehicle_key']}, workers=1)
+    queue.submit('latest', [{'vehicle_key': 'A', 'stop': 1}])
+    assert writer.started.wait(5)
+
+    queue.submit('latest', [{'vehicle_key': 'A', 'stop': 2}, {'vehicle_key': 'B', 'stop': 1}])
+    queue.submit('latest', [{'vehicle_key': 'A', 'stop': 3}, {'vehicle_key': None, 'stop': 9}])
+    writer.release()
+    assert queue.flush(timeout=5)
+    assert writer.writes == [
+        ('latest', [{'vehicle_key': 'A', 'stop': 1}]),
+        # Documents without a key are kept as they are
+        ('latest', [{'vehicle_key': 'B', 'stop': 1}, {'vehicle_key': 'A', 'stop': 3}, {'vehicle_key': None, 'stop': 9}]),
+    ]
+
+def test_history_keeps_every_document_up_to_the_limit():
+    writer = BlockingWriter(blocked=['history'])
+    queue = started_queue(writer, {}, workers=1, max_documents=3)
+    queue.submit('history', [{'n': 0}])
+    assert writer.started.wait(5)
+
+    queue.submit('history', [{'n': 1}, {'n': 2}])
+    queue.submit('history', [{'n': 3}, {'n': 4}])
+    writer.release()
+    assert queue.flush(timeout=5)
+    # The oldest pending documents beyond max_documents are dropped
+    assert writer.writes == [('history', [{'n': 0}]), ('history', [{'n': 2}, {'n': 3}, {'n': 4}])]
+
+def test_one_write_in_flight_per_collection():
+    writer = BlockingWriter(blocked=['latest'])
+    queue = started_queue(writer, {'latest': ['vehicle_key']}, workers=2)
+    queue.submit('latest', [{'vehicle_key': 'A'}])
+    assert writer.started.wait(5)
+
+    queue.submit('latest', [{'vehicle_key': 'B'}])
+    queue.submit('alerts', [{'id': 1}])
+    # The other collection is written by the second writer meanwhile
+    assert writer.written.wait(5)
+    assert writer.writes == [('alerts', [{'id': 1}])]
+    assert not queue.flush(timeout=0.1)
+
+    writer.release()
+    assert queue.flush(timeout=5)
+    assert writer.writes[1:] == [('latest', [{'vehicle_key': 'A'}]), ('latest', [{'vehicle_key': 'B'}])]
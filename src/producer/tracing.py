@@ -0,0 +1,33 @@
+"""
+OpenTelemetry tracing for the MTA data producer.
+
+Each scheduled job runs as one trace. Its trace id is the cycle id carried in
+Kafka envelopes and MongoDB documents, and its context travels in a W3C
+traceparent Kafka header, so the processor and API spans can be tied back to
+the ingest cycle that produced the data. Exporters are set up by
+common.tracing; TRACE_FILE defaults to traces/producer.jsonl.
+"""
+import os
+from opentelemetry import trace, propagate
+
+from common import tracing
+from common.tracing import current_trace_id
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces/producer.jsonl')
+
+tracer = trace.get_tracer('mta.producer')
+
+def setup_tracing(service_name):
+    """Install the global tracer provider for the producer"""
+    tracing.setup_tracing(service_name, TRACE_FILE)
+
+def kafka_trace_headers():
+    """W3C trace context of the active span as Kafka message headers"""
+    carrier = {}
+    propagate.inject(carrier)
+    return [(key, value.encode('utf-8')) for key, value in carrier.items()]
+
+def record_span(name, start_ns, end_ns, attributes=None):
+    """Record a child span for a stage whose start and end were measured directly"""
+    span = tracer.start_span(name, start_time=start_ns, attributes=attributes)
+    span.end(end_time=end_ns)
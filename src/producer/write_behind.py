@@ -0,0 +1,159 @@
+"""
+Write-behind stage between the ingest cycles and MongoDB.
+
+Jobs submit their documents and return to fetching; background writers drain
+the queue, one bulk write per collection at a time and several collections in
+parallel. While a collection's write is in flight, newer submissions for it
+are coalesced into a single pending batch:
+
+- in snapshot collections (keyed on their idempotency key), a newer document
+  replaces the pending one with the same key, so a writer that falls behind
+  skips stale snapshots and only writes the latest state;
+- in history collections every document is kept, up to max_documents per
+  collection, beyond which the oldest pending documents are dropped.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import WRITE_BEHIND_PENDING, WRITE_BEHIND_DROPPED
+from tracing import current_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Queue MongoDB writes for background writers instead of writing inside the fetch cycle
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+
+# Collections written in parallel
+WRITE_BEHIND_WORKERS = int(os.getenv('WRITE_BEHIND_WORKERS', 4))
+
+# Longest wait at shutdown for the queued documents to be written (keep it
+# below the container's stop grace period)
+WRITE_BEHIND_SHUTDOWN_SECONDS = int(os.getenv('WRITE_BEHIND_SHUTDOWN_SECONDS', 20))
+
+# Pending documents kept per collection before the oldest are dropped
+WRITE_BEHIND_MAX_DOCUMENTS = int(os.getenv('WRITE_BEHIND_MAX_DOCUMENTS', 50000))
+
+class PendingWrite:
+    """Documents waiting to be written to one collection, newest last"""
+
+    def __init__(self, key_fields=None):
+        self.key_fields = key_fields
+        # Snapshot documents by key; unkeyed documents are appended to docs
+        self.by_key = OrderedDict()
+        self.docs = []
+
+    def __len__(self):
+        return len(self.by_key) + len(self.docs)
+
+    def add(self, docs):
+        """Add documents; returns how many pending ones they superseded"""
+        superseded = 0
+        for doc in docs:
+            key = tuple(doc.get(field) for field in self.key_fields) if self.key_fields else None
+            if key is None or None in key:
+                self.docs.append(doc)
+                continue
+            if self.by_key.pop(key, None) is not None:
+                superseded += 1
+            self.by_key[key] = doc
+        return superseded
+
+    def trim(self, max_documents):
+        """Drop the oldest documents beyond max_documents; returns how many were dropped"""
+        excess = len(self) - max_documents
+        if excess <= 0:
+            return 0
+        from_docs = min(excess, len(self.docs))
+        del self.docs[:from_docs]
+        for _ in range(excess - from_docs):
+            self.by_key.popitem(last=False)
+        return excess
+
+    def documents(self):
+        return list(self.by_key.values()) + self.docs
+
+class WriteBehindQueue:
+    """Bounded per-collection write queue drained by background writer threads"""
+
+    def __init__(self, write, snapshot_keys, workers=WRITE_BEHIND_WORKERS, max_documents=WRITE_BEHIND_MAX_DOCUMENTS):
+        # write(collection_name, docs) performs one bulk write
+        self.write = write
+        # Collection -> key fields, for collections whose newer documents replace older ones
+        self.snapshot_keys = snapshot_keys
+        self.workers = workers
+        self.max_documents = max_documents
+        self.pending = OrderedDict()
+        self.in_flight = set()
+        self.threads = []
+        self._condition = threading.Condition()
+
+    def start(self):
+        """Start the writer threads"""
+        for index in range(self.workers - len(self.threads)):
+            thread = threading.Thread(target=self.run, name=f"mongo-writer-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, collection_name, docs):
+        """Queue documents for collection_name; writes inline when no writer threads are running"""
+        if not docs:
+            return
+        # Copies tagged with the submitting cycle, so the caller can keep using its documents
+        cycle_id = current_trace_id()
+        docs = [dict(doc, cycle_id=cycle_id) for doc in docs]
+        if not self.threads:
+            self.write(collection_name, docs)
+            return
+
+        with self._condition:
+            pending = self.pending.get(collection_name)
+            if pending is None:
+                pending = self.pending[collection_name] = PendingWrite(self.snapshot_keys.get(collection_name))
+            superseded = pending.add(docs)
+            overflow = pending.trim(self.max_documents)
+            WRITE_BEHIND_PENDING.labels(collection=collection_name).set(len(pending))
+            self._condition.notify_all()
+        if superseded:
+            WRITE_BEHIND_DROPPED.labels(collection=collection_name, reason='superseded').inc(superseded)
+        if overflow:
+            WRITE_BEHIND_DROPPED.labels(collection=collection_name, reason='overflow').inc(overflow)
+            logger.warning(f"Write-behind queue full for {collection_name}, dropped {overflow} oldest documents")
+
+    def next_write(self):
+        """Wait for a collection with pending documents and no write in flight; take its batch"""
+        with self._condition:
+            while True:
+                collection_name = next((name for name in self.pending if name not in self.in_flight), None)
+                if collection_name is not None:
+                    break
+                self._condition.wait()
+            pending = self.pending.pop(collection_name)
+            self.in_flight.add(collection_name)
+            WRITE_BEHIND_PENDING.labels(collection=collection_name).set(0)
+            return collection_name, pending.documents()
+
+    def run(self):
+        while True:
+            collection_name, docs = self.next_write()
+            try:
+                self.write(collection_name, docs)
+            except Exception as e:
+                logger.error(f"Write-behind write to {collection_name} failed: {e}")
+            finally:
+                with self._condition:
+                    self.in_flight.discard(collection_name)
+                    self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every queued document has been written; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.pending or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True